@@ -1,25 +1,53 @@
-import tkinter as tk
-from tkinter import ttk, messagebox, filedialog, simpledialog
+try:
+    import tkinter as tk
+    from tkinter import ttk, messagebox, filedialog, simpledialog
+except ImportError: # Headless server: only the command-line jobs (see cli) are available
+    tk = ttk = messagebox = filedialog = simpledialog = None
 import sqlite3
 import os
+import csv
+import sys
 import datetime
-from openpyxl import Workbook
+import time
+import json
+import argparse
+import threading
+import atexit
+import queue
+import tracemalloc
+import random
+import shutil
+import tempfile
+import platform
+import statistics
+import io
+import http.client
+from collections import OrderedDict
+from bisect import bisect_left
+from itertools import groupby, islice, count
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote, unquote
+from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, Alignment
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 # --- FIX: Corrected typo 'plat_ypus' to 'platypus' ---
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.lib.fonts import addMapping
 # --- NEW: Import for date entry ---
 try:
     from tkcalendar import DateEntry
     CALENDAR_ENABLED = True
 except ImportError:
     CALENDAR_ENABLED = False
-    print("tkcalendar not found. Please install (pip install tkcalendar) for date pickers. Falling back to simple Entry widgets.")
+    if tk: print("tkcalendar not found. Please install (pip install tkcalendar) for date pickers. Falling back to simple Entry widgets.", file=sys.stderr)
 
 
 # ------------------- CONFIG -------------------
@@ -38,18 +66,74 @@ CARD = "#FFFFFF"
 TEXT = "#1F2937"
 ROW_ODD = "#FFFFFF"
 ROW_EVEN = "#F8FBFF"
+# --- Bill store: only the current month is kept in memory, older bills are fetched on demand ---
+BILL_HISTORY_CACHE_SIZE = 500   # Older bills kept in memory after being fetched
+HISTORY_SEARCH_LIMIT = 500      # Max older bills returned by a search
+SEARCH_DEBOUNCE_MS = 150        # Wait this long after the last keystroke before filtering
+TREE_ROW_HEIGHT = 26            # Must match the Treeview rowheight style
+VIRTUAL_BUFFER_ROWS = 5         # Extra rows materialized below the visible window
+# --- Excel export ---
+EXCEL_MAX_ROWS = 1048576        # Rows per worksheet (Excel's limit); exports continue on a new sheet
+EXCEL_WIDTH_SAMPLE_ROWS = 200   # Rows buffered per sheet to size its columns before streaming
+# --- Background jobs ---
+JOB_WORKERS = 2                 # Exports / PDFs running at once
+JOB_POLL_MS = 100               # How often the Tk thread applies job progress and results
+# --- Batch invoices ---
+INVOICE_BATCH_WORKERS = None    # Processes for one-file-per-bill batches (None = CPU count)
+INVOICE_BATCH_CHUNK = 8         # Invoices handed to a worker process at a time
+# --- Bulk import ---
+IMPORT_CHUNK_ROWS = 5000        # Rows written per transaction
+# --- DB connection tuning ---
+DB_CACHE_SIZE_KB = 64000        # Page cache per connection (PRAGMA cache_size)
+DB_STATEMENT_CACHE_SIZE = 256   # Prepared statements kept per connection
+DB_BUSY_TIMEOUT = 10            # Seconds to wait on a lock held by another writer
+# --- Local POS service ---
+POS_HOST = "127.0.0.1"          # Listen on this machine only unless told otherwise
+POS_PORT = 8765
+POS_MAX_BODY = 1_000_000        # Largest accepted request body, in bytes
+# --- Change detection (other instances / scripts writing the same database) ---
+CHANGE_POLL_MS = 1000           # How often the app checks PRAGMA data_version
+CHANGE_LOG_KEEP = 50_000        # change_log rows kept; older ones are pruned
+# --- Stock ledger ---
+STOCK_SNAPSHOT_DAYS = 30        # Days between per-product stock snapshots
+# --- Yearly archives ---
+FINANCIAL_YEAR_START_MONTH = 4  # April: the financial year runs April..March
+ARCHIVE_MAX_ATTACHED = 8        # Archive files attached per connection at once (SQLite allows 10 by default)
+
+BACKUP_DIR = "backups"          # Folder next to the database, one sub-folder per backup
+BACKUP_KEEP = 7                 # Finished backups kept; older ones are removed after each backup
+BACKUP_INTERVAL_HOURS = 24      # The app starts a backup once the newest one is this old (0 = never)
+BACKUP_CHECK_MS = 15 * 60_000   # How often the app checks whether a backup is due
+BACKUP_PAGES_PER_STEP = 256     # Pages copied per backup step (1 MB at the default 4 KB page size)
+BACKUP_STEP_SLEEP = 0.005       # Seconds between steps, so the counter's writes get the disk
 
 # ------------------- GLOBAL DATA (IN-MEMORY CACHE) -------------------
-bills = []
-inventory = {} # Format: {"item_name_lowercase": {"name": "Item Name", "stock": 10, "cost_price": 0, ...}}
+# Recent window only (see bill_window_start), keyed by bill id. Dicts keep insertion order and ids
+# only grow, so iterating bills.values() gives the bills in id order with O(1) lookup/edit/delete.
+# Older bills live in bill_history_cache / SQLite.
+bills = {}
+bill_history_cache = OrderedDict() # LRU of older bills fetched on demand: {bill_id: bill}
+inventory = {} # Format: {"item_name_lowercase": InventoryItem(name="Item Name", stock=10, cost_price=0, ...)}
 business_profile = {"name": "Your Business", "address": "123 Main St", "phone": "555-1234", "gstin": ""}
-sale_count = 0
-purchase_count = 0
 current_items = [] # Temp list for bill form
+# Search index over the in-memory bills (see index_bill / filter_bill_ids)
+bill_search_text = {}  # {bill_id: "bill_no\x00customer\x00item names..." lowercased}
+bill_trigrams = {}     # {trigram: set(bill_id)}
+last_bill_search = {"text": None, "type": None, "ids": None}  # Previous result, narrowed when the query grows
+# Running dashboard totals, kept in step by add/edit/delete_bill_db (see track_bill_totals)
+billing_totals = {"day": None, "Sale": 0, "Purchase": 0, "today_sales": 0, "month_sales": 0}
+# Background jobs: workers post (job, kind, payload) to job_events; only the Tk thread reads it
+job_events = queue.Queue()
+active_jobs = {} # {job_id: Job}, touched only on the Tk thread
+job_pool = None  # ThreadPoolExecutor, created on first use
+job_ids = count(1)
+# Change detection: data_version last seen on this thread's connection and the last change_log seq applied
+db_watch = {"data_version": None, "seq": 0}
 
 # --- UI GLOBALS ---
 root = None
 status_lbl = None
+cancel_jobs_btn = None
 tree = None
 items_tree = None
 inventory_tree = None
@@ -65,22 +149,143 @@ lbl_today_sales, lbl_month_sales = (None,) * 2
 items_count_lbl = None
 type_var = None
 frames = {} # For navigation
+# Virtual bills table: only rows[offset : offset + visible + buffer] exist in the Treeview
+bill_table = {"rows": [], "offset": 0, "selected": None, "vsb": None, "visible": 0, "match": "", # match: lowercased search text
+              "history_job": None} # The older-bill search whose results the rows still wait for
+# What the inventory Treeview currently shows, so changes can be applied as targeted row updates
+inventory_view = {"built": False, "low_stock_only": False, "order": [], "rows": {}} # order: sorted [(name, key)]
+
+# ------------------- IN-MEMORY RECORDS -------------------
+# Bills, bill items and products are cached as __slots__ records instead of dicts: no per-row
+# dict, and repeated strings (item names, customers, dates, type/mode) are interned so every
+# row shares one copy. They still behave like the dicts they replace (rec["name"],
+# rec.get("qty", 0), dict(rec), rec.update(...)), so the UI code reads them unchanged.
+class Record:
+    __slots__ = ()
+    _interned = ()   # Text fields worth sharing between rows
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            value = fields.get(name)
+            if name in self._interned and isinstance(value, str):
+                value = sys.intern(value)
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_row(cls, row):
+        """Builds a record from a sqlite3.Row (or any mapping)."""
+        return cls(**{k: row[k] for k in row.keys() if k in cls.__slots__})
+
+    def __getitem__(self, key):
+        try: return getattr(self, key)
+        except AttributeError: raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__: raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key): return key in self.__slots__
+    def __iter__(self): return iter(self.__slots__)
+    def __len__(self): return len(self.__slots__)
+    def __repr__(self): return f"{type(self).__name__}({dict(self)!r})"
+    def keys(self): return self.__slots__
+    def get(self, key, default=None):
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def update(self, other):
+        """Copies known fields from a mapping; unknown keys are ignored."""
+        for key, value in other.items():
+            if key in self.__slots__: self[key] = value
+
+class BillItem(Record):
+    __slots__ = ("id", "bill_id", "name", "qty", "price", "total", "cost_price")
+    _interned = ("name",)
+
+class Bill(Record):
+    __slots__ = ("id", "bill_no", "type", "customer", "mode", "grand_total", "date", "items")
+    _interned = ("type", "customer", "mode", "date")
+
+    def __init__(self, **fields):
+        super().__init__(**fields)
+        self.items = [it if isinstance(it, BillItem) else BillItem(**it) for it in (self.items or [])]
+        for it in self.items:
+            if it.bill_id is None: it.bill_id = self.id
+
+class InventoryItem(Record):
+    __slots__ = ("name_key", "name", "stock", "cost_price", "sale_price", "category", "reorder_level")
+    _interned = ("category",)
 
 # ----------------------------------------------------------------------
 # ------------------- PART 1: DATABASE LOGIC (sqlite3) -----------------
 # ----------------------------------------------------------------------
 
+# --- DB: Connection manager ---
+# One long-lived, tuned connection per thread. Callers must NOT close it;
+# it is closed by db_close() (registered with atexit for the main thread).
+_db_local = threading.local()
+
 def db_connect():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DATABASE_FILE)
+    """Returns this thread's long-lived connection, opening and tuning it on first use."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None and _db_local.path == DATABASE_FILE and _db_local.pid == os.getpid():
+        return conn
+    if conn is not None and _db_local.pid == os.getpid():
+        db_close() # A connection inherited through fork is just dropped, never reused
+    conn = sqlite3.connect(DATABASE_FILE, timeout=DB_BUSY_TIMEOUT, cached_statements=DB_STATEMENT_CACHE_SIZE)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")          # Readers never block the writer
+    conn.execute("PRAGMA synchronous=NORMAL")        # WAL: no fsync per commit, only at checkpoints
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA foreign_keys=ON")           # Enforce ON DELETE CASCADE for bill_items
+    _db_local.conn, _db_local.path, _db_local.pid = conn, DATABASE_FILE, os.getpid()
+    _db_local.attached = OrderedDict() # {schema: archive file}, least recently used first
     return conn
 
+def db_close():
+    """Closes this thread's connection, if one is open."""
+    conn = getattr(_db_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _db_local.conn = None
+
+atexit.register(db_close)
+
 def init_db():
-    """Creates/updates the necessary tables."""
+    """Brings the schema up to date by applying pending numbered migrations.
+
+    The applied version is stored in PRAGMA user_version, so an up-to-date
+    database skips all DDL on startup. Stock snapshots that fell due are taken here too.
+    """
     conn = db_connect()
-    cursor = conn.cursor()
-    
+    if conn.execute("PRAGMA user_version").fetchone()[0] < len(MIGRATIONS):
+        for number, migration in enumerate(MIGRATIONS):
+            conn.execute("BEGIN IMMEDIATE") # Another instance may be migrating at the same time
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] > number:
+                    conn.rollback(); continue
+                migration(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {number + 1}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    if snapshot_stock_if_due(conn.cursor()):
+        conn.commit()
+
+def execute_sql_script(cursor, script):
+    """Runs a multi-statement script inside the current transaction (executescript would commit)."""
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            cursor.execute(statement)
+            statement = ""
+
+# --- DB: Migrations (index + 1 == user_version after it is applied) ---
+def migrate_base_schema(cursor):
+    """Version 1: the original tables, plus the columns older databases may be missing."""
     # Business Profile
     cursor.execute("""
     CREATE TABLE IF NOT EXISTS business_profile (
@@ -145,51 +350,1057 @@ def init_db():
     add_column_if_not_exists("bill_items", "cost_price", "REAL NOT NULL DEFAULT 0")
     
     cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bill_type ON bills (bill_no, type)")
-    
+
+def migrate_add_indexes(cursor):
+    """Version 2: indexes for the per-bill item fetch, date-range reports and customer lookups."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bill_items_bill_id ON bill_items (bill_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bill_items_name ON bill_items (name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bills_date ON bills (date, type)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bills_customer ON bills (customer)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bills_customer_lower ON bills (lower(customer))")
+
+def migrate_daily_item_sales(cursor):
+    """Version 3: the daily_item_sales rollup, its triggers and a one-time backfill."""
+    execute_sql_script(cursor, DAILY_ITEM_SALES_SQL)
+    backfill_daily_item_sales(cursor)
+
+def migrate_bill_sequences(cursor):
+    """Version 4: bill_sequences, the last bill number handed out per bill type."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS bill_sequences (
+        type TEXT PRIMARY KEY,
+        last_no INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    sync_bill_sequences(cursor)
+
+def migrate_change_log(cursor):
+    """Version 5: change_log and the triggers that record every bill, product and profile change."""
+    execute_sql_script(cursor, CHANGE_LOG_SQL)
+
+def migrate_stock_ledger(cursor):
+    """Version 6: stock_movements / stock_snapshots, backfilled from the bills and the current stock."""
+    execute_sql_script(cursor, STOCK_LEDGER_SQL)
+    backfill_stock_movements(cursor)
+
+def migrate_bill_archives(cursor):
+    """Version 7: bill_archives, the registry of financial years moved out to their own files."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS bill_archives (
+        fy TEXT PRIMARY KEY,
+        start_day TEXT NOT NULL,
+        end_day TEXT NOT NULL,
+        file TEXT NOT NULL,
+        min_id INTEGER,
+        max_id INTEGER,
+        bills INTEGER NOT NULL DEFAULT 0,
+        items INTEGER NOT NULL DEFAULT 0,
+        sale_total REAL NOT NULL DEFAULT 0,
+        purchase_total REAL NOT NULL DEFAULT 0,
+        archived_at TEXT NOT NULL
+    )
+    """)
+
+def migrate_search_index(cursor):
+    """Version 8: FTS5 search over bills and products, filled from the existing rows (skipped when
+    this SQLite build has no FTS5 or no trigram tokenizer; searches then keep using LIKE scans)."""
+    if not fts5_available(cursor): return
+    execute_sql_script(cursor, SEARCH_INDEX_SQL)
+    build_bill_search(cursor)
+    build_product_search(cursor)
+
+MIGRATIONS = [
+    migrate_base_schema,
+    migrate_add_indexes,
+    migrate_daily_item_sales,
+    migrate_bill_sequences,
+    migrate_change_log,
+    migrate_stock_ledger,
+    migrate_bill_archives,
+    migrate_search_index,
+]
+
+# Sales only, one row per (day, item name). Triggers keep it in step with bills/bill_items:
+# - item inserts/deletes/updates add or subtract their line when the bill is a Sale
+# - a bill delete subtracts its items first (during ON DELETE CASCADE the bill row is already gone)
+# - changing a bill's type or date moves its items between days / in or out of the rollup
+DAILY_ITEM_SALES_SQL = """
+CREATE TABLE IF NOT EXISTS daily_item_sales (
+    day TEXT NOT NULL,
+    name TEXT NOT NULL,
+    units INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    cost REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, name)
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_dis_item_insert AFTER INSERT ON bill_items
+BEGIN
+    INSERT INTO daily_item_sales (day, name, units, revenue, cost)
+    SELECT date, NEW.name, NEW.qty, NEW.total, NEW.cost_price * NEW.qty
+    FROM bills WHERE id = NEW.bill_id AND type = 'Sale'
+    ON CONFLICT(day, name) DO UPDATE SET
+        units = units + excluded.units, revenue = revenue + excluded.revenue, cost = cost + excluded.cost;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_dis_item_delete AFTER DELETE ON bill_items
+BEGIN
+    UPDATE daily_item_sales SET
+        units = units - OLD.qty, revenue = revenue - OLD.total, cost = cost - OLD.cost_price * OLD.qty
+    WHERE name = OLD.name AND day = (SELECT date FROM bills WHERE id = OLD.bill_id AND type = 'Sale');
+    DELETE FROM daily_item_sales WHERE name = OLD.name AND units = 0
+        AND day = (SELECT date FROM bills WHERE id = OLD.bill_id AND type = 'Sale');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_dis_item_update AFTER UPDATE OF bill_id, name, qty, total, cost_price ON bill_items
+BEGIN
+    UPDATE daily_item_sales SET
+        units = units - OLD.qty, revenue = revenue - OLD.total, cost = cost - OLD.cost_price * OLD.qty
+    WHERE name = OLD.name AND day = (SELECT date FROM bills WHERE id = OLD.bill_id AND type = 'Sale');
+    INSERT INTO daily_item_sales (day, name, units, revenue, cost)
+    SELECT date, NEW.name, NEW.qty, NEW.total, NEW.cost_price * NEW.qty
+    FROM bills WHERE id = NEW.bill_id AND type = 'Sale'
+    ON CONFLICT(day, name) DO UPDATE SET
+        units = units + excluded.units, revenue = revenue + excluded.revenue, cost = cost + excluded.cost;
+    DELETE FROM daily_item_sales WHERE name = OLD.name AND units = 0
+        AND day = (SELECT date FROM bills WHERE id = OLD.bill_id AND type = 'Sale');
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_dis_bill_delete BEFORE DELETE ON bills WHEN OLD.type = 'Sale'
+BEGIN
+    UPDATE daily_item_sales SET
+        units = units - (SELECT SUM(qty) FROM bill_items WHERE bill_id = OLD.id AND name = daily_item_sales.name),
+        revenue = revenue - (SELECT SUM(total) FROM bill_items WHERE bill_id = OLD.id AND name = daily_item_sales.name),
+        cost = cost - (SELECT SUM(cost_price * qty) FROM bill_items WHERE bill_id = OLD.id AND name = daily_item_sales.name)
+    WHERE day = OLD.date AND name IN (SELECT name FROM bill_items WHERE bill_id = OLD.id);
+    DELETE FROM daily_item_sales WHERE day = OLD.date AND units = 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_dis_bill_update AFTER UPDATE OF type, date ON bills
+WHEN OLD.type IS NOT NEW.type OR OLD.date IS NOT NEW.date
+BEGIN
+    UPDATE daily_item_sales SET
+        units = units - (SELECT SUM(qty) FROM bill_items WHERE bill_id = OLD.id AND name = daily_item_sales.name),
+        revenue = revenue - (SELECT SUM(total) FROM bill_items WHERE bill_id = OLD.id AND name = daily_item_sales.name),
+        cost = cost - (SELECT SUM(cost_price * qty) FROM bill_items WHERE bill_id = OLD.id AND name = daily_item_sales.name)
+    WHERE OLD.type = 'Sale' AND day = OLD.date AND name IN (SELECT name FROM bill_items WHERE bill_id = OLD.id);
+    DELETE FROM daily_item_sales WHERE OLD.type = 'Sale' AND day = OLD.date AND units = 0;
+    INSERT INTO daily_item_sales (day, name, units, revenue, cost)
+    SELECT NEW.date, name, SUM(qty), SUM(total), SUM(cost_price * qty)
+    FROM bill_items WHERE bill_id = NEW.id AND NEW.type = 'Sale' GROUP BY name
+    ON CONFLICT(day, name) DO UPDATE SET
+        units = units + excluded.units, revenue = revenue + excluded.revenue, cost = cost + excluded.cost;
+END;
+"""
+
+def rebuild_daily_item_sales():
+    """Rebuilds (repairs) the daily_item_sales rollup from bills/bill_items, archived years included."""
+    conn = db_connect()
+    archived = []
+    for archive in conn.execute("SELECT * FROM bill_archives ORDER BY start_day").fetchall():
+        archived += map(tuple, conn.execute(DAILY_ITEM_SALES_SELECT.format(schema=attach_archive(archive))))
+    backfill_daily_item_sales(conn.cursor(), archived) # ATTACH is not allowed once the transaction starts
     conn.commit()
-    conn.close()
+    return conn.execute("SELECT COUNT(*) FROM daily_item_sales").fetchone()[0]
+
+DAILY_ITEM_SALES_SELECT = """
+SELECT b.date, i.name, SUM(i.qty), SUM(i.total), SUM(i.cost_price * i.qty)
+FROM {schema}.bill_items i JOIN {schema}.bills b ON b.id = i.bill_id
+WHERE b.type = 'Sale'
+GROUP BY b.date, i.name
+HAVING SUM(i.qty) != 0
+"""
+
+def backfill_daily_item_sales(cursor, archived=()):
+    """Refills daily_item_sales inside the caller's transaction from main's bills plus `archived`,
+    the (day, name, units, revenue, cost) rows of the archive files. Bills back-dated into an
+    archived year are merged into that year's rows."""
+    cursor.execute("DELETE FROM daily_item_sales")
+    cursor.execute("INSERT INTO daily_item_sales (day, name, units, revenue, cost)" + DAILY_ITEM_SALES_SELECT.format(schema="main"))
+    cursor.executemany("""
+    INSERT INTO daily_item_sales (day, name, units, revenue, cost) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(day, name) DO UPDATE SET units = units + excluded.units, revenue = revenue + excluded.revenue,
+        cost = cost + excluded.cost
+    """, archived)
+
+# One row per changed bill / product / profile key, written in the same transaction as the change, so
+# any instance can tell which rows to reload (see sync_db_changes). Item changes always come with a
+# change to their bill row. op is I(nsert), U(pdate) or D(elete).
+CHANGE_LOG_SQL = """
+CREATE TABLE IF NOT EXISTS change_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    tbl TEXT NOT NULL,
+    row_key TEXT NOT NULL,
+    op TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS change_log_bills_insert AFTER INSERT ON bills BEGIN
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('bills', NEW.id, 'I');
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_bills_update AFTER UPDATE ON bills BEGIN
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('bills', NEW.id, 'U');
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_bills_delete AFTER DELETE ON bills BEGIN
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('bills', OLD.id, 'D');
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_inventory_insert AFTER INSERT ON inventory BEGIN
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('inventory', NEW.name_key, 'I');
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_inventory_update AFTER UPDATE ON inventory BEGIN
+    INSERT INTO change_log (tbl, row_key, op) SELECT 'inventory', OLD.name_key, 'D' WHERE OLD.name_key != NEW.name_key;
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('inventory', NEW.name_key, 'U');
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_inventory_delete AFTER DELETE ON inventory BEGIN
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('inventory', OLD.name_key, 'D');
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_profile_insert AFTER INSERT ON business_profile BEGIN
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('business_profile', NEW.key, 'I');
+END;
+CREATE TRIGGER IF NOT EXISTS change_log_profile_update AFTER UPDATE ON business_profile BEGIN
+    INSERT INTO change_log (tbl, row_key, op) VALUES ('business_profile', NEW.key, 'U');
+END;
+"""
+
+# Full-text search (FTS5, trigram tokenizer: any 3+ character substring, case-insensitive, so it
+# finds what the in-memory bill index finds, word prefixes included). bill_search has one row per
+# bill (rowid = bills.id) with the bill no, customer, every item name (newline-separated, so a
+# match never spans two items) and the type, so a type filter is part of the MATCH; the item
+# triggers re-read the bill's item names. product_search holds each product's name and category,
+# keyed by name_key (inventory has no stable rowid: VACUUM may renumber it); with ~5k products the
+# name_key lookups in the update/delete triggers scan the table, which is fast enough.
+SEARCH_INDEX_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS bill_search USING fts5(bill_no, customer, items, type, tokenize = 'trigram');
+CREATE TRIGGER IF NOT EXISTS bill_search_bills_insert AFTER INSERT ON bills BEGIN
+    INSERT INTO bill_search (rowid, bill_no, customer, items, type) VALUES (NEW.id, NEW.bill_no, NEW.customer, '', NEW.type);
+END;
+CREATE TRIGGER IF NOT EXISTS bill_search_bills_update AFTER UPDATE OF bill_no, customer, type ON bills BEGIN
+    UPDATE bill_search SET bill_no = NEW.bill_no, customer = NEW.customer, type = NEW.type WHERE rowid = NEW.id;
+END;
+CREATE TRIGGER IF NOT EXISTS bill_search_bills_delete AFTER DELETE ON bills BEGIN
+    DELETE FROM bill_search WHERE rowid = OLD.id;
+END;
+CREATE TRIGGER IF NOT EXISTS bill_search_items_insert AFTER INSERT ON bill_items BEGIN
+    UPDATE bill_search SET items = (SELECT group_concat(name, char(10)) FROM bill_items WHERE bill_id = NEW.bill_id)
+    WHERE rowid = NEW.bill_id;
+END;
+CREATE TRIGGER IF NOT EXISTS bill_search_items_update AFTER UPDATE OF name, bill_id ON bill_items BEGIN
+    UPDATE bill_search SET items = (SELECT group_concat(name, char(10)) FROM bill_items WHERE bill_id = bill_search.rowid)
+    WHERE rowid IN (OLD.bill_id, NEW.bill_id);
+END;
+CREATE TRIGGER IF NOT EXISTS bill_search_items_delete AFTER DELETE ON bill_items BEGIN
+    UPDATE bill_search SET items = (SELECT group_concat(name, char(10)) FROM bill_items WHERE bill_id = OLD.bill_id)
+    WHERE rowid = OLD.bill_id;
+END;
+CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(name_key UNINDEXED, name, category, tokenize = 'trigram');
+CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON inventory BEGIN
+    INSERT INTO product_search (name_key, name, category) VALUES (NEW.name_key, NEW.name, NEW.category);
+END;
+CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name_key, name, category ON inventory BEGIN
+    UPDATE product_search SET name_key = NEW.name_key, name = NEW.name, category = NEW.category WHERE name_key = OLD.name_key;
+END;
+CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON inventory BEGIN
+    DELETE FROM product_search WHERE name_key = OLD.name_key;
+END;
+"""
+
+# Every stock change is appended to stock_movements in the transaction that changes inventory.stock,
+# dated the day it is posted, so for each product SUM(qty) == inventory.stock. stock_snapshots holds
+# end-of-day stock every STOCK_SNAPSHOT_DAYS (zero stock is left out); see stock_on_date.
+STOCK_LEDGER_SQL = """
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name_key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    bill_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_key_day ON stock_movements (name_key, day);
+CREATE INDEX IF NOT EXISTS idx_stock_movements_day ON stock_movements (day);
+CREATE TABLE IF NOT EXISTS stock_snapshots (
+    day TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    stock INTEGER NOT NULL,
+    PRIMARY KEY (day, name_key)
+) WITHOUT ROWID;
+"""
     
 def load_data():
     """Loads all data from SQLite into the global in-memory variables."""
-    global bills, inventory, business_profile, sale_count, purchase_count
+    global bills, inventory, business_profile
     
     conn = db_connect()
     cursor = conn.cursor()
     
     # 1. Load Business Profile
-    cursor.execute("SELECT key, value FROM business_profile")
+    load_business_profile()
+            
+    # 2. Load Inventory
+    load_inventory()
+        
+    # 3. Load the recent window of Bills and Bill Items (two ordered scans, no per-bill queries)
+    window, load_stats = load_bills_bulk(cursor, "WHERE date >= ?", (bill_window_start(),))
+    bills = {b['id']: b for b in window}
+    rebuild_bill_search_index()
+    bill_history_cache.clear()
+    reset_billing_totals()
+    mark_changes_seen()
+
+    # 4. Update summaries after loading (bill numbers come from bill_sequences, see next_bill_no)
+    if root: update_all_summaries()
+    return load_stats
+
+def load_business_profile():
+    cursor = db_connect().execute("SELECT key, value FROM business_profile")
     for row in cursor.fetchall():
         if row['key'] in business_profile:
             business_profile[row['key']] = row['value']
-            
-    # 2. Load Inventory
+
+def load_inventory():
+    global inventory
     inventory = {}
-    cursor.execute("SELECT * FROM inventory")
-    for row in cursor.fetchall():
-        inventory[row['name_key']] = dict(row)
-        
-    # 3. Load Bills and Bill Items
-    bills = []
-    cursor.execute("SELECT * FROM bills ORDER BY id")
-    all_bills_raw = cursor.fetchall()
-    
-    for bill_row in all_bills_raw:
-        bill = dict(bill_row)
-        bill['items'] = []
-        cursor.execute("SELECT * FROM bill_items WHERE bill_id = ?", (bill['id'],))
-        items_raw = cursor.fetchall()
-        for item_row in items_raw:
-            bill['items'].append(dict(item_row))
-        bills.append(bill)
-
-    # 4. Calculate counts
-    sale_count = max((b["bill_no"] for b in bills if b["type"] == "Sale"), default=0)
-    purchase_count = max((b["bill_no"] for b in bills if b["type"] == "Purchase"), default=0)
-    
-    conn.close()
-    
-    # 5. Update summaries after loading
-    update_all_summaries()
+    for row in db_connect().execute("SELECT * FROM inventory").fetchall():
+        inventory[row['name_key']] = InventoryItem.from_row(row)
+
+def load_bills_bulk(cursor, where="", params=()):
+    """Loads bills (optionally filtered by a WHERE clause on bills) with their items
+    in two ordered scans and a single merge pass.
+
+    Returns (bills, stats) where stats holds the rows loaded and the elapsed time.
+    """
+    return load_bills_bulk_from(cursor, "main", where, params)
+
+def load_bills_bulk_from(cursor, schema, where="", params=()):
+    """load_bills_bulk for the bills in `schema` (main or an attached archive); the WHERE clause
+    names that schema's tables as {schema}.bills / {schema}.bill_items."""
+    start = time.perf_counter()
+    where = where.format(schema=schema)
+    cursor.execute(f"SELECT * FROM {schema}.bills {where} ORDER BY id", params)
+    loaded = []
+    for bill_row in cursor.fetchall():
+        bill = Bill.from_row(bill_row)
+        loaded.append(bill)
+
+    # Both scans are ordered by bill id, so items can be attached while walking the bills once.
+    # Items whose bill no longer exists are skipped.
+    item_count = 0
+    bill_iter = iter(loaded)
+    current = next(bill_iter, None)
+    if where:
+        cursor.execute(f"""
+        SELECT * FROM {schema}.bill_items WHERE bill_id IN (SELECT id FROM {schema}.bills {where})
+        ORDER BY bill_id, id
+        """, params)
+    else:
+        cursor.execute(f"SELECT * FROM {schema}.bill_items ORDER BY bill_id, id")
+    for item_row in cursor:
+        bill_id = item_row['bill_id']
+        while current is not None and current['id'] < bill_id:
+            current = next(bill_iter, None)
+        if current is None:
+            break
+        if current['id'] == bill_id:
+            current.items.append(BillItem.from_row(item_row))
+            item_count += 1
+
+    stats = {"bills": len(loaded), "items": item_count, "seconds": time.perf_counter() - start}
+    return loaded, stats
+
+# --- DB: Change detection (reload only what other connections changed) ---
+def mark_changes_seen():
+    """Starts change tracking from the current state, e.g. right after a full load."""
+    conn = db_connect()
+    db_watch["data_version"] = conn.execute("PRAGMA data_version").fetchone()[0]
+    db_watch["seq"] = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+
+def fetch_rows_by_key(sql, keys, chunk=500):
+    """Runs `sql` (with one {} for the placeholders) for keys in chunks; yields the rows."""
+    keys = list(keys)
+    for start in range(0, len(keys), chunk):
+        part = keys[start:start + chunk]
+        yield from db_connect().execute(sql.format(",".join("?" * len(part))), part)
+
+def sync_bill_rows(first_ops):
+    """Reloads changed bills ({bill_id: first logged op}) into the window, index and running totals."""
+    ids, fresh = list(first_ops), {}
+    for start in range(0, len(ids), 500):
+        part = ids[start:start + 500]
+        for bill in fetch_bills_db(f"WHERE id IN ({','.join('?' * len(part))})", part):
+            fresh[bill['id']] = bill
+    window_start, last_id = bill_window_start(), next(reversed(bills), 0)
+    totals_stale = out_of_order = False
+    for bill_id, first_op in first_ops.items():
+        old, new = bills.get(bill_id), fresh.get(bill_id)
+        bill_history_cache.pop(bill_id, None)
+        if old is not None:
+            track_bill_totals(old, -1)
+        elif first_op != 'I':
+            totals_stale = True # An older bill we never held was edited or deleted
+        if new is not None and (old is not None or first_op == 'I'):
+            track_bill_totals(new, 1)
+        if new is not None and new['date'] >= window_start:
+            bills[bill_id] = new
+            index_bill(new)
+            out_of_order = out_of_order or (old is None and bill_id < last_id)
+        elif old is not None:
+            del bills[bill_id]
+            unindex_bill(bill_id)
+    if out_of_order: # Keep bills in id order
+        ordered = sorted(bills.items())
+        bills.clear(); bills.update(ordered)
+    if totals_stale:
+        reset_billing_totals()
+
+def sync_db_changes(reload_bills=True):
+    """Applies rows other connections committed since the last call to the in-memory caches.
+
+    Costs one PRAGMA data_version when nothing changed. Our own writes are in change_log too;
+    reloading them is harmless. Returns None, or {"bills": ids, "inventory": keys, "profile": bool,
+    "full": bool}; "full" means the log was pruned past our position and everything was reloaded.
+    """
+    conn = db_connect()
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if version == db_watch["data_version"]:
+        return None
+    db_watch["data_version"] = version
+    first_seq, last_seq = conn.execute("SELECT MIN(seq), MAX(seq) FROM change_log").fetchone()
+    if last_seq is None or last_seq <= db_watch["seq"]:
+        return None
+    changes = {"bills": set(), "inventory": set(), "profile": False, "full": first_seq > db_watch["seq"] + 1}
+    if changes["full"]:
+        load_business_profile(); load_inventory()
+        if reload_bills:
+            window, _ = load_bills_bulk(conn.cursor(), "WHERE date >= ?", (bill_window_start(),))
+            bills.clear(); bills.update((b['id'], b) for b in window)
+            rebuild_bill_search_index(); bill_history_cache.clear(); reset_billing_totals()
+        db_watch["seq"] = last_seq
+        return changes
+
+    bill_ops = {}
+    for tbl, row_key, op in conn.execute("SELECT tbl, row_key, op FROM change_log WHERE seq > ? AND seq <= ? ORDER BY seq",
+                                         (db_watch["seq"], last_seq)):
+        if tbl == "bills": bill_ops.setdefault(int(row_key), op)
+        elif tbl == "inventory": changes["inventory"].add(row_key)
+        else: changes["profile"] = True
+    if changes["inventory"]:
+        found = {row['name_key']: row for row in
+                 fetch_rows_by_key("SELECT * FROM inventory WHERE name_key IN ({})", changes["inventory"])}
+        for key in changes["inventory"]:
+            if key in found: inventory[key] = InventoryItem.from_row(found[key])
+            else: inventory.pop(key, None)
+    if changes["profile"]:
+        load_business_profile()
+    if reload_bills and bill_ops:
+        sync_bill_rows(bill_ops)
+        changes["bills"] = set(bill_ops)
+    db_watch["seq"] = last_seq
+    if last_seq - first_seq > 2 * CHANGE_LOG_KEEP:
+        try:
+            conn.execute("DELETE FROM change_log WHERE seq <= ?", (last_seq - CHANGE_LOG_KEEP,))
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback() # Busy: another instance will prune it
+    return changes
+
+# --- DB: Bill store (recent window in memory, history on demand) ---
+def bill_window_start():
+    """First date (YYYY-MM-DD) of the in-memory bill window: the current month."""
+    return datetime.date.today().strftime('%Y-%m-01')
+
+def fetch_bills_db(where, params=(), schema="main"):
+    """Fetches bills matching a WHERE clause straight from SQLite (not cached)."""
+    fetched, _ = load_bills_bulk_from(db_connect().cursor(), schema, where, params)
+    return fetched
+
+def remember_history_bill(bill):
+    """Keeps an older bill in the bounded LRU cache."""
+    bill_history_cache[bill['id']] = bill
+    bill_history_cache.move_to_end(bill['id'])
+    while len(bill_history_cache) > BILL_HISTORY_CACHE_SIZE:
+        bill_history_cache.popitem(last=False)
+
+def get_bill(bill_id):
+    """Returns a bill by id from the window, the history cache or the database."""
+    bill = bills.get(bill_id)
+    if bill:
+        return bill
+    if bill_id in bill_history_cache:
+        bill_history_cache.move_to_end(bill_id)
+        return bill_history_cache[bill_id]
+    fetched = fetch_bills_db("WHERE id = ?", (bill_id,))
+    for archive in ([] if fetched else archives_holding_id(bill_id)):
+        fetched = fetch_bills_db("WHERE id = ?", (bill_id,), attach_archive(archive))
+        if fetched: break
+    if not fetched:
+        return None
+    remember_history_bill(fetched[0])
+    return fetched[0]
+
+def search_bill_history(filter_text, filter_type="All", limit=HISTORY_SEARCH_LIMIT):
+    """Finds bills older than the window matching the filter (the newest `limit` matches, in id order).
+
+    Runs on a worker thread (see search_older_bills), so the found bills are not cached here.
+    """
+    return search_bills_db(filter_text, filter_type, limit, before_day=bill_window_start())
+
+# --- DB: Full-text search (bill_search / product_search, see SEARCH_INDEX_SQL) ---
+BILL_SEARCH_WHERE = """WHERE id IN (
+    SELECT b.id FROM {schema}.bill_search f JOIN {schema}.bills b ON b.id = f.rowid
+    WHERE f.bill_search MATCH ? AND b.date < ?
+    ORDER BY f.rowid DESC LIMIT ?)"""
+BILL_LIKE_WHERE = """WHERE id IN (
+    SELECT id FROM {schema}.bills
+    WHERE date < ? AND (? = 'All' OR type = ?)
+      AND (CAST(bill_no AS TEXT) LIKE ? OR lower(customer) LIKE ?
+           OR id IN (SELECT bill_id FROM {schema}.bill_items WHERE lower(name) LIKE ?))
+    ORDER BY id DESC LIMIT ?)"""
+
+def fts5_available(cursor):
+    """True when this SQLite build has FTS5 with the trigram tokenizer (SQLite 3.34+) the search tables use."""
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize = 'trigram')")
+    except sqlite3.OperationalError: # no such module: fts5 / no such tokenizer: trigram
+        return False
+    cursor.execute("DROP TABLE temp.fts5_probe")
+    return True
+
+def has_search_index(table="bill_search", schema="main"):
+    return db_connect().execute(f"SELECT 1 FROM {schema}.sqlite_master WHERE name = ?", (table,)).fetchone() is not None
+
+def fts_phrase(text):
+    """text as one FTS5 phrase: with the trigram tokenizer it matches wherever text occurs as a substring."""
+    return '"' + text.replace('"', '""') + '"'
+
+def bill_search_query(text, filter_type="All"):
+    """FTS5 query for bills with text in the bill no, customer or an item name, of one type unless 'All'."""
+    query = "{bill_no customer items} : " + fts_phrase(text)
+    if filter_type in ("Sale", "Purchase"):
+        query += " AND type : " + fts_phrase(filter_type)
+    return query
+
+def build_bill_search(cursor, schema="main"):
+    """Creates (if needed) and refills a schema's bill_search from its bills; returns the bills indexed."""
+    cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {schema}.bill_search "
+                   "USING fts5(bill_no, customer, items, type, tokenize = 'trigram')")
+    cursor.execute(f"DELETE FROM {schema}.bill_search")
+    cursor.execute(f"""
+    INSERT INTO {schema}.bill_search (rowid, bill_no, customer, items, type)
+    SELECT b.id, b.bill_no, b.customer, COALESCE(group_concat(i.name, char(10)), ''), b.type
+    FROM {schema}.bills b LEFT JOIN {schema}.bill_items i ON i.bill_id = b.id GROUP BY b.id
+    """)
+    indexed = cursor.rowcount
+    cursor.execute(f"INSERT INTO {schema}.bill_search (bill_search) VALUES ('optimize')") # One b-tree per term
+    return indexed
+
+def build_product_search(cursor):
+    """Refills product_search from inventory; returns the products indexed."""
+    cursor.execute("DELETE FROM product_search")
+    cursor.execute("INSERT INTO product_search (name_key, name, category) SELECT name_key, name, category FROM inventory")
+    return cursor.rowcount
+
+def rebuild_search_index():
+    """Recreates the search tables and triggers where missing and refills them, archives included
+    (e.g. after SQLite gained FTS5 / the trigram tokenizer). Returns the number of bills indexed."""
+    conn = db_connect()
+    cursor = conn.cursor()
+    if not fts5_available(cursor):
+        raise sqlite3.OperationalError("This SQLite build has no FTS5 trigram tokenizer (needs SQLite 3.34+); "
+                                       "searches use LIKE scans")
+    try:
+        # product_search is recreated, so a table left in an older layout takes the current one
+        for name in ("product_search_insert", "product_search_update", "product_search_delete"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute("DROP TABLE IF EXISTS product_search")
+        execute_sql_script(cursor, SEARCH_INDEX_SQL)
+        indexed = build_bill_search(cursor)
+        build_product_search(cursor)
+        conn.commit()
+        for archive in conn.execute("SELECT * FROM bill_archives ORDER BY start_day").fetchall():
+            indexed += build_bill_search(cursor, attach_archive(archive)) # ATTACH needs no open transaction
+            conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    return indexed
+
+def search_bills_db(filter_text, filter_type="All", limit=HISTORY_SEARCH_LIMIT, before_day=None):
+    """The newest `limit` bills (returned in id order) dated before before_day whose bill no, customer or
+    any item contains filter_text, case-insensitively.
+
+    main is searched first, then the archives newest first while fewer than `limit` were found.
+    Texts of 3+ characters use a schema's bill_search index; shorter ones (or a schema without
+    the index) fall back to a LIKE scan.
+    """
+    text = filter_text.lower()
+    like = f"%{text}%"
+    found = []
+    for schema in reversed(list(bill_sources())): # main first, then the newest archive
+        if len(found) >= limit: break
+        if len(text) >= 3 and has_search_index("bill_search", schema):
+            where, params = BILL_SEARCH_WHERE, (bill_search_query(text, filter_type), before_day or "9999")
+        else:
+            where, params = BILL_LIKE_WHERE, (before_day or "9999", filter_type, filter_type, like, like, like)
+        found += fetch_bills_db(where, params + (limit - len(found),), schema)
+    return sorted(found, key=lambda bill: bill['id'])[-limit:]
+
+def search_products(filter_text, limit=50):
+    """Inventory rows (as dicts, by name) whose name or category contains filter_text, case-insensitively."""
+    text = filter_text.lower()
+    if len(text) >= 3 and has_search_index("product_search"):
+        rows = db_connect().execute("""
+        SELECT i.* FROM product_search f JOIN inventory i ON i.name_key = f.name_key
+        WHERE f.product_search MATCH ? ORDER BY i.name COLLATE NOCASE LIMIT ?
+        """, (fts_phrase(text), limit))
+    else:
+        rows = db_connect().execute("""
+        SELECT * FROM inventory WHERE lower(name) LIKE ? OR lower(category) LIKE ?
+        ORDER BY name COLLATE NOCASE LIMIT ?
+        """, (f"%{text}%", f"%{text}%", limit))
+    return [dict(row) for row in rows]
+
+def iter_bill_export_rows():
+    """Yields one Excel row per bill, archived years first, each streamed from a single bills/items cursor."""
+    def lines_by_bill():
+        for schema in bill_sources():
+            cursor = db_connect().execute(f"""
+            SELECT b.id, b.bill_no, b.date, b.type, b.customer, b.mode, b.grand_total, i.name, i.qty, i.price
+            FROM {schema}.bills b LEFT JOIN {schema}.bill_items i ON i.bill_id = b.id
+            ORDER BY b.id, i.id
+            """)
+            yield from groupby(cursor, key=lambda row: row["id"])
+    for idx, (_, lines) in enumerate(lines_by_bill(), start=1):
+        lines = list(lines)
+        b = lines[0]
+        items = [line for line in lines if line["name"] is not None]
+        yield [
+            idx, b["bill_no"], b["date"] or '', b["type"], b["customer"] or "",
+            "; ".join(f"{it['name']} x{it['qty']}" for it in items),
+            sum(it["qty"] or 0 for it in items),
+            "; ".join(format_currency(it['price']) for it in items),
+            b["mode"] or "", b["grand_total"] or 0
+        ]
+
+def count_bills_db():
+    """Bills in the database, archived years included."""
+    return db_connect().execute(
+        "SELECT (SELECT COUNT(*) FROM bills) + (SELECT COALESCE(SUM(bills), 0) FROM bill_archives)").fetchone()[0]
+
+def get_bill_totals(customer=None):
+    """Returns {"Sale": total, "Purchase": total} over the full history, optionally for one customer.
+
+    The overall totals of archived years come from their registry row; one customer's totals
+    are summed from every archive file.
+    """
+    conn = db_connect()
+    totals = {"Sale": 0, "Purchase": 0}
+    if customer is None:
+        rows = conn.execute("""
+        SELECT type, SUM(grand_total) FROM bills GROUP BY type
+        UNION ALL SELECT 'Sale', SUM(sale_total) FROM bill_archives
+        UNION ALL SELECT 'Purchase', SUM(purchase_total) FROM bill_archives
+        """).fetchall()
+    else:
+        rows = []
+        for schema in bill_sources():
+            rows += conn.execute(f"""
+            SELECT type, SUM(grand_total) FROM {schema}.bills WHERE lower(customer) = lower(?) GROUP BY type
+            """, (customer,)).fetchall()
+    for row in rows:
+        if row[0] in totals: totals[row[0]] += row[1] or 0
+    return totals
+
+# --- DB: Yearly archives (closed financial years in their own files, attached on demand) ---
+# Archiving moves a closed year's bills and items into <db name>_FY<year>.db next to the main database
+# and records it in bill_archives. The daily_item_sales rollup, the stock ledger and the totals stored
+# in bill_archives stay in the main file, so reports and dashboards never open an archive; queries
+# that need the bills themselves (ledger, exports, customer list, history lookups) attach only the
+# years their date range reaches, through bill_sources(). Archived bills are read-only.
+ARCHIVE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS {schema}.bills (
+    id INTEGER PRIMARY KEY,
+    bill_no INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    customer TEXT,
+    mode TEXT,
+    grand_total REAL NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS {schema}.bill_items (
+    id INTEGER PRIMARY KEY,
+    bill_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    price REAL NOT NULL,
+    total REAL NOT NULL,
+    cost_price REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS {schema}.idx_bill_items_bill_id ON bill_items (bill_id);
+CREATE INDEX IF NOT EXISTS {schema}.idx_bills_date ON bills (date, type);
+CREATE INDEX IF NOT EXISTS {schema}.idx_bills_customer_lower ON bills (lower(customer));
+"""
+
+def financial_year(day):
+    """Start year of the financial year a YYYY-MM-DD day falls in."""
+    d = datetime.date.fromisoformat(day)
+    return d.year if d.month >= FINANCIAL_YEAR_START_MONTH else d.year - 1
+
+def financial_year_range(start_year):
+    """(first day, last day, label) of the financial year starting in start_year, e.g. '2023-24'."""
+    first = datetime.date(start_year, FINANCIAL_YEAR_START_MONTH, 1)
+    last = datetime.date(start_year + (FINANCIAL_YEAR_START_MONTH > 1), FINANCIAL_YEAR_START_MONTH - 1 or 12, 1)
+    last = (last.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+    label = f"{start_year}-{(start_year + 1) % 100:02d}" if FINANCIAL_YEAR_START_MONTH > 1 else str(start_year)
+    return first.isoformat(), last.isoformat(), label
+
+def archive_file_path(file_name):
+    """Archive files live next to the main database (the registry stores only their name)."""
+    return os.path.join(os.path.dirname(os.path.abspath(DATABASE_FILE)), file_name)
+
+def attach_archive(archive):
+    """Attaches an archive (a bill_archives row) to this thread's connection if needed; returns its schema name."""
+    conn, attached = db_connect(), _db_local.attached
+    schema = "fy" + archive['start_day'][:4]
+    if schema in attached:
+        attached.move_to_end(schema)
+        return schema
+    if len(attached) >= ARCHIVE_MAX_ATTACHED:
+        conn.execute(f"DETACH DATABASE {attached.popitem(last=False)[0]}")
+    path = archive_file_path(archive['file'])
+    if not os.path.exists(path):
+        raise sqlite3.OperationalError(f"Archive file for {archive['fy']} is missing: {path}")
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+    attached[schema] = path
+    return schema
+
+def archives_in_range(start_day=None, end_day=None):
+    """bill_archives rows overlapping start_day..end_day (inclusive, None = open-ended), oldest first."""
+    return db_connect().execute("""
+    SELECT * FROM bill_archives WHERE end_day >= COALESCE(?, '') AND start_day <= COALESCE(?, '9999')
+    ORDER BY start_day
+    """, (start_day, end_day)).fetchall()
+
+def archives_holding_id(bill_id):
+    return db_connect().execute("SELECT * FROM bill_archives WHERE ? BETWEEN min_id AND max_id ORDER BY start_day",
+                                (bill_id,)).fetchall()
+
+def bill_sources(start_day=None, end_day=None):
+    """Schemas holding bills dated start_day..end_day: the archives the range reaches (attached
+    as they are needed, oldest first), then main. Current-year ranges touch main only."""
+    for archive in archives_in_range(start_day, end_day):
+        yield attach_archive(archive)
+    yield "main"
+
+def closed_financial_years():
+    """Start years of the financial years that ended before the current one and still have bills in main."""
+    current = financial_year(datetime.date.today().isoformat())
+    first_day = db_connect().execute("SELECT MIN(date) FROM bills").fetchone()[0]
+    if first_day is None: return []
+    return [year for year in range(financial_year(first_day), current)
+            if db_connect().execute("SELECT 1 FROM bills WHERE date BETWEEN ? AND ? LIMIT 1",
+                                    financial_year_range(year)[:2]).fetchone()]
+
+def archive_financial_year(start_year):
+    """Moves one closed financial year's bills into its archive file; returns its bill_archives row as a dict.
+
+    The bills are first copied and committed in the archive file, then deleted from main together
+    with the registry update, keeping that year's daily_item_sales rows. Interrupted runs (or bills
+    back-dated into an archived year) are picked up by running it again.
+    """
+    start_day, end_day, label = financial_year_range(start_year)
+    if end_day >= datetime.date.today().isoformat():
+        raise ValueError(f"Financial year {label} is not closed yet")
+    conn = db_connect()
+    registered = conn.execute("SELECT * FROM bill_archives WHERE fy = ?", (label,)).fetchone()
+    if not conn.execute("SELECT 1 FROM bills WHERE date BETWEEN ? AND ? LIMIT 1", (start_day, end_day)).fetchone():
+        return dict(registered) if registered else None # Nothing (left) to move
+    base = os.path.splitext(os.path.basename(DATABASE_FILE))[0]
+    file_name = registered['file'] if registered else f"{base}_FY{label}.db"
+    schema = "fy" + start_day[:4]
+    if _db_local.attached.pop(schema, None): # Drop a read-side attach; the move attaches it itself
+        conn.execute(f"DETACH DATABASE {schema}")
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (archive_file_path(file_name),))
+    try:
+        # 1. Copy into the archive file and commit there before anything leaves main
+        execute_sql_script(conn.cursor(), ARCHIVE_SCHEMA_SQL.format(schema=schema))
+        conn.execute(f"""
+        INSERT OR REPLACE INTO {schema}.bills (id, bill_no, type, customer, mode, grand_total, date)
+        SELECT id, bill_no, type, customer, mode, grand_total, date FROM main.bills WHERE date BETWEEN ? AND ?
+        """, (start_day, end_day))
+        conn.execute(f"""
+        INSERT OR REPLACE INTO {schema}.bill_items (id, bill_id, name, qty, price, total, cost_price)
+        SELECT i.id, i.bill_id, i.name, i.qty, i.price, i.total, i.cost_price
+        FROM main.bill_items i JOIN main.bills b ON b.id = i.bill_id WHERE b.date BETWEEN ? AND ?
+        """, (start_day, end_day))
+        if has_search_index("bill_search"):
+            build_bill_search(conn.cursor(), schema)
+        conn.commit()
+
+        # 2. Remove from main (the rollup triggers would empty those days: put the rows back) and register
+        kept = conn.execute("SELECT day, name, units, revenue, cost FROM daily_item_sales WHERE day BETWEEN ? AND ?",
+                            (start_day, end_day)).fetchall()
+        conn.execute("DELETE FROM main.bills WHERE date BETWEEN ? AND ?", (start_day, end_day)) # Items by CASCADE
+        conn.execute("DELETE FROM daily_item_sales WHERE day BETWEEN ? AND ?", (start_day, end_day))
+        conn.executemany("INSERT INTO daily_item_sales (day, name, units, revenue, cost) VALUES (?, ?, ?, ?, ?)", kept)
+        conn.execute(f"""
+        INSERT OR REPLACE INTO bill_archives
+            (fy, start_day, end_day, file, min_id, max_id, bills, items, sale_total, purchase_total, archived_at)
+        SELECT ?, ?, ?, ?, MIN(id), MAX(id), COUNT(*), (SELECT COUNT(*) FROM {schema}.bill_items),
+               COALESCE(SUM(CASE WHEN type = 'Sale' THEN grand_total END), 0),
+               COALESCE(SUM(CASE WHEN type = 'Purchase' THEN grand_total END), 0), ?
+        FROM {schema}.bills
+        """, (label, start_day, end_day, file_name, datetime.datetime.now().isoformat(timespec="seconds")))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"DETACH DATABASE {schema}")
+    return dict(conn.execute("SELECT * FROM bill_archives WHERE fy = ?", (label,)).fetchone())
+
+def registered_archive_files(db_path):
+    """Archive file names registered in the database at db_path (none for an older database)."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute("SELECT file FROM bill_archives ORDER BY start_day")]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+def archive_closed_years(progress=None):
+    """Archives every closed financial year still in main, oldest first; returns their registry rows."""
+    years, done = closed_financial_years(), []
+    for number, year in enumerate(years, start=1):
+        done.append(archive_financial_year(year))
+        if progress: progress(number, len(years))
+    return done
+
+# --- DB: Backups (online copies taken with the SQLite backup API while the app keeps writing) ---
+# A backup is a folder backups/<db name>_<YYYYmmdd-HHMMSS>[-N]/ (-2, -3, ... for further backups
+# within the same second) with a copy of the main database and of every archive file it registers. The copy is made a few pages per step with a pause in between.
+# The source connection holds one read transaction for the whole copy: under WAL that never blocks
+# the writers, and it stops SQLite from restarting the copy whenever another connection commits
+# between steps, so the backup is one consistent snapshot however busy the counter is.
+def backup_root():
+    return os.path.join(os.path.dirname(os.path.abspath(DATABASE_FILE)), BACKUP_DIR)
+
+def backup_taken(path):
+    """(time taken, N) for a finished backup folder of the current database, None for any other name."""
+    prefix = os.path.splitext(os.path.basename(DATABASE_FILE))[0] + "_"
+    name = os.path.basename(path)
+    if not name.startswith(prefix): return None
+    stamp, suffix = name[len(prefix):len(prefix) + len("YYYYmmdd-HHMMSS")], name[len(prefix) + len("YYYYmmdd-HHMMSS"):]
+    if suffix and not (suffix[0] == "-" and suffix[1:].isdigit()): return None # e.g. a .partial copy
+    try:
+        return datetime.datetime.strptime(stamp, '%Y%m%d-%H%M%S'), int(suffix[1:] or 1)
+    except ValueError:
+        return None
+
+def list_backups():
+    """Finished backup folders of the current database, oldest first."""
+    folder = backup_root()
+    if not os.path.isdir(folder): return []
+    found = [os.path.join(folder, name) for name in os.listdir(folder)]
+    return sorted((path for path in found if backup_taken(path) and os.path.isdir(path)), key=backup_taken)
+
+def backup_due():
+    """True when scheduled backups are on and the newest one is older than BACKUP_INTERVAL_HOURS."""
+    if not BACKUP_INTERVAL_HOURS: return False
+    backups = list_backups()
+    if not backups: return True
+    return datetime.datetime.now() - backup_taken(backups[-1])[0] >= datetime.timedelta(hours=BACKUP_INTERVAL_HOURS)
+
+def copy_database(source_path, target_path, pages=BACKUP_PAGES_PER_STEP, step_sleep=BACKUP_STEP_SLEEP, progress=None):
+    """Copies one SQLite database with the backup API, `pages` pages per step (-1 = all at once).
+
+    progress(pages_done, pages_total) is called after each step. The copy is left in rollback-journal
+    mode, so it is a single self-contained file. Returns {"pages", "steps"}.
+    """
+    source = sqlite3.connect(source_path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    target = sqlite3.connect(target_path)
+    stats = {"pages": 0, "steps": 0}
+    def step(status, remaining, total):
+        stats["pages"], stats["steps"] = total, stats["steps"] + 1
+        if progress: progress(total - remaining, total)
+        if remaining and step_sleep: time.sleep(step_sleep)
+    try:
+        source.execute("BEGIN")
+        source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone() # Opens the read snapshot the steps share
+        source.backup(target, pages=pages, progress=step)
+        source.execute("COMMIT")
+        target.execute("PRAGMA journal_mode=DELETE")
+    finally:
+        source.close(); target.close()
+    return stats
+
+def verify_backup(folder):
+    """Runs PRAGMA integrity_check on every database in a backup folder and checks that the archive
+    files each one registers are there. Returns the problems found (empty when the backup is sound)."""
+    problems = []
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(".db"): continue
+        path = os.path.join(folder, name)
+        try:
+            conn = sqlite3.connect(f"file:{quote(path)}?mode=ro", uri=True)
+            try:
+                result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            result = [str(e)]
+        problems += [f"{name}: {line}" for line in result if line != "ok"]
+        problems += [f"{name}: archive {archive} is missing" for archive in registered_archive_files(path)
+                     if not os.path.exists(os.path.join(folder, archive))]
+    return problems
+
+def rotate_backups(keep=BACKUP_KEEP):
+    """Removes all but the `keep` newest finished backups; returns the removed folders."""
+    old = list_backups()[:-keep] if keep > 0 else []
+    for folder in old:
+        shutil.rmtree(folder, ignore_errors=True)
+    return old
+
+def backup_database(pages=BACKUP_PAGES_PER_STEP, step_sleep=BACKUP_STEP_SLEEP, keep=BACKUP_KEEP, progress=None):
+    """Takes a backup of the database and its archive files, verifies it, then rotates old backups.
+
+    The copy is written to <folder>.partial and renamed once it passes the integrity check, so a
+    half-written or damaged copy never counts as a backup (a damaged one is left for inspection and
+    raises sqlite3.DatabaseError). Returns a result dict.
+    """
+    base = os.path.splitext(os.path.basename(DATABASE_FILE))[0]
+    now = datetime.datetime.now().replace(microsecond=0)
+    stamp = now.strftime('%Y%m%d-%H%M%S')
+    os.makedirs(backup_root(), exist_ok=True)
+    # A further backup within the same second gets -2, -3, ..., always after the newest (rotation may
+    # have removed the older ones, and a reused name would sort as the oldest backup)
+    first = 1 + max((n for taken, n in map(backup_taken, list_backups()) if taken == now), default=0)
+    for n in count(first):
+        folder = os.path.join(backup_root(), f"{base}_{stamp}" + (f"-{n}" if n > 1 else ""))
+        work = folder + ".partial"
+        if os.path.exists(folder): continue
+        try:
+            os.mkdir(work) # Fails if another backup took this name first
+            break
+        except FileExistsError:
+            continue
+    start = time.perf_counter()
+    try:
+        db_file = os.path.join(work, os.path.basename(DATABASE_FILE))
+        stats = copy_database(DATABASE_FILE, db_file, pages, step_sleep, progress)
+        for file_name in registered_archive_files(db_file): # The copy's own registry, so both always match
+            copy_database(archive_file_path(file_name), os.path.join(work, file_name), pages, step_sleep)
+    except BaseException:
+        shutil.rmtree(work, ignore_errors=True)
+        raise
+    copy_seconds = time.perf_counter() - start
+    problems = verify_backup(work)
+    if problems:
+        raise sqlite3.DatabaseError(f"Backup {os.path.basename(work)} failed its integrity check: " + "; ".join(problems[:3]))
+    os.rename(work, folder)
+    size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+    return {"folder": folder, "bytes": size, "pages": stats["pages"], "steps": stats["steps"],
+            "copy_seconds": copy_seconds, "verify_seconds": time.perf_counter() - start - copy_seconds,
+            "mb_per_second": size / 1e6 / copy_seconds if copy_seconds else 0,
+            "removed": rotate_backups(keep)}
+
+# --- Bill search index (trigrams over bill no, customer and every item name) ---
+def bill_search_key(bill):
+    """Lowercased searchable text; \x00 keeps matches from spanning two fields."""
+    return "\x00".join([str(bill["bill_no"]), bill.get("customer", "")] + [it["name"] for it in bill.get("items", [])]).lower()
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def index_bill(bill):
+    """Adds (or re-indexes) one in-memory bill."""
+    unindex_bill(bill['id'])
+    text = bill_search_key(bill)
+    bill_search_text[bill['id']] = text
+    for gram in trigrams(text):
+        bill_trigrams.setdefault(gram, set()).add(bill['id'])
+
+def unindex_bill(bill_id):
+    text = bill_search_text.pop(bill_id, None)
+    last_bill_search["text"] = None # Any cached result may now be stale
+    if text is None: return
+    for gram in trigrams(text):
+        posting = bill_trigrams.get(gram)
+        if posting is not None:
+            posting.discard(bill_id)
+            if not posting: del bill_trigrams[gram]
+
+def rebuild_bill_search_index():
+    bill_search_text.clear(); bill_trigrams.clear()
+    last_bill_search["text"] = None
+    for bill in bills.values():
+        index_bill(bill)
+
+def filter_bill_ids(filter_text="", filter_type="All"):
+    """Returns ids (in id order) of in-memory bills whose bill no, customer or any item contains filter_text.
+
+    Candidates come from the trigram postings; when the user extends the previous query,
+    the previous result is narrowed instead.
+    """
+    ft = filter_text.lower()
+    if not ft:
+        candidates = bills.keys()
+    elif (last_bill_search["text"] is not None and last_bill_search["type"] == filter_type
+            and last_bill_search["text"] in ft):
+        candidates = last_bill_search["ids"]
+    elif len(ft) >= 3:
+        postings = sorted((bill_trigrams.get(g, set()) for g in trigrams(ft)), key=len)
+        candidates = set.intersection(*postings) if postings else set()
+    else:
+        candidates = bills.keys()
+
+    ids = [bid for bid in candidates
+           if ft in bill_search_text[bid] and (filter_type not in ("Sale", "Purchase") or bills[bid]["type"] == filter_type)]
+    if not isinstance(candidates, type(bills.keys())):
+        ids.sort()
+    if ft:
+        last_bill_search.update(text=ft, type=filter_type, ids=ids)
+    return ids
+
+# --- DB: Incremental billing totals ---
+def recompute_billing_totals():
+    """Computes the billing dashboard totals from scratch with one scan of bills."""
+    today = datetime.date.today()
+    day, month_start = today.strftime('%Y-%m-%d'), today.strftime('%Y-%m-01')
+    row = db_connect().execute("""
+    SELECT
+        SUM(CASE WHEN type = 'Sale' THEN grand_total ELSE 0 END),
+        SUM(CASE WHEN type = 'Purchase' THEN grand_total ELSE 0 END),
+        SUM(CASE WHEN type = 'Sale' AND date = ? THEN grand_total ELSE 0 END),
+        SUM(CASE WHEN type = 'Sale' AND date BETWEEN ? AND ? THEN grand_total ELSE 0 END)
+    FROM bills
+    """, (day, month_start, day)).fetchone()
+    archived = db_connect().execute("SELECT SUM(sale_total), SUM(purchase_total) FROM bill_archives").fetchone()
+    return {"day": day, "Sale": (row[0] or 0) + (archived[0] or 0), "Purchase": (row[1] or 0) + (archived[1] or 0),
+            "today_sales": row[2] or 0, "month_sales": row[3] or 0}
+
+def reset_billing_totals():
+    billing_totals.update(recompute_billing_totals())
+
+def track_bill_totals(bill, sign=1):
+    """Adds (sign=1) or removes (sign=-1) a committed bill from the running totals."""
+    today = datetime.date.today().strftime('%Y-%m-%d')
+    if billing_totals["day"] != today:
+        reset_billing_totals() # Day (or month) rolled over, the DB already holds this change
+        return
+    amount = sign * (bill.get("grand_total") or 0)
+    if bill["type"] in ("Sale", "Purchase"):
+        billing_totals[bill["type"]] += amount
+    if bill["type"] == "Sale":
+        bill_date = bill.get("date") or today
+        if bill_date == today:
+            billing_totals["today_sales"] += amount
+        if today[:8] + "01" <= bill_date <= today:
+            billing_totals["month_sales"] += amount
+
+def verify_billing_totals(tolerance=0.005):
+    """Checks the running totals against a full recompute. Returns {key: (tracked, actual)} for mismatches."""
+    actual = recompute_billing_totals()
+    return {key: (billing_totals[key], actual[key]) for key in ("Sale", "Purchase", "today_sales", "month_sales")
+            if abs(billing_totals[key] - actual[key]) > tolerance}
 
 def save_business_profile_db():
     conn = db_connect()
@@ -197,48 +1408,176 @@ def save_business_profile_db():
     for key, value in business_profile.items():
         cursor.execute("INSERT OR REPLACE INTO business_profile (key, value) VALUES (?, ?)", (key, value))
     conn.commit()
-    conn.close()
 
-def update_stock_db(item_name, quantity_change):
+def update_stock_db(item_name, quantity_change, reason="adjustment"):
     """Updates stock in DB and in-memory. Creates item if not exists."""
-    global inventory
-    key = item_name.lower()
-    
-    if key not in inventory:
-        inventory[key] = {"name": item_name, "stock": 0, "cost_price": 0, "sale_price": 0, "category": None, "reorder_level": 5, "name_key": key}
-    
-    inventory[key]["stock"] += quantity_change
-    new_stock = inventory[key]["stock"]
-    
     conn = db_connect()
-    cursor = conn.cursor()
+    deltas = {item_name.lower(): [item_name, quantity_change]}
+    post_stock_deltas(conn.cursor(), deltas, reason)
+    conn.commit()
+    apply_stock_deltas(deltas)
+    refresh_after_stock_change(deltas.keys())
+
+# --- DB: Bill numbers (allocated in the writing transaction, safe across app instances) ---
+def sync_bill_sequences(cursor):
+    """Seeds each bill type's sequence from the highest bill number already used (never lowers it)."""
+    cursor.execute("INSERT OR IGNORE INTO bill_sequences (type, last_no) VALUES ('Sale', 0), ('Purchase', 0)")
     cursor.execute("""
+    UPDATE bill_sequences SET last_no = MAX(last_no, COALESCE((SELECT MAX(bill_no) FROM bills WHERE bills.type = bill_sequences.type), 0))
+    """)
+
+def next_bill_no(cursor, bill_type):
+    """Allocates the next bill number for bill_type inside the caller's transaction.
+
+    The UPDATE takes SQLite's write lock, so no other connection can allocate until this
+    transaction commits; a rollback hands the number back.
+    """
+    cursor.execute("UPDATE bill_sequences SET last_no = last_no + 1 WHERE type = ?", (bill_type,))
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO bill_sequences (type, last_no) VALUES (?, 1)", (bill_type,))
+    cursor.execute("SELECT last_no FROM bill_sequences WHERE type = ?", (bill_type,))
+    return cursor.fetchone()[0]
+
+def claim_bill_no(cursor, bill_type, bill_no):
+    """Records an explicitly given bill number, so later allocations continue after it."""
+    cursor.execute("UPDATE bill_sequences SET last_no = MAX(last_no, ?) WHERE type = ?", (bill_no, bill_type))
+
+# --- DB: Batched stock posting ---
+def stock_deltas_for_bill(bill_data, action="add", deltas=None):
+    """Returns {name_key: [display_name, qty_delta]} for a bill's stock effect, merged into deltas.
+
+    Lines for the same product are combined, so each product is written once.
+    """
+    deltas = {} if deltas is None else deltas
+    direction = -1 if bill_data["type"] == "Sale" else 1 if bill_data["type"] == "Purchase" else 0
+    multiplier = direction * (1 if action == "add" else -1)
+    for item in bill_data.get("items", []):
+        entry = deltas.setdefault(item["name"].lower(), [item["name"], 0])
+        entry[1] += item["qty"] * multiplier
+    return deltas
+
+def post_stock_deltas(cursor, deltas, reason, bill_id=None, movements=None):
+    """Writes all stock deltas and their stock_movements rows inside the caller's transaction (does not commit).
+
+    Unknown products are created with default prices, like update_stock_db always did. A batch of
+    bills passes `movements` (stock_movement_rows for each bill) instead of one reason / bill_id.
+    """
+    append_stock_movements(cursor, stock_movement_rows(deltas, reason, bill_id) if movements is None else movements)
+    rows = []
+    for key, (name, delta) in deltas.items():
+        if not delta: continue
+        item = inventory.get(key, {})
+        rows.append((key, item.get('name', name), delta, item.get('cost_price', 0), item.get('sale_price', 0),
+                     item.get('category'), item.get('reorder_level', 5)))
+    cursor.executemany("""
     INSERT INTO inventory (name_key, name, stock, cost_price, sale_price, category, reorder_level)
     VALUES (?, ?, ?, ?, ?, ?, ?)
-    ON CONFLICT(name_key) DO UPDATE SET stock = excluded.stock
-    """, (key, inventory[key]['name'], new_stock, inventory[key]['cost_price'], inventory[key]['sale_price'], inventory[key]['category'], inventory[key]['reorder_level']))
-    conn.commit()
-    conn.close()
-    
+    ON CONFLICT(name_key) DO UPDATE SET stock = inventory.stock + excluded.stock
+    """, rows)
+
+def apply_stock_deltas(deltas):
+    """Mirrors committed stock deltas into the in-memory inventory."""
+    for key, (name, delta) in deltas.items():
+        if not delta: continue
+        if key not in inventory:
+            inventory[key] = InventoryItem(name=name, stock=0, cost_price=0, sale_price=0, category=None, reorder_level=5, name_key=key)
+        inventory[key]["stock"] += delta
+
+def refresh_after_stock_change(changed_keys=None):
+    """Updates the inventory table and dashboard once after a batch of stock changes."""
     if inventory_tree:
-        refresh_inventory_table() # Refresh UI
+        refresh_inventory_table(changed_keys=changed_keys) # Refresh UI
     update_main_dashboard_summary() # Update inventory value
 
-def adjust_stock_for_bill(bill_data, action="add"):
-    bill_type = bill_data["type"]
-    items = bill_data.get("items", [])
-    multiplier = 1 if action == "add" else -1
-        
-    for item in items:
-        item_name = item["name"]
-        qty = item["qty"]
-        if bill_type == "Sale":
-            update_stock_db(item_name, -qty * multiplier)
-        elif bill_type == "Purchase":
-            update_stock_db(item_name, qty * multiplier)
+# --- DB: Stock ledger (append-only movements, periodic snapshots) ---
+def stock_movement_rows(deltas, reason, bill_id=None):
+    """stock_movements rows for {name_key: [name, qty_delta]}, dated today; zero deltas are skipped."""
+    day = datetime.date.today().isoformat()
+    return [(key, day, delta, reason, bill_id) for key, (_, delta) in deltas.items() if delta]
+
+def append_stock_movements(cursor, rows):
+    cursor.executemany("INSERT INTO stock_movements (name_key, day, qty, reason, bill_id) VALUES (?, ?, ?, ?, ?)", rows)
+
+def backfill_stock_movements(cursor):
+    """Rebuilds the ledger from the bills (dated by bill date) plus one opening balance per product
+    that makes the movements add up to the current stock. Runs inside the caller's transaction."""
+    cursor.execute("DELETE FROM stock_movements")
+    cursor.execute("DELETE FROM stock_snapshots")
+    movements = {} # (bill id, name_key) -> row; keyed with Python's lower() like inventory (SQL lower() is ASCII-only)
+    for bill_id, day, bill_type, name, qty in cursor.execute("""
+    SELECT b.id, b.date, b.type, i.name, SUM(i.qty)
+    FROM bill_items i JOIN bills b ON b.id = i.bill_id
+    WHERE b.type IN ('Sale', 'Purchase')
+    GROUP BY b.id, i.name
+    ORDER BY b.date, b.id
+    """).fetchall():
+        row = movements.setdefault((bill_id, name.lower()), [name.lower(), day, 0, bill_type.lower(), bill_id])
+        row[2] += qty if bill_type == 'Purchase' else -qty
+    append_stock_movements(cursor, [tuple(row) for row in movements.values() if row[2]])
+    first_day = cursor.execute("SELECT MIN(day) FROM stock_movements").fetchone()[0] or datetime.date.today().isoformat()
+    cursor.execute("""
+    INSERT INTO stock_movements (name_key, day, qty, reason)
+    SELECT name_key, ?, SUM(qty), 'opening' FROM (
+        SELECT name_key, stock AS qty FROM inventory
+        UNION ALL
+        SELECT name_key, -SUM(qty) FROM stock_movements GROUP BY name_key
+    ) GROUP BY name_key HAVING SUM(qty) != 0
+    """, (first_day,))
+
+def take_stock_snapshot(cursor, day):
+    """Stores every product's end-of-day stock for `day`: the previous snapshot plus the movements since."""
+    previous = cursor.execute("SELECT MAX(day) FROM stock_snapshots WHERE day < ?", (day,)).fetchone()[0] or ""
+    cursor.execute("DELETE FROM stock_snapshots WHERE day = ?", (day,))
+    cursor.execute("""
+    INSERT INTO stock_snapshots (day, name_key, stock)
+    SELECT ?, name_key, SUM(qty) FROM (
+        SELECT name_key, stock AS qty FROM stock_snapshots WHERE day = ?
+        UNION ALL
+        SELECT name_key, qty FROM stock_movements WHERE day > ? AND day <= ?
+    ) GROUP BY name_key HAVING SUM(qty) != 0
+    """, (day, previous, previous, day))
+
+def snapshot_stock_if_due(cursor):
+    """Takes the snapshots due every STOCK_SNAPSHOT_DAYS up to yesterday (closed days never change,
+    since movements are dated when posted). Returns how many were taken."""
+    last, first = cursor.execute("SELECT (SELECT MAX(day) FROM stock_snapshots), (SELECT MIN(day) FROM stock_movements)").fetchone()
+    if first is None: return 0
+    day = (datetime.date.fromisoformat(last) + datetime.timedelta(days=STOCK_SNAPSHOT_DAYS) if last
+           else datetime.date.fromisoformat(first))
+    yesterday, taken = datetime.date.today() - datetime.timedelta(days=1), 0
+    while day <= yesterday:
+        take_stock_snapshot(cursor, day.isoformat())
+        day += datetime.timedelta(days=STOCK_SNAPSHOT_DAYS); taken += 1
+    return taken
+
+def stock_on_date(day, name=None):
+    """Stock at the end of `day`: {name_key: stock} for every product holding stock, or one product's
+    stock when `name` is given. Starts from the nearest snapshot on or before the day."""
+    cursor = db_connect().cursor()
+    since = cursor.execute("SELECT MAX(day) FROM stock_snapshots WHERE day <= ?", (day,)).fetchone()[0] or ""
+    only = " AND name_key = :key" if name is not None else ""
+    cursor.execute(f"""
+    SELECT name_key, SUM(qty) FROM (
+        SELECT name_key, stock AS qty FROM stock_snapshots WHERE day = :since{only}
+        UNION ALL
+        SELECT name_key, qty FROM stock_movements WHERE day > :since AND day <= :day{only}
+    ) GROUP BY name_key HAVING SUM(qty) != 0
+    """, {"since": since, "day": day, "key": name.lower() if name is not None else None})
+    stock = dict(cursor.fetchall())
+    return stock.get(name.lower(), 0) if name is not None else stock
+
+def verify_stock_ledger():
+    """Products whose movements do not add up to inventory.stock: {name_key: (stock, ledger_total)}."""
+    return {key: (stock, total) for key, stock, total in db_connect().execute("""
+    SELECT name_key, SUM(stock), SUM(moved) FROM (
+        SELECT name_key, stock, 0 AS moved FROM inventory
+        UNION ALL
+        SELECT name_key, 0, qty FROM stock_movements
+    ) GROUP BY name_key HAVING SUM(stock) != SUM(moved)
+    """)}
 
 def add_bill_db(bill_data):
-    """Adds a new bill and its items to the database."""
+    """Adds a new bill and its items to the database (raises sqlite3.Error after rolling back)."""
     conn = db_connect()
     cursor = conn.cursor()
     
@@ -246,133 +1585,221 @@ def add_bill_db(bill_data):
     today_date = datetime.date.today().strftime('%Y-%m-%d')
     
     try:
-        # 1. Insert into main bills table
-        cursor.execute("""
-        INSERT INTO bills (bill_no, type, customer, mode, grand_total, date)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (bill_data['bill_no'], bill_data['type'], bill_data['customer'], bill_data['mode'], bill_data['grand_total'], today_date))
-        
-        bill_id = cursor.lastrowid
+        # 1-2. Insert the bill and its items
+        bill_id = insert_bill(cursor, bill_data, today_date)
         
-        # 2. Insert all items into bill_items
-        items_to_insert = []
-        for item in bill_data['items']:
-            # --- NEW: Get current cost_price for profit tracking ---
-            item_key = item['name'].lower()
-            current_cost_price = inventory.get(item_key, {}).get('cost_price', 0)
-            
-            items_to_insert.append((
-                bill_id, item['name'], item['qty'], item['price'], item['total'], current_cost_price
-            ))
-        
-        cursor.executemany("""
-        INSERT INTO bill_items (bill_id, name, qty, price, total, cost_price)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, items_to_insert)
+        # 3. Post stock in the same transaction, so the bill and its stock commit together
+        deltas = stock_deltas_for_bill(bill_data, action="add")
+        post_stock_deltas(cursor, deltas, bill_data['type'].lower(), bill_id)
         
         conn.commit()
         
-        # 3. Add to in-memory list
-        bill_data['id'] = bill_id
-        bill_data['date'] = today_date
-        # --- NEW: Add cost_price to in-memory bill items ---
-        for i, item in enumerate(bill_data['items']):
-            item['cost_price'] = items_to_insert[i][5]  
-            
-        bills.append(bill_data)
+        # 4. Add to in-memory list
+        bills[bill_id] = Bill(**bill_data)
+        index_bill(bills[bill_id])
+        track_bill_totals(bill_data, 1)
+        apply_stock_deltas(deltas)
+        refresh_after_stock_change(deltas.keys())
         
-        # 4. Adjust stock
-        adjust_stock_for_bill(bill_data, action="add")
+    except sqlite3.Error:
+        conn.rollback()
+        if bill_data.get('id') is None: bill_data['bill_no'] = None # The allocated number was rolled back
+        raise
+
+def insert_bill(cursor, bill_data, bill_date):
+    """Inserts a bill and its items (no commit); fills in bill_data's id, date and item cost prices.
+
+    A bill_no of None is allocated from bill_sequences in this transaction.
+    """
+    if bill_data.get('bill_no') is None:
+        bill_data['bill_no'] = next_bill_no(cursor, bill_data['type'])
+    else:
+        claim_bill_no(cursor, bill_data['type'], bill_data['bill_no'])
+    # 1. Insert into main bills table
+    cursor.execute("""
+    INSERT INTO bills (bill_no, type, customer, mode, grand_total, date)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, (bill_data['bill_no'], bill_data['type'], bill_data['customer'], bill_data['mode'], bill_data['grand_total'], bill_date))
+    
+    bill_id = cursor.lastrowid
+    
+    # 2. Insert all items into bill_items
+    items_to_insert = []
+    for item in bill_data['items']:
+        # --- NEW: Get current cost_price for profit tracking ---
+        item_key = item['name'].lower()
+        current_cost_price = inventory.get(item_key, {}).get('cost_price', 0)
+        item['cost_price'] = current_cost_price
         
-    except sqlite3.Error as e:
+        items_to_insert.append((
+            bill_id, item['name'], item['qty'], item['price'], item['total'], current_cost_price
+        ))
+    
+    cursor.executemany("""
+    INSERT INTO bill_items (bill_id, name, qty, price, total, cost_price)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, items_to_insert)
+    bill_data['id'] = bill_id
+    bill_data['date'] = bill_date
+    return bill_id
+
+def normalize_posted_bill(raw):
+    """Validates a bill given as JSON-style data and returns it in the billing form's shape (raises ValueError)."""
+    bill_type = raw.get("type", "Sale")
+    if bill_type not in ("Sale", "Purchase"): raise ValueError(f"Unknown bill type: {bill_type}")
+    customer = str(raw.get("customer") or "").strip()
+    if not customer: raise ValueError("Customer is required")
+    items = []
+    for it in raw.get("items") or []:
+        name = str(it.get("name") or "").strip()
+        if not name: raise ValueError("Item name is required")
+        qty = import_number(it.get("qty"), "Qty", integer=True)
+        if qty == 0: raise ValueError(f"Qty for '{name}' must be at least 1")
+        price = import_number(it.get("price"), "Price")
+        items.append({"name": name, "qty": qty, "price": price, "total": qty * price})
+    if not items: raise ValueError("A bill needs at least one item")
+    bill_no = raw.get("bill_no")
+    return {"bill_no": import_number(bill_no, "Bill no", integer=True) if bill_no is not None else None,
+            "type": bill_type, "customer": customer, "mode": str(raw.get("mode") or "Cash"),
+            "grand_total": sum(it["total"] for it in items), "date": import_date(raw.get("date")), "items": items}
+
+def post_bills(bill_list, check_stock=True):
+    """Posts many bills in one transaction without any UI (used by the command line).
+
+    Bills are dicts like {"type", "customer", "mode", "items": [{"name", "qty", "price"}]}, optionally
+    with "bill_no" and "date". Sales beyond the available stock are refused, as in the billing form.
+    Returns (bill_ids, rejected) with rejected = [(index, reason)]; the other bills are still posted.
+    The in-memory inventory follows the new stock, the bill window is not updated.
+    """
+    conn = db_connect()
+    cursor = conn.cursor()
+    posted, rejected, deltas, movements = [], [], {}, []
+    try:
+        for index, raw in enumerate(bill_list):
+            try:
+                bill_data = normalize_posted_bill(raw)
+                if check_stock and bill_data["type"] == "Sale":
+                    for key, (name, delta) in stock_deltas_for_bill(bill_data).items():
+                        available = get_stock(name) + deltas.get(key, [name, 0])[1] # Earlier bills in this batch count too
+                        if -delta > available:
+                            raise ValueError(f"Not enough stock for '{name}': need {-delta}, available {available}")
+            except (ValueError, TypeError, AttributeError) as e:
+                rejected.append((index, str(e))); continue
+            posted.append(insert_bill(cursor, bill_data, bill_data["date"]))
+            movements += stock_movement_rows(stock_deltas_for_bill(bill_data), bill_data["type"].lower(), posted[-1])
+            stock_deltas_for_bill(bill_data, action="add", deltas=deltas)
+        post_stock_deltas(cursor, deltas, None, movements=movements)
+        conn.commit()
+    except sqlite3.Error:
         conn.rollback()
-        messagebox.showerror("Database Error", f"Failed to add bill: {e}")
-    finally:
-        conn.close()
+        raise
+    apply_stock_deltas(deltas)
+    return posted, rejected
+
+def update_bill_rows(cursor, original_bill, new_bill_data):
+    """Rewrites a bill and its items inside the caller's transaction; returns the net stock deltas."""
+    bill_id = original_bill['id']
+    if new_bill_data['bill_no'] is None: # Type changed: numbered in the new type's sequence
+        new_bill_data['bill_no'] = next_bill_no(cursor, new_bill_data['type'])
+    
+    # 1. Update the main bill entry
+    # Note: We don't update the date of the original bill
+    # --- FIX: Use 'bill_no' key ---
+    cursor.execute("""
+    UPDATE bills SET
+        customer = ?, mode = ?, grand_total = ?, type = ?, bill_no = ?
+    WHERE id = ?
+    """, (new_bill_data['customer'], new_bill_data['mode'], new_bill_data['grand_total'], new_bill_data['type'], new_bill_data['bill_no'], bill_id))
+    if not cursor.rowcount:
+        raise sqlite3.IntegrityError(f"Bill {bill_id} is archived (read-only) or no longer exists")
+    
+    # 2. Delete all old items for this bill
+    cursor.execute("DELETE FROM bill_items WHERE bill_id = ?", (bill_id,))
+    
+    # 3. Insert all new items, with current cost_price
+    items_to_insert = []
+    new_bill_data['items_with_cost'] = []
+    for item in new_bill_data['items']:
+        item_key = item['name'].lower()
+        current_cost_price = inventory.get(item_key, {}).get('cost_price', 0)
+        items_to_insert.append((
+            bill_id, item['name'], item['qty'], item['price'], item['total'], current_cost_price
+        ))
+        # Store for in-memory update
+        item_with_cost = dict(item)
+        item_with_cost['cost_price'] = current_cost_price
+        new_bill_data['items_with_cost'].append(item_with_cost)
+
+    cursor.executemany("""
+    INSERT INTO bill_items (bill_id, name, qty, price, total, cost_price)
+    VALUES (?, ?, ?, ?, ?, ?)
+    """, items_to_insert)
+    
+    # 4. Post the net stock change (revert old + apply new) in the same transaction
+    deltas = stock_deltas_for_bill(original_bill, action="remove")
+    stock_deltas_for_bill(new_bill_data, action="add", deltas=deltas)
+    post_stock_deltas(cursor, deltas, "bill edit", bill_id)
+    return deltas
+
+def delete_bill_rows(cursor, bill):
+    """Deletes a bill inside the caller's transaction; returns the stock deltas that revert it."""
+    cursor.execute("DELETE FROM bills WHERE id = ?", (bill['id'],)) # Items deleted by CASCADE
+    if not cursor.rowcount:
+        raise sqlite3.IntegrityError(f"Bill {bill['id']} is archived (read-only) or no longer exists")
+    deltas = stock_deltas_for_bill(bill, action="remove")
+    post_stock_deltas(cursor, deltas, "bill delete", bill['id'])
+    return deltas
 
 def edit_bill_db(original_bill, new_bill_data):
-    """Updates a bill and its items in the database."""
+    """Updates a bill and its items in the database (raises sqlite3.Error after rolling back)."""
     conn = db_connect()
     cursor = conn.cursor()
     
     try:
         bill_id = original_bill['id']
-        
-        # 1. Update the main bill entry
-        # Note: We don't update the date of the original bill
-        # --- FIX: Use 'bill_no' key ---
-        cursor.execute("""
-        UPDATE bills SET
-            customer = ?, mode = ?, grand_total = ?, type = ?, bill_no = ?
-        WHERE id = ?
-        """, (new_bill_data['customer'], new_bill_data['mode'], new_bill_data['grand_total'], new_bill_data['type'], new_bill_data['bill_no'], bill_id))
-        
-        # 2. Delete all old items for this bill
-        cursor.execute("DELETE FROM bill_items WHERE bill_id = ?", (bill_id,))
-        
-        # 3. Insert all new items, with current cost_price
-        items_to_insert = []
-        new_bill_data['items_with_cost'] = []
-        for item in new_bill_data['items']:
-            item_key = item['name'].lower()
-            current_cost_price = inventory.get(item_key, {}).get('cost_price', 0)
-            items_to_insert.append((
-                bill_id, item['name'], item['qty'], item['price'], item['total'], current_cost_price
-            ))
-            # Store for in-memory update
-            item_with_cost = dict(item)
-            item_with_cost['cost_price'] = current_cost_price
-            new_bill_data['items_with_cost'].append(item_with_cost)
-
-        cursor.executemany("""
-        INSERT INTO bill_items (bill_id, name, qty, price, total, cost_price)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, items_to_insert)
-        
+        deltas = update_bill_rows(cursor, original_bill, new_bill_data)
         conn.commit()
-
-        # 4. Adjust stock
-        adjust_stock_for_bill(original_bill, action="remove") # Revert old
-        adjust_stock_for_bill(new_bill_data, action="add")    # Apply new
+        apply_stock_deltas(deltas)
+        track_bill_totals(original_bill, -1)
+        track_bill_totals(dict(new_bill_data, date=original_bill.get('date')), 1)
         
-        # 5. Update in-memory list
-        for i, b in enumerate(bills):
-            if b['id'] == bill_id:
-                # Update with new data, but keep original ID and Date
-                bills[i].update(new_bill_data)
-                bills[i]['items'] = new_bill_data['items_with_cost'] # Update items
-                break
+        # 5. Update in-memory list (older bills are simply dropped from the history cache)
+        bill_history_cache.pop(bill_id, None)
+        if bill_id in bills:
+            # Update with new data, but keep original ID and Date
+            bills[bill_id].update(new_bill_data)
+            # Items from the form may still carry the old row's id / bill_id (see on_row_select)
+            bills[bill_id]['items'] = [BillItem(**{**it, "bill_id": bill_id, "id": None}) for it in new_bill_data['items_with_cost']]
+            index_bill(bills[bill_id])
+        refresh_after_stock_change(deltas.keys())
                 
-    except sqlite3.Error as e:
+    except sqlite3.Error:
         conn.rollback()
-        messagebox.showerror("Database Error", f"Failed to update bill: {e}")
-    finally:
-        conn.close()
-
+        raise
 
 def delete_bill_db(bill_to_delete):
-    """Deletes a bill and its items from the database."""
-    global bills
+    """Deletes a bill and its items from the database (raises sqlite3.Error after rolling back)."""
     conn = db_connect()
     cursor = conn.cursor()
     try:
         bill_id = bill_to_delete['id']
-        cursor.execute("DELETE FROM bills WHERE id = ?", (bill_id,)) # Items deleted by CASCADE
+        deltas = delete_bill_rows(cursor, bill_to_delete)
         conn.commit()
-        adjust_stock_for_bill(bill_to_delete, action="remove")
-        bills = [b for b in bills if b['id'] != bill_id]
-    except sqlite3.Error as e:
-        conn.rollback(); messagebox.showerror("Database Error", f"Failed to delete bill: {e}")
-    finally:
-        conn.close()
-
-# --- DB: Inventory DB functions (Unchanged) ---
+        apply_stock_deltas(deltas)
+        track_bill_totals(bill_to_delete, -1)
+        bills.pop(bill_id, None)
+        unindex_bill(bill_id)
+        bill_history_cache.pop(bill_id, None)
+        refresh_after_stock_change(deltas.keys())
+    except sqlite3.Error:
+        conn.rollback(); raise
+
+# --- DB: Inventory DB functions (raise ValueError / sqlite3.Error; the dialogs show the message) ---
 def add_new_product_db(data):
     global inventory
     key = data['name'].lower()
     if key in inventory:
-        messagebox.showwarning("Exists", f"Product '{data['name']}' already exists.")
-        return False
+        raise ValueError(f"Product '{data['name']}' already exists.")
     conn = db_connect()
     cursor = conn.cursor()
     try:
@@ -380,23 +1807,20 @@ def add_new_product_db(data):
         INSERT INTO inventory (name_key, name, stock, cost_price, sale_price, category, reorder_level)
         VALUES (?, ?, ?, ?, ?, ?, ?)
         """, (key, data['name'], data['stock'], data['cost_price'], data['sale_price'], data['category'], data['reorder_level']))
+        append_stock_movements(cursor, stock_movement_rows({key: [data['name'], data['stock']]}, "opening"))
         conn.commit()
-        inventory[key] = {"name": data['name'], "stock": data['stock'], "cost_price": data['cost_price'],
-                            "sale_price": data['sale_price'], "category": data['category'], "reorder_level": data['reorder_level'], "name_key": key}
-        refresh_inventory_table(); update_main_dashboard_summary()
+        inventory[key] = InventoryItem(name=data['name'], stock=data['stock'], cost_price=data['cost_price'],
+                                       sale_price=data['sale_price'], category=data['category'], reorder_level=data['reorder_level'], name_key=key)
+        refresh_inventory_table(changed_keys=[key]); update_main_dashboard_summary()
         set_status(f"Added new product: {data['name']}")
-        return True
-    except sqlite3.Error as e:
-        conn.rollback(); messagebox.showerror("Database Error", f"Failed to add product: {e}")
-        return False
-    finally: conn.close()
+    except sqlite3.Error:
+        conn.rollback(); raise
 
 def edit_product_db(original_key, data):
     global inventory
     new_key = data['name'].lower()
     if new_key != original_key and new_key in inventory:
-        messagebox.showwarning("Exists", f"Product name '{data['name']}' already exists.")
-        return False
+        raise ValueError(f"Product name '{data['name']}' already exists.")
     conn = db_connect()
     cursor = conn.cursor()
     try:
@@ -405,19 +1829,23 @@ def edit_product_db(original_key, data):
             name_key = ?, name = ?, cost_price = ?, sale_price = ?, category = ?, reorder_level = ?
         WHERE name_key = ?
         """, (new_key, data['name'], data['cost_price'], data['sale_price'], data['category'], data['reorder_level'], original_key))
+        if new_key != original_key: # The ledger is keyed by name_key: move the stock across
+            cursor.execute("""
+            INSERT INTO stock_movements (name_key, day, qty, reason)
+            SELECT ?, ?, -stock, 'renamed' FROM inventory WHERE name_key = ? AND stock != 0
+            UNION ALL
+            SELECT ?, ?, stock, 'renamed' FROM inventory WHERE name_key = ? AND stock != 0
+            """, (original_key, datetime.date.today().isoformat(), new_key, new_key, datetime.date.today().isoformat(), new_key))
         conn.commit()
         current_stock = inventory[original_key]['stock']
         del inventory[original_key]
-        inventory[new_key] = {"name": data['name'], "stock": current_stock, "cost_price": data['cost_price'],
-                            "sale_price": data['sale_price'], "category": data['category'],  
-                            "reorder_level": data['reorder_level'], "name_key": new_key}
-        refresh_inventory_table(); update_main_dashboard_summary()
+        inventory[new_key] = InventoryItem(name=data['name'], stock=current_stock, cost_price=data['cost_price'],
+                                           sale_price=data['sale_price'], category=data['category'],
+                                           reorder_level=data['reorder_level'], name_key=new_key)
+        refresh_inventory_table(changed_keys=[original_key, new_key]); update_main_dashboard_summary()
         set_status(f"Updated product: {data['name']}")
-        return True
-    except sqlite3.Error as e:
-        conn.rollback(); messagebox.showerror("Database Error", f"Failed to update product: {e}")
-        return False
-    finally: conn.close()
+    except sqlite3.Error:
+        conn.rollback(); raise
 
 def adjust_product_stock_db(item_key, new_stock):
     global inventory
@@ -425,54 +1853,301 @@ def adjust_product_stock_db(item_key, new_stock):
     conn = db_connect()
     cursor = conn.cursor()
     try:
+        cursor.execute("""
+        INSERT INTO stock_movements (name_key, day, qty, reason)
+        SELECT name_key, ?, ? - stock, 'adjustment' FROM inventory WHERE name_key = ? AND stock != ?
+        """, (datetime.date.today().isoformat(), new_stock, item_key, new_stock))
         cursor.execute("UPDATE inventory SET stock = ? WHERE name_key = ?", (new_stock, item_key))
         conn.commit()
         inventory[item_key]["stock"] = new_stock
-        refresh_inventory_table(); update_main_dashboard_summary()
+        refresh_inventory_table(changed_keys=[item_key]); update_main_dashboard_summary()
         set_status(f"Adjusted stock for {inventory[item_key]['name']}")
-    except sqlite3.Error as e:
-        conn.rollback(); messagebox.showerror("Database Error", f"Failed to adjust stock: {e}")
-    finally: conn.close()
+    except sqlite3.Error:
+        conn.rollback(); raise
+
+def product_in_bills(item_key):
+    """True if any bill has a line for this product."""
+    cursor = db_connect().execute("SELECT 1 FROM bill_items WHERE name = ? LIMIT 1", (inventory[item_key]['name'],))
+    return cursor.fetchone() is not None
 
 # --- NEW: Delete Product DB Function ---
 def delete_product_db(item_key):
     global inventory
     if item_key not in inventory:
-        messagebox.showerror("Error", "Could not find product to delete.")
-        return
+        raise ValueError("Could not find product to delete.")
     
     item_name = inventory[item_key]['name']
-
-    # Check if item is used in any bill
     conn = db_connect()
     cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM bill_items WHERE name = ? LIMIT 1", (item_name,))
-    exists = cursor.fetchone()
-    
-    if exists:
-        if not messagebox.askyesno("Confirm Delete", f"Product '{item_name}' is present in past bills.\n\nDeleting it may affect historical data if you regenerate reports (though profit reports should be fine).\n\nAre you sure you want to permanently delete this product?"):
-            conn.close()
-            return
-
     try:
-        # Proceed with deletion
+        # Proceed with deletion (whatever stock is left is written off in the ledger)
+        cursor.execute("""
+        INSERT INTO stock_movements (name_key, day, qty, reason)
+        SELECT name_key, ?, -stock, 'product deleted' FROM inventory WHERE name_key = ? AND stock != 0
+        """, (datetime.date.today().isoformat(), item_key))
         cursor.execute("DELETE FROM inventory WHERE name_key = ?", (item_key,))
         conn.commit()
         
         # Remove from in-memory cache
         del inventory[item_key]
         
-        refresh_inventory_table()
+        refresh_inventory_table(changed_keys=[item_key])
         update_main_dashboard_summary()
         set_status(f"Deleted product: {item_name}")
-        messagebox.showinfo("Deleted", f"Product '{item_name}' has been deleted.")
 
-    except sqlite3.Error as e:
+    except sqlite3.Error:
         conn.rollback()
-        messagebox.showerror("Database Error", f"Failed to delete product: {e}")
+        raise
+
+
+# --- DB: Bulk import (CSV / xlsx) ---
+# Accepted column headers (case-insensitive) for each field; the first one present is used
+PRODUCT_IMPORT_COLUMNS = {
+    "name": ("name", "product name", "product", "item"),
+    "category": ("category",),
+    "stock": ("stock", "opening stock", "initial stock", "qty"),
+    "cost_price": ("cost price", "cost_price", "cost"),
+    "sale_price": ("sale price", "sale_price", "price", "mrp"),
+    "reorder_level": ("reorder level", "reorder lvl", "reorder_level", "reorder"),
+}
+PURCHASE_IMPORT_COLUMNS = {
+    "bill_no": ("bill no", "billno", "bill_no", "bill"),
+    "date": ("date",),
+    "supplier": ("supplier", "customer", "party"),
+    "mode": ("mode", "payment mode"),
+    "item": ("item", "item name", "product", "product name"),
+    "qty": ("qty", "quantity"),
+    "price": ("price", "rate", "cost price", "cost"),
+}
+
+def iter_import_rows(fpath):
+    """Streams (line_no, {header: value}) from a CSV or the first sheet of an .xlsx; blank rows are skipped."""
+    if fpath.lower().endswith((".xlsx", ".xlsm")):
+        wb = load_workbook(fpath, read_only=True, data_only=True)
+        try:
+            rows = wb.worksheets[0].iter_rows(values_only=True)
+            headers = [str(h or "").strip().lower() for h in next(rows, ())]
+            for line_no, values in enumerate(rows, start=2):
+                if any(v is not None and str(v).strip() for v in values):
+                    yield line_no, dict(zip(headers, values))
+        finally:
+            wb.close()
+    else:
+        with open(fpath, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            headers = [h.strip().lower() for h in next(reader, [])]
+            for values in reader:
+                if any(v.strip() for v in values):
+                    yield reader.line_num, dict(zip(headers, values))
+
+def import_value(row, aliases):
+    """The row's value for the first alias present, as stripped text or a native xlsx value; None if empty."""
+    for alias in aliases:
+        value = row.get(alias)
+        if isinstance(value, str): value = value.strip()
+        if value not in (None, ""): return value
+    return None
+
+def import_number(value, field, integer=False, default=None):
+    if value is None:
+        if default is None: raise ValueError(f"{field} is required")
+        return default
+    try:
+        number = float(str(value).replace("Rs.", "").replace(",", "").strip())
+    except ValueError:
+        raise ValueError(f"{field} is not a number: {value}") from None
+    if number < 0: raise ValueError(f"{field} cannot be negative")
+    if integer:
+        if number != int(number): raise ValueError(f"{field} must be a whole number: {value}")
+        return int(number)
+    return number
+
+def import_date(value):
+    """Accepts YYYY-MM-DD text or an Excel date; blank means today."""
+    if value is None: return datetime.date.today().strftime('%Y-%m-%d')
+    if isinstance(value, (datetime.date, datetime.datetime)): return value.strftime('%Y-%m-%d')
+    try:
+        return datetime.datetime.strptime(str(value), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Date must be YYYY-MM-DD: {value}") from None
+
+class RejectReport:
+    """Rows an import could not use, written to <source>_rejects.csv as they occur."""
+    def __init__(self, source_path):
+        self.path = os.path.splitext(source_path)[0] + "_rejects.csv"
+        self.count = 0
+        self.file = self.writer = None
+        if os.path.exists(self.path): os.remove(self.path) # Stale report from an earlier import
+
+    def add(self, line_no, row, error):
+        if not self.file:
+            self.file = open(self.path, "w", newline="", encoding="utf-8")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(["Line", "Error"] + list(row.keys()))
+        self.writer.writerow([line_no, error] + ["" if v is None else v for v in row.values()])
+        self.count += 1
+
+    def close(self):
+        if self.file: self.file.close()
+
+def parse_product_row(row):
+    """Returns an inventory row (name_key, name, stock, cost, sale, category, reorder) or raises ValueError."""
+    cols = PRODUCT_IMPORT_COLUMNS
+    name = import_value(row, cols["name"])
+    if name is None: raise ValueError("Product name is required")
+    name = str(name)
+    category = import_value(row, cols["category"])
+    return (name.lower(), name,
+            import_number(import_value(row, cols["stock"]), "Stock", integer=True, default=0),
+            import_number(import_value(row, cols["cost_price"]), "Cost price", default=0),
+            import_number(import_value(row, cols["sale_price"]), "Sale price", default=0),
+            str(category) if category is not None else None,
+            import_number(import_value(row, cols["reorder_level"]), "Reorder level", integer=True, default=5))
+
+def import_products(fpath, progress=None):
+    """Adds or updates products from a CSV/xlsx catalogue, IMPORT_CHUNK_ROWS per transaction.
+
+    New products get the file's opening stock; existing ones keep their stock (it only changes
+    through bills) and take the file's name, prices, category and reorder level.
+    Returns {"imported", "rejected", "reject_file", "seconds"}; the in-memory inventory is not touched.
+    """
+    start = time.perf_counter()
+    conn = db_connect()
+    rejects = RejectReport(fpath)
+    imported = 0
+    chunk = []
+    today = datetime.date.today().isoformat()
+    def flush():
+        nonlocal imported
+        openings = {} # A product listed twice is inserted once, with its first row's stock
+        for row in chunk: openings.setdefault(row[0], row)
+        try:
+            conn.executemany("""
+            INSERT INTO stock_movements (name_key, day, qty, reason)
+            SELECT ?, ?, ?, 'opening' WHERE ? != 0 AND NOT EXISTS (SELECT 1 FROM inventory WHERE name_key = ?)
+            """, [(row[0], today, row[2], row[2], row[0]) for row in openings.values()])
+            conn.executemany("""
+            INSERT INTO inventory (name_key, name, stock, cost_price, sale_price, category, reorder_level)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name_key) DO UPDATE SET name = excluded.name, cost_price = excluded.cost_price,
+                sale_price = excluded.sale_price, category = excluded.category, reorder_level = excluded.reorder_level
+            """, chunk)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback(); raise
+        imported += len(chunk)
+        chunk.clear()
+        if progress: progress(imported)
+    try:
+        for line_no, row in iter_import_rows(fpath):
+            try:
+                chunk.append(parse_product_row(row))
+            except ValueError as e:
+                rejects.add(line_no, row, str(e))
+            if len(chunk) >= IMPORT_CHUNK_ROWS: flush()
+        if chunk: flush()
     finally:
-        conn.close()
+        rejects.close()
+    return {"imported": imported, "rejected": rejects.count, "reject_file": rejects.path if rejects.count else None,
+            "seconds": time.perf_counter() - start}
+
+def parse_purchase_line(row):
+    """Returns ((bill_no, date, supplier, mode), item) for one purchase line or raises ValueError."""
+    cols = PURCHASE_IMPORT_COLUMNS
+    supplier = import_value(row, cols["supplier"])
+    if supplier is None: raise ValueError("Supplier is required")
+    item = import_value(row, cols["item"])
+    if item is None: raise ValueError("Item is required")
+    bill_no = import_value(row, cols["bill_no"])
+    qty = import_number(import_value(row, cols["qty"]), "Qty", integer=True)
+    if qty == 0: raise ValueError("Qty must be at least 1")
+    price = import_number(import_value(row, cols["price"]), "Price")
+    bill_key = (import_number(bill_no, "Bill no", integer=True) if bill_no is not None else None,
+                import_date(import_value(row, cols["date"])), str(supplier), str(import_value(row, cols["mode"]) or "Cash"))
+    return bill_key, {"name": str(item), "qty": qty, "price": price, "total": qty * price}
+
+def import_purchases(fpath, progress=None):
+    """Creates purchase bills from a CSV/xlsx of lines, posting their stock, IMPORT_CHUNK_ROWS lines per transaction.
+
+    Consecutive lines with the same bill no, date, supplier and mode form one bill; lines without a
+    bill no are numbered after the last purchase. Bad lines are rejected, the rest of their bill is kept.
+    A bill no that already exists (archived years included), or that an earlier bill in the file used,
+    rejects all of that bill's lines.
+    Returns {"imported" (lines), "bills", "rejected", "reject_file", "seconds"}; in-memory data is not touched.
+    """
+    start = time.perf_counter()
+    conn = db_connect()
+    rejects = RejectReport(fpath)
+    counts = {"imported": 0, "bills": 0}
+    pending = [] # [(bill_key, [items])], written together
+    pending_lines = 0
+    file_bill_nos = set() # Explicit bill nos accepted so far; auto-numbered bills skip them
+
+    def parsed_lines():
+        for line_no, row in iter_import_rows(fpath):
+            try:
+                yield (line_no, row) + parse_purchase_line(row)
+            except ValueError as e:
+                rejects.add(line_no, row, str(e))
+
+    def duplicate_reason(bill_no):
+        if bill_no is None: return None
+        if bill_no in file_bill_nos:
+            return f"Bill no {bill_no} is used by an earlier bill in this file"
+        for schema in bill_sources(): # Archived years too: bill nos stay taken once a year is archived
+            if conn.execute(f"SELECT 1 FROM {schema}.bills WHERE type = 'Purchase' AND bill_no = ?", (bill_no,)).fetchone():
+                where = "" if schema == "main" else f" (archived, FY {financial_year_range(int(schema[2:]))[2]})"
+                return f"Purchase bill no {bill_no} already exists{where}"
+        return None
+
+    def flush():
+        cursor = conn.cursor()
+        try:
+            item_rows, deltas, movements = [], {}, []
+            for (bill_no, date, supplier, mode), items in pending:
+                if bill_no is None:
+                    bill_no = next_bill_no(cursor, "Purchase")
+                    while bill_no in file_bill_nos: # Taken by a later bill of this chunk
+                        bill_no = next_bill_no(cursor, "Purchase")
+                else:
+                    claim_bill_no(cursor, "Purchase", bill_no)
+                cursor.execute("""
+                INSERT INTO bills (bill_no, type, customer, mode, grand_total, date) VALUES (?, 'Purchase', ?, ?, ?, ?)
+                """, (bill_no, supplier, mode, sum(it["total"] for it in items), date))
+                bill_id = cursor.lastrowid
+                item_rows.extend((bill_id, it["name"], it["qty"], it["price"], it["total"], it["name"].lower()) for it in items)
+                movements += stock_movement_rows(stock_deltas_for_bill({"type": "Purchase", "items": items}), "purchase", bill_id)
+                stock_deltas_for_bill({"type": "Purchase", "items": items}, action="add", deltas=deltas)
+            cursor.executemany("""
+            INSERT INTO bill_items (bill_id, name, qty, price, total, cost_price)
+            VALUES (?, ?, ?, ?, ?, COALESCE((SELECT cost_price FROM inventory WHERE name_key = ?), 0))
+            """, item_rows)
+            post_stock_deltas(cursor, deltas, None, movements=movements)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback(); raise
+        counts["imported"] += len(item_rows); counts["bills"] += len(pending)
+        pending.clear()
+        if progress: progress(counts["imported"])
 
+    try:
+        for bill_key, group in groupby(parsed_lines(), key=lambda line: line[2]):
+            group = list(group)
+            reason = duplicate_reason(bill_key[0])
+            if reason:
+                for line_no, row, _, _ in group: rejects.add(line_no, row, reason)
+                continue
+            if bill_key[0] is not None: file_bill_nos.add(bill_key[0])
+            items = [item for _, _, _, item in group]
+            pending.append((bill_key, items))
+            pending_lines += len(items)
+            if pending_lines >= IMPORT_CHUNK_ROWS:
+                flush(); pending_lines = 0
+        if pending: flush()
+    finally:
+        rejects.close()
+    return dict(counts, rejected=rejects.count, reject_file=rejects.path if rejects.count else None,
+                seconds=time.perf_counter() - start)
 
 # --- DB: Query Functions ---
 def get_inventory_value():
@@ -486,21 +2161,16 @@ def get_total_profit():
     conn = db_connect()
     cursor = conn.cursor()
     try:
+        # Reads the daily_item_sales rollup, so the cost depends on days x items, not line items.
         # Profit = (Sale Price - Cost Price) * Quantity
         # We stored total = Sale Price * Qty
         # We stored cost_price = Cost Price
         # So profit = total - (cost_price * qty)
-        cursor.execute("""
-        SELECT SUM(total) - SUM(cost_price * qty) 
-        FROM bill_items 
-        WHERE bill_id IN (SELECT id FROM bills WHERE type = 'Sale')
-        """)
+        cursor.execute("SELECT SUM(revenue) - SUM(cost) FROM daily_item_sales")
         result = cursor.fetchone()[0]
         return result if result else 0
     except Exception:
         return 0
-    finally:
-        conn.close()
 
 def get_sales_for_period(start_date, end_date):
     """Gets total sales amount for a given period."""
@@ -508,16 +2178,445 @@ def get_sales_for_period(start_date, end_date):
     cursor = conn.cursor()
     try:
         cursor.execute("""
-        SELECT SUM(grand_total) 
-        FROM bills 
-        WHERE type = 'Sale' AND date BETWEEN ? AND ?
+        SELECT SUM(revenue) 
+        FROM daily_item_sales 
+        WHERE day BETWEEN ? AND ?
         """, (start_date, end_date))
         result = cursor.fetchone()[0]
         return result if result else 0
     except Exception:
         return 0
+
+# --- DB: Memory benchmark for the in-memory bill cache ---
+def run_memory_benchmark(item_counts=(100_000, 1_000_000), items_per_bill=4):
+    """Compares the memory held by dict rows vs. slotted records for the bill cache (tracemalloc).
+
+    Rows come from a scratch in-memory SQLite database, so strings are fresh per row exactly
+    as they are when loading business_app.db. Returns a list of result dicts and prints a table.
+    """
+    results = []
+    for n_items in item_counts:
+        n_bills = max(1, n_items // items_per_bill)
+        scratch = sqlite3.connect(":memory:")
+        scratch.row_factory = sqlite3.Row
+        scratch.execute("CREATE TABLE bills (id INTEGER PRIMARY KEY, bill_no INTEGER, type TEXT, customer TEXT, mode TEXT, grand_total REAL, date TEXT)")
+        scratch.execute("CREATE TABLE bill_items (id INTEGER PRIMARY KEY, bill_id INTEGER, name TEXT, qty INTEGER, price REAL, total REAL, cost_price REAL)")
+        scratch.executemany("INSERT INTO bills VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            ((i, i, "Sale" if i % 5 else "Purchase", f"Customer {i % 2000}", "Cash" if i % 3 else "Credit",
+                              100.0 + i % 997, f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}") for i in range(1, n_bills + 1)))
+        scratch.executemany("INSERT INTO bill_items VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            ((i, 1 + (i - 1) // items_per_bill, f"Product {i % 5000}", 1 + i % 7, 10.0 + i % 90,
+                              (1 + i % 7) * (10.0 + i % 90), 8.0 + i % 80) for i in range(1, n_items + 1)))
+
+        row = {"items": n_items, "bills": n_bills}
+        for label, make_bill, make_item in (("dict", lambda r: dict(r), lambda r: dict(r)),
+                                              ("slots", Bill.from_row, BillItem.from_row)):
+            tracemalloc.start()
+            cache = {}
+            for bill_row in scratch.execute("SELECT * FROM bills ORDER BY id"):
+                bill = make_bill(bill_row)
+                bill['items'] = []
+                cache[bill['id']] = bill
+            for item_row in scratch.execute("SELECT * FROM bill_items ORDER BY bill_id, id"):
+                cache[item_row['bill_id']]['items'].append(make_item(item_row))
+            row[label + "_mb"] = tracemalloc.get_traced_memory()[0] / 1e6
+            tracemalloc.stop()
+            del cache
+        row["saving_pct"] = 100.0 * (1 - row["slots_mb"] / row["dict_mb"])
+        scratch.close()
+        results.append(row)
+        print(f"{n_items:>10,} items / {n_bills:>8,} bills: dict {row['dict_mb']:8.1f} MB | "
+              f"slots {row['slots_mb']:8.1f} MB | saving {row['saving_pct']:5.1f}%")
+    return results
+
+# --- DB: Synthetic data and benchmark suite ---
+def generate_synthetic_data(db_path, products=5000, customers=2000, bills_count=100_000, items_per_bill=4,
+                            days=730, seed=42):
+    """Fills a new database with realistic-looking data and returns the row counts.
+
+    Product and customer popularity follow a long tail (Zipf-like weights), line counts and
+    quantities are skewed towards small values, prices are log-normal with a 15-40% margin, and
+    bills get busier towards the end of the period and on weekends, ending today. About one bill
+    in ten is a supplier purchase. Stock is seeded directly rather than derived from the bills.
+    """
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists; synthetic data goes into a new database")
+    global DATABASE_FILE
+    DATABASE_FILE = db_path
+    init_db()
+    rng = random.Random(seed)
+    conn = db_connect()
+
+    names = [f"{rng.choice(['Super', 'Fresh', 'Daily', 'Prime', 'Royal', 'Classic'])} "
+             f"{rng.choice(['Rice', 'Tea', 'Soap', 'Oil', 'Biscuits', 'Pen', 'Notebook', 'Cable', 'Bulb', 'Shampoo'])} {i}"
+             for i in range(1, products + 1)]
+    categories = ["Grocery", "Stationery", "Electrical", "Personal Care", "Household", None]
+    catalogue = []
+    for name in names:
+        sale_price = round(rng.lognormvariate(4.0, 0.9), 2)
+        catalogue.append((name.lower(), name, rng.randint(0, 500), round(sale_price * rng.uniform(0.6, 0.85), 2),
+                          sale_price, rng.choice(categories), rng.choice([5, 10, 20])))
+    conn.executemany("""
+    INSERT INTO inventory (name_key, name, stock, cost_price, sale_price, category, reorder_level)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, catalogue)
+    product_weights = [1 / (rank ** 1.1) for rank in range(1, products + 1)]
+    customer_names = [f"Customer {i}" for i in range(1, customers + 1)]
+    customer_weights = [1 / (rank ** 0.9) for rank in range(1, customers + 1)]
+    suppliers = [f"Supplier {i}" for i in range(1, max(2, customers // 100) + 1)]
+
+    # Daily volume grows ~50% over the period and is 30% higher on weekends
+    today = datetime.date.today()
+    dates = [today - datetime.timedelta(days=days - 1 - d) for d in range(days)]
+    day_weights = [(1 + 0.5 * d / days) * (1.3 if day.weekday() >= 5 else 1) for d, day in enumerate(dates)]
+    bill_dates = sorted(rng.choices(dates, weights=day_weights, k=bills_count))
+
+    # Per-item bill_search upkeep would re-index every bill once per line: index the bills once at the end
+    search_index = has_search_index("bill_search")
+    for (trigger,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'bill_search_%'").fetchall():
+        conn.execute(f"DROP TRIGGER {trigger}")
+
+    numbers = {"Sale": 0, "Purchase": 0}
+    bill_rows, item_rows = [], []
+    def flush():
+        conn.executemany("INSERT INTO bills (id, bill_no, type, customer, mode, grand_total, date) VALUES (?, ?, ?, ?, ?, ?, ?)", bill_rows)
+        conn.executemany("INSERT INTO bill_items (bill_id, name, qty, price, total, cost_price) VALUES (?, ?, ?, ?, ?, ?)", item_rows)
+        conn.commit()
+        bill_rows.clear(); item_rows.clear()
+    for bill_id, day in enumerate(bill_dates, start=1):
+        bill_type = "Purchase" if rng.random() < 0.1 else "Sale"
+        numbers[bill_type] += 1
+        lines = min(products, 1 + int(rng.expovariate(1 / max(items_per_bill - 1, 0.01))))
+        total = 0
+        for index in set(rng.choices(range(products), weights=product_weights, k=lines)):
+            _, name, _, cost, sale_price, _, _ = catalogue[index]
+            qty = rng.randint(10, 100) if bill_type == "Purchase" else min(1 + int(rng.expovariate(0.8)), 24)
+            price = cost if bill_type == "Purchase" else sale_price
+            item_rows.append((bill_id, name, qty, price, qty * price, cost))
+            total += qty * price
+        customer = rng.choice(suppliers) if bill_type == "Purchase" else rng.choices(customer_names, weights=customer_weights)[0]
+        bill_rows.append((bill_id, numbers[bill_type], bill_type, customer, "Cash" if rng.random() < 0.7 else "Credit",
+                          round(total, 2), day.strftime('%Y-%m-%d')))
+        if len(item_rows) >= IMPORT_CHUNK_ROWS: flush()
+    flush()
+    if search_index:
+        execute_sql_script(conn.cursor(), SEARCH_INDEX_SQL)
+        build_bill_search(conn.cursor())
+    sync_bill_sequences(conn.cursor())
+    backfill_stock_movements(conn.cursor()) # Stock was seeded directly: derive the ledger
+    snapshot_stock_if_due(conn.cursor())
+    conn.execute("DELETE FROM change_log") # Nobody is watching a brand-new database
+    conn.commit()
+    return {"products": products, "customers": customers, "bills": bills_count,
+            "items": conn.execute("SELECT COUNT(*) FROM bill_items").fetchone()[0]}
+
+def run_benchmark_suite(db_path, out_path, repeat=3, add_bills=50, pdf_bills=100):
+    """Times the app's heavy operations against a copy of db_path and writes the results as JSON.
+
+    The copy keeps the source database unchanged (add_bill_db writes to it). Each operation is run
+    `repeat` times; min and median seconds are reported. Returns the results dict.
+    """
+    global DATABASE_FILE
+    original_db = DATABASE_FILE
+    work_dir = tempfile.mkdtemp(prefix="billing_bench_")
+    try:
+        DATABASE_FILE = os.path.join(work_dir, "bench.db")
+        source = sqlite3.connect(db_path)
+        target = sqlite3.connect(DATABASE_FILE)
+        source.backup(target)
+        source.close(); target.close()
+        for file_name in registered_archive_files(db_path): # Archived years travel with the copy
+            shutil.copy2(os.path.join(os.path.dirname(os.path.abspath(db_path)), file_name), work_dir)
+        init_db()
+        load_data()
+        conn = db_connect()
+        first_day, last_day = conn.execute("SELECT MIN(date), MAX(date) FROM bills").fetchone()
+        last_day = last_day or datetime.date.today().strftime('%Y-%m-%d')
+        month_ago = (datetime.datetime.strptime(last_day, '%Y-%m-%d') - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
+        popular = conn.execute("SELECT name FROM bill_items GROUP BY name ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+        item_word = (popular[0] if popular else "item").split()[-1]
+        customer = conn.execute("SELECT customer FROM bills WHERE type = 'Sale' LIMIT 1").fetchone()
+        customer = customer[0] if customer else "Customer"
+
+        def typing(text):
+            """The queries refresh_table sees while text is typed, one keystroke at a time."""
+            last_bill_search.update(text=None, type=None, ids=None)
+            for end in range(1, len(text) + 1):
+                filter_bills(text[:end])
+
+        def add_some_bills():
+            for _ in range(add_bills):
+                item = next(iter(inventory.values()))
+                add_bill_db({"bill_no": None, "type": "Purchase", "customer": "Benchmark Supplier", "mode": "Cash",
+                             "grand_total": item["cost_price"],
+                             "items": [{"name": item["name"], "qty": 1, "price": item["cost_price"], "total": item["cost_price"]}]})
+
+        pdf_sample = fetch_bills_db("WHERE id IN (SELECT id FROM bills ORDER BY id DESC LIMIT ?)", (pdf_bills,))
+        cases = [
+            ("load_data", load_data),
+            ("search: customer (typed)", lambda: typing(customer)),
+            ("search: item (typed)", lambda: typing(item_word)),
+            ("search: type filter", lambda: filter_bills("", "Purchase")),
+            ("search: older bills (item)", lambda: search_bill_history(item_word)),
+            ("sales report: last 30 days", lambda: query_sales_report(month_ago, last_day)),
+            ("sales report: all time", lambda: query_sales_report(first_day or last_day, last_day)),
+            ("customer list", query_customer_list),
+            ("get_total_profit", get_total_profit),
+            (f"add_bill_db x{add_bills}", add_some_bills),
+            ("export bills (xlsx)", lambda: write_bills_excel(os.path.join(work_dir, "bills.xlsx"))),
+            ("export inventory (xlsx)", lambda: write_inventory_excel(os.path.join(work_dir, "inventory.xlsx"))),
+            (f"invoices: {len(pdf_sample)} combined pdf", lambda: render_invoice_batch(
+                pdf_sample, os.path.join(work_dir, "invoices.pdf"), business_profile, combined=True)),
+        ]
+        timings = {}
+        for name, func in cases:
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                runs.append(time.perf_counter() - start)
+            timings[name] = {"min_s": min(runs), "median_s": statistics.median(runs), "runs_s": runs}
+            print(f"{name:<32} min {min(runs):8.3f}s  median {statistics.median(runs):8.3f}s")
+        results = {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "database": os.path.abspath(db_path),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+            "data": {"bills": count_bills_db(), "bills_in_memory": len(bills), "products": len(inventory),
+                     "items": conn.execute("SELECT COUNT(*) FROM bill_items").fetchone()[0]},
+            "repeat": repeat,
+            "timings": timings,
+        }
     finally:
-        conn.close()
+        db_close()
+        DATABASE_FILE = original_db
+        shutil.rmtree(work_dir, ignore_errors=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return results
+
+def stress_bill_worker(db_path, count, worker_no):
+    """One stress-test process: posts `count` bills into db_path, each in its own transaction."""
+    global DATABASE_FILE
+    DATABASE_FILE = db_path
+    posted, errors = 0, []
+    for i in range(count):
+        bill = {"type": "Purchase" if i % 3 == 0 else "Sale", "customer": f"Counter {worker_no}",
+                "items": [{"name": f"Stress Item {i % 10}", "qty": 1, "price": 1}]}
+        try:
+            ids, rejected = post_bills([bill], check_stock=False)
+            posted += len(ids)
+            errors += [reason for _, reason in rejected]
+        except sqlite3.Error as e:
+            errors.append(str(e))
+    db_close()
+    return posted, errors
+
+def run_bill_number_stress(processes=4, bills_per_process=250, db_path=None):
+    """Posts bills from several processes at once into one database, then checks that every bill
+    was stored and that the new bill numbers are unique and follow on without gaps per type.
+    Returns a result dict."""
+    global DATABASE_FILE
+    original_db = DATABASE_FILE
+    work_dir = None
+    if db_path is None:
+        work_dir = tempfile.mkdtemp(prefix="billing_stress_")
+        db_path = os.path.join(work_dir, "stress.db")
+    try:
+        DATABASE_FILE = db_path
+        init_db()
+        conn = db_connect()
+        before = {row[0]: row[1] for row in conn.execute("SELECT type, MAX(bill_no) FROM bills GROUP BY type")}
+        db_close() # Workers open their own connections
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            outcomes = list(pool.map(stress_bill_worker, [db_path] * processes, [bills_per_process] * processes, range(processes)))
+        seconds = time.perf_counter() - start
+        conn = db_connect()
+        posted = sum(n for n, _ in outcomes)
+        errors = [e for _, errs in outcomes for e in errs]
+        result = {"processes": processes, "bills_posted": posted, "errors": len(errors), "error_samples": errors[:5],
+                  "seconds": seconds, "bills_per_second": posted / seconds if seconds else 0, "types": {}}
+        ok = not errors and posted == processes * bills_per_process
+        for row in conn.execute("""
+        SELECT b.type, COUNT(*), COUNT(DISTINCT b.bill_no), MAX(b.bill_no), s.last_no
+        FROM bills b LEFT JOIN bill_sequences s ON s.type = b.type GROUP BY b.type
+        """):
+            bill_type, count, distinct, high, last_no = tuple(row)
+            previous = before.get(bill_type) or 0
+            new = conn.execute("SELECT COUNT(*) FROM bills WHERE type = ? AND bill_no > ?", (bill_type, previous)).fetchone()[0]
+            gap_free = distinct == count and high == previous + new and last_no == high
+            ok = ok and gap_free
+            result["types"][bill_type] = {"bills": count, "new": new, "first_new_bill_no": previous + 1, "max_bill_no": high,
+                                          "sequence": last_no, "unique_and_gap_free": gap_free}
+        result["ok"] = ok
+    finally:
+        db_close()
+        DATABASE_FILE = original_db
+        if work_dir: shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"{processes} processes posted {posted} bills in {seconds:.2f}s ({result['bills_per_second']:.0f}/s), "
+          f"{len(errors)} errors")
+    for bill_type, info in result["types"].items():
+        print(f"  {bill_type:<9} {info['new']:>6} new bills, numbers {info['first_new_bill_no']}..{info['max_bill_no']}, "
+              f"sequence at {info['sequence']}: {'OK' if info['unique_and_gap_free'] else 'DUPLICATES OR GAPS'}")
+    print("PASS" if result["ok"] else "FAIL")
+    return result
+
+def run_totals_self_check(rounds=300, seed=1, db_path=None):
+    """Adds, edits and deletes bills (this month's and last month's), adjusts stock and imports product
+    files through the app's own functions, and after every step checks the running dashboard totals
+    against a full recompute and the stock ledger against inventory.stock. Returns a result dict."""
+    global DATABASE_FILE
+    original_db = DATABASE_FILE
+    work_dir = tempfile.mkdtemp(prefix="billing_selfcheck_") # Also holds the import files
+    if db_path is None:
+        db_path = os.path.join(work_dir, "selfcheck.db")
+    rng = random.Random(seed)
+    today = datetime.date.today()
+    last_month = today.replace(day=1) - datetime.timedelta(days=1)
+    names = [f"Check Item {n}" for n in range(20)]
+    def random_bill(bill_type=None, date=None):
+        items = [{"name": name, "qty": rng.randint(1, 5), "price": rng.randint(1, 5000) / 4}
+                 for name in rng.sample(names, rng.randint(1, 4))]
+        return normalize_posted_bill({"type": bill_type or rng.choice(["Sale", "Sale", "Purchase"]),
+                                      "customer": f"Customer {rng.randint(1, 30)}", "items": items, "date": date})
+    def product_file(step):
+        path = os.path.join(work_dir, f"products_{step}.csv")
+        rows = [[rng.choice(names) if rng.random() < 0.5 else f"Check Item {step}-{n}", rng.randint(0, 50), rng.randint(1, 400)]
+                for n in range(rng.randint(1, 6))]
+        rows.append(list(rows[0])) # A product listed twice in one file
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            csv.writer(f).writerows([["Name", "Stock", "Cost Price"]] + rows)
+        return path
+    counts = {"add": 0, "edit": 0, "delete": 0, "adjust": 0, "import": 0}
+    failures = []
+    try:
+        DATABASE_FILE = db_path
+        init_db()
+        # Last month's bills are outside the in-memory window, like older bills in the app
+        post_bills([random_bill(date=(last_month - datetime.timedelta(days=rng.randint(0, 20))).isoformat())
+                    for _ in range(40)], check_stock=False)
+        load_data()
+        for step in range(rounds):
+            action = rng.choice(["add", "add", "edit", "delete", "adjust", "import"])
+            older = rng.random() < 0.3
+            if older:
+                candidates = fetch_bills_db("WHERE date < ?", (bill_window_start(),))
+            else:
+                candidates = list(bills.values())
+            if action == "adjust":
+                update_stock_db(rng.choice(names), rng.choice([-1, 1]) * rng.randint(1, 10))
+            elif action == "import":
+                import_products(product_file(step))
+                load_inventory() # import_products leaves the in-memory inventory alone
+            elif action == "add" or not candidates:
+                action = "add"
+                add_bill_db(random_bill())
+            elif action == "edit":
+                original = rng.choice(candidates)
+                new_bill = random_bill()
+                new_bill["bill_no"] = original["bill_no"] if new_bill["type"] == original["type"] else None
+                edit_bill_db(original, new_bill)
+            else:
+                delete_bill_db(rng.choice(candidates))
+            counts[action] += 1
+            mismatches, ledger = verify_billing_totals(), verify_stock_ledger()
+            if mismatches or ledger:
+                failures.append({"step": step, "action": action, "older_bill": older and action in ("edit", "delete"),
+                                 "mismatches": mismatches, "ledger": ledger})
+        result = {"rounds": rounds, "actions": counts, "failures": len(failures), "failure_samples": failures[:5],
+                  "ok": not failures}
+    finally:
+        db_close()
+        DATABASE_FILE = original_db
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"{rounds} steps: " + ", ".join(f"{n} {action}" for action, n in counts.items()))
+    for failure in result["failure_samples"]:
+        print(f"  step {failure['step']} ({failure['action']}{', older bill' if failure['older_bill'] else ''}): "
+              + ", ".join([f"{key} tracked {tracked:.2f} != {actual:.2f}" for key, (tracked, actual) in failure["mismatches"].items()]
+                          + [f"'{key}' stock {stock} != ledger {moved}" for key, (stock, moved) in list(failure["ledger"].items())[:3]]))
+    print("PASS" if result["ok"] else f"FAIL ({len(failures)} steps left the dashboard totals or the stock ledger wrong)")
+    return result
+
+def run_backup_benchmark(db_path, seconds=3.0, out_path=None):
+    """Measures backups of a copy of db_path while a writer thread keeps posting one-line bills.
+
+    Write latency is sampled with no backup running, during a one-step copy and during the
+    throttled copy the app uses (BACKUP_PAGES_PER_STEP / BACKUP_STEP_SLEEP); each copy is taken
+    repeatedly for `seconds`. Reports copy throughput and write p50/p99/max per phase. Returns the results dict.
+    """
+    global DATABASE_FILE
+    original_db = DATABASE_FILE
+    work_dir = tempfile.mkdtemp(prefix="billing_backup_bench_")
+    try:
+        DATABASE_FILE = os.path.join(work_dir, "bench.db")
+        copy_database(db_path, DATABASE_FILE, pages=-1)
+        for file_name in registered_archive_files(db_path):
+            shutil.copy2(os.path.join(os.path.dirname(os.path.abspath(db_path)), file_name), work_dir)
+        init_db()
+        db_size = os.path.getsize(DATABASE_FILE)
+        phase = {"name": None, "samples": []}
+        stop = threading.Event()
+
+        def writer():
+            bill = {"type": "Sale", "customer": "Backup Bench", "items": [{"name": "Backup Bench Item", "qty": 1, "price": 1}]}
+            while not stop.is_set():
+                start = time.perf_counter()
+                post_bills([bill], check_stock=False)
+                if phase["name"]: phase["samples"].append(time.perf_counter() - start)
+                time.sleep(0.002)
+            db_close()
+
+        def run_phase(name, pages=None, step_sleep=0):
+            phase["name"], phase["samples"] = name, []
+            copies, copy_seconds, deadline = 0, 0.0, time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                if pages is None:
+                    time.sleep(0.05); continue
+                target = os.path.join(work_dir, "copy.db")
+                start = time.perf_counter()
+                copy_database(DATABASE_FILE, target, pages, step_sleep)
+                copy_seconds += time.perf_counter() - start
+                copies += 1
+                os.remove(target)
+            phase["name"] = None
+            result = {"writes": latency_summary(phase["samples"])}
+            if copies:
+                result.update(copies=copies, seconds_per_copy=round(copy_seconds / copies, 3),
+                              mb_per_second=round(db_size / 1e6 * copies / copy_seconds, 1))
+            return result
+
+        thread = threading.Thread(target=writer, daemon=True)
+        thread.start()
+        try:
+            phases = {"no backup": run_phase("no backup"),
+                      "one step": run_phase("one step", pages=-1),
+                      f"{BACKUP_PAGES_PER_STEP} pages/step, {BACKUP_STEP_SLEEP * 1000:g} ms pause":
+                          run_phase("throttled", BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP)}
+        finally:
+            stop.set()
+            thread.join()
+        start = time.perf_counter()
+        backup = backup_database(keep=1)
+        backup.update(total_seconds=round(time.perf_counter() - start, 3), verified=True)
+        results = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "database": os.path.abspath(db_path),
+                   "db_mb": round(db_size / 1e6, 1), "sqlite": sqlite3.sqlite_version, "phases": phases,
+                   "backup": {k: v for k, v in backup.items() if k not in ("folder", "removed")}}
+    finally:
+        db_close()
+        DATABASE_FILE = original_db
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Database {results['db_mb']} MB")
+    print(f"{'':<28} {'copies':>6} {'s/copy':>7} {'MB/s':>7} {'writes':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, result in phases.items():
+        writes = result["writes"]
+        print(f"{name:<28} {result.get('copies', ''):>6} {result.get('seconds_per_copy', ''):>7} {result.get('mb_per_second', ''):>7} "
+              f"{writes['count']:>7} {writes.get('p50_ms', ''):>8} {writes.get('p99_ms', ''):>8} {writes.get('max_ms', ''):>8}")
+    print(f"Full backup with verify: {results['backup']['total_seconds']}s "
+          f"(copy {results['backup']['copy_seconds']:.2f}s, integrity check {results['backup']['verify_seconds']:.2f}s)")
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
 
 # ----------------------------------------------------------------------
 # ------------------- PART 2: CORE APP LOGIC ---------------------------
@@ -534,23 +2633,126 @@ def set_status(text, timeout=3000):
         if timeout:
             root.after(timeout, lambda: status_lbl.config(text="Ready"))
 
+# --- Background jobs (exports, PDFs) ---
+# Jobs run on a small worker pool so the counter stays usable. Workers never touch Tk: they post
+# progress and results to job_events, which poll_jobs applies on the Tk thread via root.after.
+class JobCancelled(Exception):
+    pass
+
+class Job:
+    """One background task. The work function calls job.progress(), which also stops it once cancelled."""
+    def __init__(self, title, on_done=None):
+        self.id = next(job_ids)
+        self.title = title
+        self.on_done = on_done # Called on the Tk thread with the work function's result
+        self.cancelled = threading.Event()
+        self.last_post = 0
+
+    def progress(self, done, total=None):
+        if self.cancelled.is_set():
+            raise JobCancelled()
+        now = time.monotonic()
+        if now - self.last_post >= JOB_POLL_MS / 1000: # Cheap to call per row
+            self.last_post = now
+            job_events.put((self, "progress", (done, total)))
+
+def run_job(title, func, *args, on_done=None):
+    """Runs func(job, *args) on the worker pool and returns the Job."""
+    global job_pool
+    if job_pool is None:
+        job_pool = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+    job = Job(title, on_done)
+    def work():
+        try:
+            job_events.put((job, "done", func(job, *args)))
+        except JobCancelled:
+            job_events.put((job, "cancelled", None))
+        except Exception as e:
+            job_events.put((job, "failed", e))
+    active_jobs[job.id] = job
+    if len(active_jobs) == 1:
+        root.after(JOB_POLL_MS, poll_jobs)
+    job_pool.submit(work)
+    set_status(f"{title}...", timeout=0)
+    update_job_controls()
+    return job
+
+def poll_jobs():
+    """Applies queued job events on the Tk thread; reschedules itself while jobs are running."""
+    while True:
+        try:
+            job, kind, payload = job_events.get_nowait()
+        except queue.Empty:
+            break
+        if kind == "progress":
+            done, total = payload
+            set_status(f"{job.title}: {done:,}" + (f" of {total:,}" if total else ""), timeout=0)
+            continue
+        active_jobs.pop(job.id, None)
+        update_job_controls()
+        if kind == "done":
+            if job.on_done: job.on_done(payload)
+        elif kind == "cancelled":
+            set_status(f"{job.title} cancelled")
+        else:
+            set_status(f"{job.title} failed")
+            messagebox.showerror("Background Job Failed", f"{job.title} failed: {payload}")
+    if active_jobs:
+        root.after(JOB_POLL_MS, poll_jobs)
+
+def cancel_jobs():
+    for job in active_jobs.values():
+        job.cancelled.set()
+    if active_jobs:
+        set_status("Cancelling...", timeout=0)
+
+def update_job_controls():
+    """Shows the status bar's Cancel button only while jobs are running."""
+    if not cancel_jobs_btn: return
+    if active_jobs:
+        cancel_jobs_btn.config(text=f"✖ Cancel ({len(active_jobs)})")
+        cancel_jobs_btn.pack(side="right")
+    else:
+        cancel_jobs_btn.pack_forget()
+
+def poll_db_changes():
+    """Tk timer: picks up changes other instances or scripts made and refreshes only the affected views."""
+    root.after(CHANGE_POLL_MS, poll_db_changes)
+    try:
+        changes = sync_db_changes()
+    except sqlite3.Error as e:
+        set_status(f"Could not check the database for changes: {e}", timeout=3000)
+        return
+    if not changes: return
+    if changes["full"] or changes["bills"]:
+        on_filter_change()
+        update_billing_summary()
+    if changes["full"]:
+        refresh_after_stock_change()
+    elif changes["inventory"]:
+        refresh_after_stock_change(changes["inventory"])
+    elif changes["bills"]:
+        update_main_dashboard_summary() # Profit comes from the bills
+    set_status(f"Updated from the database: {len(changes['bills'])} bills, {len(changes['inventory'])} products changed"
+               if not changes["full"] else "Reloaded from the database", timeout=2500)
+
+def on_app_close():
+    """Stops running jobs before closing so exit does not wait for a long export."""
+    cancel_jobs()
+    root.destroy()
+
 def update_all_summaries():
     """Calls all summary update functions."""
     update_billing_summary()
     update_main_dashboard_summary()
 
 def update_billing_summary():
-    """Updates the billing dashboard cards."""
-    total_sales = sum(b.get("grand_total", 0) for b in bills if b["type"] == "Sale")
-    total_purchases = sum(b.get("grand_total", 0) for b in bills if b["type"] == "Purchase")
+    """Updates the billing dashboard cards from the running totals (no DB scan)."""
+    if billing_totals["day"] != datetime.date.today().strftime('%Y-%m-%d'):
+        reset_billing_totals()
+    total_sales, total_purchases = billing_totals["Sale"], billing_totals["Purchase"]
     net = total_sales - total_purchases
-    
-    # --- NEW: Get sales for today and this month ---
-    today = datetime.date.today().strftime('%Y-%m-%d')
-    month_start = datetime.date.today().strftime('%Y-%m-01')
-    
-    today_sales = get_sales_for_period(today, today)
-    month_sales = get_sales_for_period(month_start, today)
+    today_sales, month_sales = billing_totals["today_sales"], billing_totals["month_sales"]
     
     if lbl_total_sales: lbl_total_sales.config(text=format_currency(total_sales))
     if lbl_total_purchases: lbl_total_purchases.config(text=format_currency(total_purchases))
@@ -577,6 +2779,10 @@ def clear_entries():
     if mode_entry: mode_entry.delete(0, tk.END)
     if type_var: type_var.set("Sale")
     clear_current_items()
+    # The form no longer shows a bill: Update/Delete need a new selection, and clicking the same row reloads it
+    bill_table["selected"] = None
+    if tree:
+        tree.selection_remove(tree.selection()); tree.focus("")
 
 def validate_integer(P):
     if P == "" or P == "-": return True
@@ -676,38 +2882,126 @@ def clear_current_items():
     current_items.clear(); refresh_items_tree()
 
 # --- MAIN TABLE ---
-def first_item_display(b):
+def first_item_display(b, match=""):
+    """The first item, or while searching the first item containing the search text, plus how many more."""
     items = b.get("items")
     if items:
-        return f"{items[0]['name']} (+{len(items)-1} more)" if len(items) > 1 else items[0]["name"]
+        shown = next((it for it in items if match in it["name"].lower()), items[0]) if match else items[0]
+        return f"{shown['name']} (+{len(items)-1} more)" if len(items) > 1 else shown["name"]
     return ""
 
+def filter_bills(filter_text="", filter_type="All"):
+    """In-memory bills matching the search, through the index (older bills: see search_older_bills)."""
+    return [bills[bid] for bid in filter_bill_ids(filter_text, filter_type)]
+
 def refresh_table(filter_text="", filter_type="All"):
+    """Re-filters the bills and re-renders the visible window of the (virtual) bills table."""
     if not tree: return
-    for i in tree.get_children():
-        tree.delete(i)
+    bill_table["rows"] = filter_bills(filter_text, filter_type)
+    bill_table["match"] = filter_text.lower()
+    bill_table["offset"] = 0
+    bill_table["history_job"] = None # Results of an earlier search are dropped
+    render_bill_rows()
+    update_billing_summary()
+    if len(filter_text) >= 3: # Shorter texts would need a LIKE scan over every older bill item
+        search_older_bills(filter_text, filter_type)
+
+def search_older_bills(filter_text, filter_type="All"):
+    """Searches the bills older than the window on the worker pool and adds them above the
+    in-memory matches once found, unless the table was re-filtered in the meantime."""
+    def found(older):
+        if bill_table["history_job"] is not job: return
+        bill_table["history_job"] = None
+        for bill in older:
+            remember_history_bill(bill)
+        bill_table["rows"] = older + bill_table["rows"]
+        render_bill_rows()
+        set_status(f"{len(older)} older bills found" if older else "No older bills found")
+    job = run_job("Searching older bills", lambda job: search_bill_history(filter_text, filter_type), on_done=found)
+    bill_table["history_job"] = job
+
+def visible_bill_rows():
+    """Number of rows the Treeview can show at its current size."""
+    height = tree.winfo_height() if tree.winfo_ismapped() else 0
+    return max(int(tree.cget("height")), (height - TREE_ROW_HEIGHT) // TREE_ROW_HEIGHT)
+
+def render_bill_rows():
+    """Materializes only the rows in view (plus a small buffer) and syncs the scrollbar."""
+    if not tree: return
+    rows, visible = bill_table["rows"], visible_bill_rows()
+    bill_table["visible"] = visible
+    offset = max(0, min(bill_table["offset"], len(rows) - visible))
+    bill_table["offset"] = offset
     
-    filtered = bills
-    if filter_type in ("Sale", "Purchase"):
-        filtered = [b for b in filtered if b["type"] == filter_type]
-    if filter_text:
-        ft = filter_text.lower()
-        filtered = [b for b in filtered if (ft in str(b["bill_no"]).lower()
-                        or ft in b.get("customer", "").lower()
-                        or ft in first_item_display(b).lower())]
-                        
-    for idx, b in enumerate(filtered, start=1):
+    children = tree.get_children()
+    if children: tree.delete(*children)
+    for idx, b in enumerate(rows[offset:offset + visible + VIRTUAL_BUFFER_ROWS], start=offset + 1):
         tag = "even" if idx % 2 == 0 else "odd"
         tree.insert("", tk.END, values=(
             idx, b["bill_no"], b["type"], b.get("customer", ""),
-            first_item_display(b),
+            first_item_display(b, bill_table["match"]),
             sum(it.get("qty", 0) for it in b.get("items", [])),
             format_currency(b.get("grand_total", 0)),
             b.get("mode", ""),
             b.get("date", "") # --- NEW: Show date
         ), tags=(tag,), iid=b['id'])
+    tree.yview_moveto(0) # The first materialized row is always the top visible row
     
-    update_billing_summary()
+    selected = bill_table["selected"]
+    if selected is not None and tree.exists(selected):
+        tree.selection_set(selected); tree.focus(selected)
+    if bill_table["vsb"]:
+        total = max(len(rows), 1)
+        bill_table["vsb"].set(offset / total, min(1.0, (offset + visible) / total))
+
+def scroll_bill_table(delta_rows):
+    new_offset = max(0, min(bill_table["offset"] + delta_rows, len(bill_table["rows"]) - bill_table["visible"]))
+    if new_offset != bill_table["offset"]:
+        bill_table["offset"] = new_offset
+        render_bill_rows()
+
+def on_bill_scrollbar(action, *args):
+    """Scrollbar command: 'moveto fraction' or 'scroll n units|pages'."""
+    if action == "moveto":
+        bill_table["offset"] = int(float(args[0]) * len(bill_table["rows"]))
+        render_bill_rows()
+    elif action == "scroll":
+        step = bill_table["visible"] if args[1] == "pages" else 1
+        scroll_bill_table(int(args[0]) * step)
+
+def on_bill_mousewheel(event):
+    if getattr(event, "num", None) in (4, 5):
+        scroll_bill_table(-3 if event.num == 4 else 3)
+    else:
+        scroll_bill_table(-3 if event.delta > 0 else 3)
+    return "break"
+
+def on_bill_key(event):
+    """Keeps keyboard navigation working past the edges of the materialized rows."""
+    rows = bill_table["rows"]
+    sel = tree.focus()
+    if not rows or not sel: return None
+    offset, visible = bill_table["offset"], bill_table["visible"]
+    ids = [b['id'] for b in rows[offset:offset + visible + VIRTUAL_BUFFER_ROWS]]
+    step = {"Up": -1, "Down": 1, "Prior": -visible, "Next": visible}[event.keysym]
+    if event.keysym in ("Up", "Down") and int(sel) in ids[1:visible - 1]:
+        return None # Plain move inside the visible rows: let the Treeview handle it
+    position = offset + (ids.index(int(sel)) if int(sel) in ids else 0)
+    target = max(0, min(position + step, len(rows) - 1))
+    if target == position: return "break"
+    if target < bill_table["offset"]:
+        bill_table["offset"] = target
+    elif target >= bill_table["offset"] + bill_table["visible"]:
+        bill_table["offset"] = target - bill_table["visible"] + 1
+    bill_table["selected"] = None # Let on_row_select load the newly selected bill
+    render_bill_rows()
+    target_id = rows[target]['id']
+    tree.selection_set(target_id); tree.focus(target_id); tree.see(target_id)
+    return "break"
+
+def on_bill_table_resize(event):
+    if visible_bill_rows() != bill_table["visible"]:
+        render_bill_rows()
 
 # --- FORM DATA ---
 def get_form_data():
@@ -752,18 +3046,16 @@ def get_form_data():
 
 # --- FIX: Fixed 'billNo' vs 'bill_no' and reset filters ---
 def add_bill():
-    global sale_count, purchase_count
     data = get_form_data()
     if not data: return
     
-    if data["type"] == "Sale":
-        sale_count += 1; bill_no = sale_count
-    else:
-        purchase_count += 1; bill_no = purchase_count
-        
-    bill_data = {"bill_no": bill_no, **data} # --- FIX: Use 'bill_no'
+    bill_data = {"bill_no": None, **data} # Numbered by add_bill_db, in its transaction
     
-    add_bill_db(bill_data)
+    try:
+        add_bill_db(bill_data)
+    except sqlite3.Error as e:
+        messagebox.showerror("Database Error", f"Failed to add bill: {e}"); return
+    bill_no = bill_data['bill_no']
     
     # --- FIX: Reset filters to ensure new bill is visible ---
     if filter_entry: filter_entry.delete(0, tk.END)
@@ -782,12 +3074,13 @@ def on_row_select(event):
     if not sel: return
     
     bill_id = int(sel)
-    bill = next((b for b in bills if b["id"] == bill_id), None)
-    
-    if not bill:
-        clear_entries(); return
-
+    if bill_id == bill_table["selected"]:
+        return # Same bill re-selected while re-rendering the virtual table
+    bill = get_bill(bill_id)
     clear_entries()
+    if not bill: return
+    bill_table["selected"] = bill_id
+    tree.selection_set(bill_id); tree.focus(bill_id) # clear_entries dropped them
     type_var.set(bill["type"])
     customer_entry.insert(0, bill["customer"])
     
@@ -806,14 +3099,14 @@ def on_row_select(event):
 # --- FIX: Fixed 'billNo' vs 'bill_no' and reset filters ---
 def edit_bill():
     if not tree: return
-    sel = tree.focus()
-    if not sel:
+    sel = bill_table["selected"]
+    if sel is None:
         messagebox.showwarning("Select", "Select a bill to edit."); return
         
-    bill_id = int(sel)
-    original_bill = next((b for b in bills if b["id"] == bill_id), None)
+    bill_id = sel
+    original_bill = get_bill(bill_id)
     if not original_bill:
-        messagebox.showerror("Not Found", "Bill not found in memory."); return
+        messagebox.showerror("Not Found", "Bill not found."); return
 
     new_data = get_form_data()
     if not new_data: return
@@ -822,13 +3115,12 @@ def edit_bill():
     if new_data['type'] == original_bill['type']:
         new_data['bill_no'] = original_bill['bill_no']
     else:
-        global sale_count, purchase_count
-        if new_data["type"] == "Sale":
-            sale_count += 1; new_data['bill_no'] = sale_count
-        else:
-            purchase_count += 1; new_data['bill_no'] = purchase_count
+        new_data['bill_no'] = None # Allocated by edit_bill_db
     
-    edit_bill_db(original_bill, new_data)
+    try:
+        edit_bill_db(original_bill, new_data)
+    except sqlite3.Error as e:
+        messagebox.showerror("Database Error", f"Failed to update bill: {e}"); return
     
     # --- FIX: Reset filters ---
     if filter_entry: filter_entry.delete(0, tk.END)
@@ -844,20 +3136,24 @@ def edit_bill():
 # --- FIX: Reset filters on delete ---
 def delete_bill():
     if not tree: return
-    sel = tree.focus()
-    if not sel:
+    sel = bill_table["selected"]
+    if sel is None:
         messagebox.showwarning("Select", "Select a bill to delete."); return
         
-    bill_id = int(sel)
-    bill_to_delete = next((b for b in bills if b["id"] == bill_id), None)
+    bill_id = sel
+    bill_to_delete = get_bill(bill_id)
     if not bill_to_delete:
-        messagebox.showerror("Not Found", "Bill not found in memory."); return
+        messagebox.showerror("Not Found", "Bill not found."); return
         
     bill_no, bill_type = bill_to_delete['bill_no'], bill_to_delete['type']
     
     if not messagebox.askyesno("Confirm", f"Delete {bill_type} Bill #{bill_no}?"): return
     
-    delete_bill_db(bill_to_delete)
+    try:
+        delete_bill_db(bill_to_delete)
+    except sqlite3.Error as e:
+        messagebox.showerror("Database Error", f"Failed to delete bill: {e}"); return
+    bill_table["selected"] = None
     
     # --- FIX: Reset filters ---
     if filter_entry: filter_entry.delete(0, tk.END)
@@ -875,13 +3171,13 @@ def delete_bill():
 def create_invoice_pdf():
     if not tree:
         return
-    sel = tree.focus()
-    if not sel:
+    sel = bill_table["selected"]
+    if sel is None:
         messagebox.showwarning("Select Bill", "Select a bill to create invoice.")
         return
 
-    bill_id = int(sel)
-    bill_data = next((b for b in bills if b["id"] == bill_id), None)
+    bill_id = sel
+    bill_data = get_bill(bill_id)
     if not bill_data:
         messagebox.showerror("Not Found", "Bill data not found.")
         return
@@ -895,137 +3191,306 @@ def create_invoice_pdf():
     if not fpath:
         return
 
-    # --- Font setup ---
+    def invoice_done(_):
+        messagebox.showinfo("Invoice Created", f"✅ Invoice PDF saved as {os.path.basename(fpath)}")
+        set_status(f"Invoice PDF created for Bill #{bill_data['bill_no']}")
+    # Snapshot the bill and profile: the worker must not see later edits half-applied
+    run_job(f"Creating invoice #{bill_data['bill_no']}", write_invoice_pdf, dict(bill_data), fpath, dict(business_profile),
+            on_done=invoice_done)
+
+def write_invoice_pdf(job, bill_data, fpath, business_profile):
+    """Builds one invoice PDF (runs on a job worker, so no Tk calls here)."""
+    job.progress(0, 1)
+    InvoiceRenderer.shared(business_profile).render(bill_data, fpath)
+
+# --- Invoice rendering (fonts and styles set up once, reused for every invoice) ---
+invoice_fonts = None # (regular, bold) font names, registered once per process
+
+def register_invoice_fonts():
+    """Registers DejaVu Sans once and returns (font, bold_font); Helvetica if the TTF is missing."""
+    global invoice_fonts
+    if invoice_fonts: return invoice_fonts
     try:
         font_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DejaVuSans.ttf")
         if not os.path.exists(font_path):
-            font_path = "DejaVuSans.ttf"
+            font_path = "DejaVuSans.ttf" # Let reportlab search its font path
         pdfmetrics.registerFont(TTFont('DejaVuSans', font_path))
-        bold_font_path = font_path.replace("Sans.ttf", "Sans-Bold.ttf")
-        if os.path.exists(bold_font_path):
-            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', bold_font_path))
-        active_font = 'DejaVuSans'
-        active_font_bold = 'DejaVuSans-Bold'
+        bold = 'DejaVuSans'
+        try:
+            pdfmetrics.registerFont(TTFont('DejaVuSans-Bold', font_path.replace("Sans.ttf", "Sans-Bold.ttf")))
+            bold = 'DejaVuSans-Bold'
+        except Exception:
+            pass # No bold face: fall back to the regular one instead of failing every invoice
+        # <b> in paragraphs maps through the font family
+        addMapping('DejaVuSans', 0, 0, 'DejaVuSans'); addMapping('DejaVuSans', 1, 0, bold)
+        addMapping('DejaVuSans', 0, 1, 'DejaVuSans'); addMapping('DejaVuSans', 1, 1, bold)
+        invoice_fonts = ('DejaVuSans', bold)
     except Exception:
-        active_font = 'Helvetica'
-        active_font_bold = 'Helvetica-Bold'
-
-    # --- PDF setup ---
-    doc = SimpleDocTemplate(
-        fpath, pagesize=A4,
-        topMargin=0.5 * inch, bottomMargin=0.5 * inch,
-        leftMargin=0.5 * inch, rightMargin=0.5 * inch
-    )
-    styles = getSampleStyleSheet()
-
-    # --- Custom styles (safe add) ---
-    def add_style_safe(name, **kwargs):
-        if name not in styles:
+        invoice_fonts = ('Helvetica', 'Helvetica-Bold')
+    return invoice_fonts
+
+class InvoiceRenderer:
+    """Lays out invoice PDFs for one business profile; build once and reuse for any number of bills."""
+    _shared = {} # {profile items: renderer}, one per process
+
+    def __init__(self, profile):
+        self.profile = dict(profile)
+        self.font, self.font_bold = register_invoice_fonts()
+        self.styles = styles = getSampleStyleSheet()
+        def add_style(name, **kwargs):
             styles.add(ParagraphStyle(name=name, **kwargs))
-        else:
-            for k, v in kwargs.items():
-                setattr(styles[name], k, v)
-
-    add_style_safe('CustomTitle', fontName=active_font_bold, fontSize=20,
-                   alignment=0, textColor=colors.HexColor(ACCENT))
-    add_style_safe('BusinessInfo', fontName=active_font, fontSize=10, alignment=0)
-    add_style_safe('InvoiceHeader', fontName=active_font_bold, fontSize=12, alignment=2)
-    add_style_safe('BillTo', fontName=active_font, fontSize=10, alignment=0)
-    add_style_safe('TotalText', fontName=active_font_bold, fontSize=12, alignment=2)
-    add_style_safe('TotalAmount', fontName=active_font_bold, fontSize=12,
-                   alignment=2, textColor=colors.HexColor(ACCENT))
-    add_style_safe('Footer', fontName=active_font, fontSize=9, alignment=1)
-
-    elements = []
-
-    # --- Header ---
-    header_data = [
-        [Paragraph(business_profile['name'], styles['CustomTitle']),
-         Paragraph(f"INVOICE / {bill_data['type'].upper()}", styles['InvoiceHeader'])],
-        [Paragraph(business_profile['address'], styles['BusinessInfo']),
-         Paragraph(f"<b>Bill No:</b> {bill_data['bill_no']}", styles['BusinessInfo'])],
-        [Paragraph(f"Phone: {business_profile['phone']}", styles['BusinessInfo']),
-         Paragraph(f"<b>Date:</b> {bill_data.get('date', 'N/A')}", styles['BusinessInfo'])],
-        [Paragraph(f"GSTIN: {business_profile['gstin']}", styles['BusinessInfo']),
-         Paragraph(f"<b>Mode:</b> {bill_data['mode']}", styles['BusinessInfo'])]
-    ]
-    header_table = Table(header_data, colWidths=[3.5 * inch, 3.5 * inch])
-    header_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (1, 0), (1, -1), 'RIGHT')
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 0.25 * inch))
-
-    # --- Bill To section ---
-    bill_to_data = [
-        [Paragraph("<b>BILL TO:</b>", styles['BillTo'])],
-        [Paragraph(bill_data['customer'], styles['BillTo'])]
-    ]
-    bill_to_table = Table(bill_to_data, colWidths=[doc.width])
-    bill_to_table.setStyle(TableStyle([
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey)
-    ]))
-    elements.append(bill_to_table)
-    elements.append(Spacer(1, 0.25 * inch))
-
-    # --- Items Table ---
-    data = [["S.No", "Item Description", "Qty", "Price (Rs.)", "Total (Rs.)"]]
-    for i, it in enumerate(bill_data.get("items", []), start=1):
-        data.append([
-            str(i),
-            Paragraph(it["name"], styles['BodyText']),
-            str(it["qty"]),
-            format_currency(it["price"]),
-            format_currency(it["total"])
+        add_style('CustomTitle', fontName=self.font_bold, fontSize=20,
+                  alignment=0, textColor=colors.HexColor(ACCENT))
+        add_style('BusinessInfo', fontName=self.font, fontSize=10, alignment=0)
+        add_style('InvoiceHeader', fontName=self.font_bold, fontSize=12, alignment=2)
+        add_style('BillTo', fontName=self.font, fontSize=10, alignment=0)
+        add_style('TotalText', fontName=self.font_bold, fontSize=12, alignment=2)
+        add_style('TotalAmount', fontName=self.font_bold, fontSize=12,
+                  alignment=2, textColor=colors.HexColor(ACCENT))
+        add_style('Footer', fontName=self.font, fontSize=9, alignment=1)
+        self.header_style = TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT')
+        ])
+        self.bill_to_style = TableStyle([
+            ('BOX', (0, 0), (-1, -1), 0.5, colors.grey)
+        ])
+        self.items_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, 0), self.font_bold),
+            ('FONTNAME', (0, 1), (-1, -1), self.font),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(ACCENT)),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            ('ALIGN', (2, 1), (2, -1), 'CENTER'),
+            ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+            ('TOPPADDING', (0, 0), (-1, -1), 6)
+        ])
+        self.total_style = TableStyle([
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (-1, -1), 'RIGHT')
         ])
 
-    table = Table(data, colWidths=[0.5 * inch, 3.5 * inch, 0.75 * inch, 1.15 * inch, 1.15 * inch])
-    table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), active_font_bold),
-        ('FONTNAME', (0, 1), (-1, -1), active_font),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor(ACCENT)),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('ALIGN', (0, 1), (0, -1), 'CENTER'),
-        ('ALIGN', (2, 1), (2, -1), 'CENTER'),
-        ('ALIGN', (3, 1), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('TOPPADDING', (0, 0), (-1, -1), 6)
-    ]))
-    elements.append(table)
-
-    # --- Totals ---
-    total_data = [
-        [Paragraph("Grand Total:", styles['TotalText']),
-         Paragraph(format_currency(bill_data.get("grand_total", 0)), styles['TotalAmount'])]
-    ]
-    total_table = Table(total_data, colWidths=[5.5 * inch, 1.5 * inch])
-    total_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT')
-    ]))
-    elements.append(Spacer(1, 0.2 * inch))
-    elements.append(total_table)
-
-    # --- Footer ---
-    elements.append(Spacer(1, 0.5 * inch))
-    elements.append(Paragraph("THANK YOU FOR YOUR BUSINESS!", styles['Footer']))
-
-    def add_footer(canvas, doc):
+    @classmethod
+    def shared(cls, profile):
+        """Returns this process's renderer for the profile, building it on first use."""
+        key = tuple(sorted(profile.items()))
+        if key not in cls._shared:
+            cls._shared = {key: cls(profile)} # The profile rarely changes; keep only the latest
+        return cls._shared[key]
+
+    def new_doc(self, fpath):
+        return SimpleDocTemplate(
+            fpath, pagesize=A4,
+            topMargin=0.5 * inch, bottomMargin=0.5 * inch,
+            leftMargin=0.5 * inch, rightMargin=0.5 * inch
+        )
+
+    def add_footer(self, canvas, doc):
         canvas.saveState()
-        canvas.setFont(active_font, 9)
+        canvas.setFont(self.font, 9)
         canvas.drawCentredString(A4[0] / 2, 0.25 * inch,
-                                f"Page {doc.page} | {business_profile['name']}")
+                                 f"Page {doc.page} | {self.profile['name']}")
         canvas.restoreState()
 
-    # --- Build PDF ---
-    doc.build(elements, onFirstPage=add_footer, onLaterPages=add_footer)
-    messagebox.showinfo("Invoice Created", f"✅ Invoice PDF saved as {os.path.basename(fpath)}")
-    set_status(f"Invoice PDF created for Bill #{bill_data['bill_no']}")
+    def invoice_elements(self, bill_data, width):
+        """Returns the flowables for one invoice."""
+        styles, profile = self.styles, self.profile
+        elements = []
+
+        # --- Header ---
+        header_data = [
+            [Paragraph(profile['name'], styles['CustomTitle']),
+             Paragraph(f"INVOICE / {bill_data['type'].upper()}", styles['InvoiceHeader'])],
+            [Paragraph(profile['address'], styles['BusinessInfo']),
+             Paragraph(f"<b>Bill No:</b> {bill_data['bill_no']}", styles['BusinessInfo'])],
+            [Paragraph(f"Phone: {profile['phone']}", styles['BusinessInfo']),
+             Paragraph(f"<b>Date:</b> {bill_data.get('date', 'N/A')}", styles['BusinessInfo'])],
+            [Paragraph(f"GSTIN: {profile['gstin']}", styles['BusinessInfo']),
+             Paragraph(f"<b>Mode:</b> {bill_data['mode']}", styles['BusinessInfo'])]
+        ]
+        header_table = Table(header_data, colWidths=[3.5 * inch, 3.5 * inch])
+        header_table.setStyle(self.header_style)
+        elements.append(header_table)
+        elements.append(Spacer(1, 0.25 * inch))
+
+        # --- Bill To section ---
+        bill_to_data = [
+            [Paragraph("<b>BILL TO:</b>", styles['BillTo'])],
+            [Paragraph(bill_data['customer'], styles['BillTo'])]
+        ]
+        bill_to_table = Table(bill_to_data, colWidths=[width])
+        bill_to_table.setStyle(self.bill_to_style)
+        elements.append(bill_to_table)
+        elements.append(Spacer(1, 0.25 * inch))
+
+        # --- Items Table ---
+        data = [["S.No", "Item Description", "Qty", "Price (Rs.)", "Total (Rs.)"]]
+        for i, it in enumerate(bill_data.get("items", []), start=1):
+            data.append([
+                str(i),
+                Paragraph(it["name"], styles['BodyText']),
+                str(it["qty"]),
+                format_currency(it["price"]),
+                format_currency(it["total"])
+            ])
+        table = Table(data, colWidths=[0.5 * inch, 3.5 * inch, 0.75 * inch, 1.15 * inch, 1.15 * inch])
+        table.setStyle(self.items_style)
+        elements.append(table)
+
+        # --- Totals ---
+        total_data = [
+            [Paragraph("Grand Total:", styles['TotalText']),
+             Paragraph(format_currency(bill_data.get("grand_total", 0)), styles['TotalAmount'])]
+        ]
+        total_table = Table(total_data, colWidths=[5.5 * inch, 1.5 * inch])
+        total_table.setStyle(self.total_style)
+        elements.append(Spacer(1, 0.2 * inch))
+        elements.append(total_table)
+
+        # --- Footer ---
+        elements.append(Spacer(1, 0.5 * inch))
+        elements.append(Paragraph("THANK YOU FOR YOUR BUSINESS!", styles['Footer']))
+        return elements
+
+    def render(self, bill_data, fpath):
+        """Writes one invoice to fpath."""
+        doc = self.new_doc(fpath)
+        doc.build(self.invoice_elements(bill_data, doc.width), onFirstPage=self.add_footer, onLaterPages=self.add_footer)
+
+    def render_combined(self, bills_to_render, fpath, progress=None):
+        """Writes all invoices into one PDF, each starting on a new page; returns how many."""
+        doc = self.new_doc(fpath)
+        elements = []
+        count = 0
+        for bill_data in bills_to_render:
+            if elements: elements.append(PageBreak())
+            elements.extend(self.invoice_elements(bill_data, doc.width))
+            count += 1
+            if progress: progress(count)
+        doc.build(elements, onFirstPage=self.add_footer, onLaterPages=self.add_footer)
+        return count
+
+# --- Batch invoices ---
+invoice_worker = None # This worker process's InvoiceRenderer
+
+def init_invoice_worker(profile):
+    global invoice_worker
+    invoice_worker = InvoiceRenderer(profile)
+
+def render_invoice_in_worker(task):
+    bill_data, fpath = task
+    invoice_worker.render(bill_data, fpath)
+
+def invoice_file_name(bill_data):
+    return f"Invoice_{bill_data['type']}_{bill_data['bill_no']}_{bill_data['id']}.pdf" # Bill numbers can repeat
+
+def query_invoice_bills(start_date, end_date, bill_type="All", text=""):
+    """Bills dated start_date..end_date (YYYY-MM-DD, inclusive), optionally of one type and matching
+    text in the bill no, customer or an item name (like the bill search)."""
+    like = f"%{text.lower()}%"
+    found = []
+    for schema in bill_sources(start_date, end_date):
+        found += fetch_bills_db("""WHERE date BETWEEN ? AND ? AND (? = 'All' OR type = ?)
+            AND (? = '' OR CAST(bill_no AS TEXT) LIKE ? OR lower(customer) LIKE ?
+                 OR id IN (SELECT bill_id FROM {schema}.bill_items WHERE lower(name) LIKE ?))""",
+            (start_date, end_date, bill_type, bill_type, text, like, like, like), schema)
+    return found
+
+def render_invoice_batch(bills_to_render, out_path, profile, combined=False, workers=INVOICE_BATCH_WORKERS, progress=None):
+    """Renders invoices for many bills; returns {"invoices", "seconds", "per_second"}.
+
+    Separate files (one per bill in the out_path folder) are spread over a process pool whose workers
+    each build their renderer once. A combined PDF is a single document, so it is laid out here.
+    """
+    start = time.perf_counter()
+    # Plain dicts pickle cheaply to the workers
+    bills_to_render = [dict(b, items=[dict(it) for it in b.get("items", [])]) for b in bills_to_render]
+    if combined:
+        count = InvoiceRenderer(profile).render_combined(bills_to_render, out_path, progress)
+    else:
+        os.makedirs(out_path, exist_ok=True)
+        tasks = [(b, os.path.join(out_path, invoice_file_name(b))) for b in bills_to_render]
+        count = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_invoice_worker, initargs=(dict(profile),)) as pool:
+            try:
+                for _ in pool.map(render_invoice_in_worker, tasks, chunksize=INVOICE_BATCH_CHUNK):
+                    count += 1
+                    if progress: progress(count)
+            except BaseException:
+                pool.shutdown(cancel_futures=True) # Cancelled or failed: drop the queued invoices
+                raise
+    seconds = time.perf_counter() - start
+    return {"invoices": count, "seconds": seconds, "per_second": count / seconds if seconds else 0}
+
+def batch_invoices():
+    """Creates invoices for every bill in a date range that matches the current search / type filter."""
+    today = datetime.date.today()
+    start_date = simpledialog.askstring("Batch Invoices", "From date (YYYY-MM-DD):", initialvalue=today.replace(day=1).strftime('%Y-%m-%d'))
+    if not start_date: return
+    end_date = simpledialog.askstring("Batch Invoices", "To date (YYYY-MM-DD):", initialvalue=today.strftime('%Y-%m-%d'))
+    if not end_date: return
+    try:
+        datetime.datetime.strptime(start_date, '%Y-%m-%d')
+        datetime.datetime.strptime(end_date, '%Y-%m-%d')
+    except ValueError:
+        messagebox.showerror("Error", "Invalid date format. Please use YYYY-MM-DD.")
+        return
+    text = filter_entry.get().strip() if filter_entry else ""
+    bill_type = type_filter.get() if type_filter else "All"
+    selected = query_invoice_bills(start_date, end_date, bill_type, text)
+    if not selected:
+        messagebox.showwarning("No Data", "No bills match that date range and filter."); return
+    combined = messagebox.askyesnocancel("Batch Invoices", f"{len(selected)} bills found.\n\n"
+                                         "Yes: one combined PDF\nNo: one PDF file per bill")
+    if combined is None: return
+    if combined:
+        out_path = filedialog.asksaveasfilename(defaultextension=".pdf", filetypes=[("PDF Files", "*.pdf")],
+                                                initialfile=f"Invoices_{start_date}_to_{end_date}.pdf", title="Save Combined Invoices")
+    else:
+        out_path = filedialog.askdirectory(title="Folder for Invoice PDFs")
+    if not out_path: return
+
+    def batch_done(result):
+        set_status(f"Created {result['invoices']} invoices in {result['seconds']:.1f}s ({result['per_second']:.1f}/s)")
+        messagebox.showinfo("Invoices Created", f"✅ Created {result['invoices']} invoices in {os.path.basename(out_path)}")
+    run_job("Creating invoices",
+            lambda job: render_invoice_batch(selected, out_path, dict(business_profile), combined,
+                                             progress=lambda n: job.progress(n, len(selected))),
+            on_done=batch_done)
+
+def run_invoice_benchmark(count=200, workers=INVOICE_BATCH_WORKERS):
+    """Times invoice generation for synthetic bills: one renderer per invoice (the old path), a reused
+    renderer, the process pool and a combined PDF. Prints and returns invoices/second for each."""
+    sample = [{"id": i, "bill_no": i, "type": "Sale", "customer": f"Customer {i % 50}", "mode": "Cash",
+               "date": "2025-03-31", "grand_total": 0,
+               "items": [{"name": f"Product {(i + j) % 300}", "qty": j + 1, "price": 10.0 + j, "total": (j + 1) * (10.0 + j)}
+                         for j in range(8)]} for i in range(1, count + 1)]
+    out_dir = tempfile.mkdtemp(prefix="invoice_bench_")
+    results = {}
+    try:
+        def timed(name, func):
+            start = time.perf_counter()
+            func()
+            seconds = time.perf_counter() - start
+            results[name] = {"invoices": count, "seconds": seconds, "per_second": count / seconds}
+            print(f"{name:<18} {count:>6} invoices in {seconds:7.2f}s  {count / seconds:8.1f} invoices/s")
+        def uncached(b):
+            global invoice_fonts
+            invoice_fonts = None # Re-register the TTFs for every invoice, as create_invoice_pdf used to
+            InvoiceRenderer(business_profile).render(b, os.path.join(out_dir, invoice_file_name(b)))
+        timed("uncached", lambda: [uncached(b) for b in sample])
+        renderer = InvoiceRenderer(business_profile)
+        timed("cached renderer", lambda: [renderer.render(b, os.path.join(out_dir, invoice_file_name(b))) for b in sample])
+        timed("process pool", lambda: render_invoice_batch(sample, out_dir, business_profile, workers=workers))
+        timed("combined pdf", lambda: render_invoice_batch(sample, os.path.join(out_dir, "combined.pdf"), business_profile, combined=True))
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    return results
 
 
 def show_ledger():
@@ -1033,8 +3498,8 @@ def show_ledger():
     name = customer_entry.get().strip()
     if not name:
         messagebox.showerror("Input required", "Enter Customer/Supplier name to view ledger."); return
-    total_sales = sum(b.get("grand_total", 0) for b in bills if b["customer"].lower() == name.lower() and b["type"] == "Sale")
-    total_purchases = sum(b.get("grand_total", 0) for b in bills if b["customer"].lower() == name.lower() and b["type"] == "Purchase")
+    totals = get_bill_totals(customer=name)
+    total_sales, total_purchases = totals["Sale"], totals["Purchase"]
     balance = total_sales - total_purchases
     messagebox.showinfo("Ledger Summary",
                         f"Name: {name}\n\nTotal Sales: {format_currency(total_sales)}\n"
@@ -1043,43 +3508,66 @@ def show_ledger():
 
 # --- NEW: Renamed to export_bills_excel ---
 def export_bills_excel():
-    if not bills:
+    bill_count = count_bills_db()
+    if not bill_count:
         messagebox.showwarning("No Data", "No bills to export."); return
     fpath = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Files", "*.xlsx")],
                                          initialfile="bills_data.xlsx", title="Export bills to Excel")
     if not fpath: return
-    wb = Workbook(); ws = wb.active; ws.title = "Bills"
-    headers = ["S.No", "BillNo", "Date", "Type", "Customer", "Items (name x qty)", "QtyTotal", "PriceSummary", "Mode", "Grand Total"]
-    ws.append(headers)
-    for cell in ws[1]: cell.font = Font(bold=True); cell.alignment = Alignment(horizontal="center")
-        
-    for idx, b in enumerate(bills, start=1):
-        items_text = "; ".join(f"{it['name']} x{it['qty']}" for it in b.get("items", []))
-        qty_total = sum(it.get("qty", 0) for it in b.get("items", []))
-        price_summary = "; ".join(format_currency(it['price']) for it in b.get("items", []))
-        ws.append([
-            idx, b["bill_no"], b.get('date', ''), b["type"], b.get("customer", ""), items_text, qty_total, price_summary, b.get("mode", ""), b.get("grand_total", 0)
-        ])
+    run_job("Exporting bills", lambda job: write_bills_excel(fpath, progress=lambda n: job.progress(n, bill_count)),
+            on_done=lambda n: export_finished(f"{n} bills", fpath))
 
-    auto_size_excel_columns(ws)
+def write_bills_excel(fpath, progress=None):
+    """Writes every bill to an .xlsx; returns the number of bills."""
+    headers = ["S.No", "BillNo", "Date", "Type", "Customer", "Items (name x qty)", "QtyTotal", "PriceSummary", "Mode", "Grand Total"]
+    return write_excel_stream(fpath, "Bills", headers, iter_bill_export_rows(), progress=progress)
+
+def export_finished(what, fpath):
+    set_status(f"Exported {what} to {os.path.basename(fpath)}")
+    messagebox.showinfo("Exported", f"✅ Exported {what} to {os.path.basename(fpath)}")
+
+# --- Streaming Excel writer (write-only workbook, widths tracked while writing) ---
+def write_excel_stream(fpath, title, headers, rows, max_rows=EXCEL_MAX_ROWS, progress=None):
+    """Streams rows into an .xlsx and returns how many were written; progress(rows_so_far) is called per row.
+
+    A write-only sheet needs its column widths before its first row, so each sheet buffers
+    its first EXCEL_WIDTH_SAMPLE_ROWS rows to size them; widths seen on earlier sheets carry
+    over. A full sheet continues on "<title> (2)", "<title> (3)", ...
+    """
+    wb = Workbook(write_only=True)
+    widths = [len(str(h)) for h in headers]
+    def track(row):
+        for col, value in enumerate(row):
+            if value is not None and len(str(value)) > widths[col]:
+                widths[col] = len(str(value))
     
+    rows = iter(rows)
+    per_sheet = max_rows - 1 # Header takes one row
+    total = sheet_no = 0
+    while True:
+        sample = list(islice(rows, min(EXCEL_WIDTH_SAMPLE_ROWS, per_sheet)))
+        if not sample and sheet_no: break
+        sheet_no += 1
+        ws = wb.create_sheet(title if sheet_no == 1 else f"{title} ({sheet_no})")
+        for row in sample: track(row)
+        for col, width in enumerate(widths, start=1):
+            ws.column_dimensions[get_column_letter(col)].width = min(width + 2, 60)
+        header_cells = []
+        for h in headers:
+            cell = WriteOnlyCell(ws, value=h); cell.font = Font(bold=True); cell.alignment = Alignment(horizontal="center")
+            header_cells.append(cell)
+        ws.append(header_cells)
+        written = 0
+        for row in sample:
+            ws.append(row); written += 1
+            if progress: progress(total + written)
+        for row in islice(rows, per_sheet - written):
+            track(row); ws.append(row); written += 1
+            if progress: progress(total + written)
+        total += written
+        if written < per_sheet: break
     wb.save(fpath)
-    set_status(f"Exported {len(bills)} bills to {os.path.basename(fpath)}")
-    messagebox.showinfo("Exported", f"✅ Exported {len(bills)} bills to {os.path.basename(fpath)}")
-
-# --- NEW: Helper function to auto-size columns in Excel ---
-def auto_size_excel_columns(ws):
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter # Get the column letter
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2)
-        ws.column_dimensions[column].width = min(adjusted_width, 60)
+    return total
 
 # --- NEW: Export Inventory ---
 def export_inventory_excel():
@@ -1089,22 +3577,19 @@ def export_inventory_excel():
                                         initialfile="inventory_data.xlsx", title="Export Inventory to Excel")
     if not fpath: return
     
-    wb = Workbook(); ws = wb.active; ws.title = "Inventory"
-    headers = ["S.No", "Product Name", "Category", "Stock", "Reorder Lvl", "Cost Price", "Sale Price"]
-    ws.append(headers)
-    for cell in ws[1]: cell.font = Font(bold=True); cell.alignment = Alignment(horizontal="center")
+    item_count = len(inventory)
+    run_job("Exporting inventory", lambda job: write_inventory_excel(fpath, progress=lambda n: job.progress(n, item_count)),
+            on_done=lambda n: export_finished(f"{n} inventory items", fpath))
 
-    sorted_items = sorted(list(inventory.values()), key=lambda x: x["name"])
-    for idx, item in enumerate(sorted_items, start=1):
-        ws.append([
-            idx, item["name"], item.get("category", "N/A"), item.get("stock", 0),
-            item.get("reorder_level", 0), item.get("cost_price", 0), item.get("sale_price", 0)
-        ])
-    
-    auto_size_excel_columns(ws)
-    wb.save(fpath)
-    set_status(f"Exported {len(sorted_items)} inventory items")
-    messagebox.showinfo("Exported", f"✅ Exported {len(sorted_items)} inventory items to {os.path.basename(fpath)}")
+def write_inventory_excel(fpath, progress=None):
+    """Writes the product list to an .xlsx; returns the number of products."""
+    headers = ["S.No", "Product Name", "Category", "Stock", "Reorder Lvl", "Cost Price", "Sale Price"]
+    cursor = db_connect().execute("""
+    SELECT name, category, stock, reorder_level, cost_price, sale_price FROM inventory ORDER BY name
+    """)
+    rows = ([idx, item["name"], item["category"] or "N/A", item["stock"] or 0, item["reorder_level"] or 0,
+             item["cost_price"] or 0, item["sale_price"] or 0] for idx, item in enumerate(cursor, start=1))
+    return write_excel_stream(fpath, "Inventory", headers, rows, progress=progress)
 
 # --- NEW: Export Report ---
 def export_report_excel():
@@ -1114,19 +3599,11 @@ def export_report_excel():
                                          initialfile="sales_report.xlsx", title="Export Report to Excel")
     if not fpath: return
 
-    wb = Workbook(); ws = wb.active; ws.title = "Sales Report"
     headers = ["Item Name", "Units Sold", "Total Revenue", "Total Cost", "Total Profit"]
-    ws.append(headers)
-    for cell in ws[1]: cell.font = Font(bold=True); cell.alignment = Alignment(horizontal="center")
-
-    for item_id in report_tree.get_children():
-        values = report_tree.item(item_id)['values']
-        ws.append(values)
-    
-    auto_size_excel_columns(ws)
-    wb.save(fpath)
-    set_status("Exported sales report")
-    messagebox.showinfo("Exported", f"✅ Exported sales report to {os.path.basename(fpath)}")
+    rows = [report_tree.item(item_id)['values'] for item_id in report_tree.get_children()] # Read Tk on this thread
+    run_job("Exporting sales report",
+            lambda job: write_excel_stream(fpath, "Sales Report", headers, rows, progress=lambda n: job.progress(n, len(rows))),
+            on_done=lambda _: export_finished("sales report", fpath))
 
 # --- NEW: Export Customers ---
 def export_customers_excel():
@@ -1136,24 +3613,90 @@ def export_customers_excel():
                                          initialfile="customer_list.xlsx", title="Export Customers to Excel")
     if not fpath: return
 
-    wb = Workbook(); ws = wb.active; ws.title = "Customers"
     headers = ["Customer Name", "Total Bills", "Total Spent"]
-    ws.append(headers)
-    for cell in ws[1]: cell.font = Font(bold=True); cell.alignment = Alignment(horizontal="center")
+    rows = [customer_tree.item(item_id)['values'] for item_id in customer_tree.get_children()] # Read Tk on this thread
+    run_job("Exporting customer list",
+            lambda job: write_excel_stream(fpath, "Customers", headers, rows, progress=lambda n: job.progress(n, len(rows))),
+            on_done=lambda _: export_finished("customer list", fpath))
 
-    for item_id in customer_tree.get_children():
-        values = customer_tree.item(item_id)['values']
-        ws.append(values)
-    
-    auto_size_excel_columns(ws)
-    wb.save(fpath)
-    set_status("Exported customer list")
-    messagebox.showinfo("Exported", f"✅ Exported customer list to {os.path.basename(fpath)}")
 
+# --- Bulk import (runs as a background job, memory and tables refreshed once at the end) ---
+def import_file(kind):
+    """Asks for a CSV/xlsx file and imports it as "products" or "purchases"."""
+    fpath = filedialog.askopenfilename(filetypes=[("CSV or Excel", "*.csv *.xlsx"), ("All Files", "*.*")],
+                                       title=f"Import {kind.title()}")
+    if not fpath: return
+    importer = import_products if kind == "products" else import_purchases
+    run_job(f"Importing {kind}", lambda job: importer(fpath, progress=lambda n: job.progress(n)),
+            on_done=lambda result: import_finished(kind, result))
+
+def import_finished(kind, result):
+    load_data() # Reload inventory, the bill window, search index and totals in one pass
+    inventory_view["built"] = False
+    refresh_inventory_table()
+    refresh_table(filter_entry.get() if filter_entry else "", type_filter.get() if type_filter else "All")
+    summary = f"Imported {result['imported']} {'products' if kind == 'products' else 'purchase lines'}"
+    if "bills" in result: summary += f" into {result['bills']} bills"
+    summary += f" in {result['seconds']:.1f}s"
+    set_status(summary)
+    if result["rejected"]:
+        messagebox.showwarning("Import Finished", f"{summary}.\n\n{result['rejected']} rows were rejected; "
+                               f"see {os.path.basename(result['reject_file'])} next to the imported file.")
+    else:
+        messagebox.showinfo("Import Finished", f"✅ {summary}.")
+
+def archive_old_years():
+    """Moves every closed financial year into its own archive file (background job)."""
+    years = closed_financial_years()
+    if not years:
+        messagebox.showinfo("Archive Old Years", "No closed financial year has bills left to archive."); return
+    labels = ", ".join(financial_year_range(year)[2] for year in years)
+    if not messagebox.askyesno("Archive Old Years", f"Move the bills of FY {labels} into archive files?\n\n"
+                               "Archived bills stay searchable and in every report, but can no longer be edited or deleted."):
+        return
+    run_job("Archiving old years", lambda job: archive_closed_years(progress=job.progress), on_done=archive_finished)
+
+def archive_finished(done):
+    load_data() # The bill window, search index and totals no longer hold the archived bills
+    refresh_table(filter_entry.get() if filter_entry else "", type_filter.get() if type_filter else "All")
+    summary = ", ".join(f"FY {row['fy']}: {row['bills']:,} bills" for row in done)
+    set_status(f"Archived {summary}")
+    messagebox.showinfo("Archive Old Years", f"✅ Archived {summary}.")
+
+def backup_now(scheduled=False):
+    """Takes a backup as a background job; billing carries on while it copies."""
+    if any(job.title == "Backing up" for job in active_jobs.values()):
+        if not scheduled: messagebox.showinfo("Backup", "A backup is already running.")
+        return
+    run_job("Backing up", lambda job: backup_database(progress=job.progress),
+            on_done=lambda result: backup_finished(result, scheduled))
+
+def backup_finished(result, scheduled=False):
+    summary = (f"Backed up {result['bytes'] / 1e6:.1f} MB to {os.path.basename(result['folder'])} "
+               f"in {result['copy_seconds'] + result['verify_seconds']:.1f}s (integrity check passed)")
+    set_status(summary, timeout=6000)
+    if not scheduled:
+        messagebox.showinfo("Backup", f"✅ {summary}.\n\nFolder: {result['folder']}")
+
+def check_backup_schedule():
+    """Tk timer: starts a backup once the newest one is older than BACKUP_INTERVAL_HOURS."""
+    root.after(BACKUP_CHECK_MS, check_backup_schedule)
+    if backup_due(): backup_now(scheduled=True)
 
 # --- SEARCH / FILTER ---
+search_after_id = None # Pending debounced search
+
 def on_search_change(*_): 
-    if filter_entry and type_filter: refresh_table(filter_entry.get(), type_filter.get())
+    """Debounced: filters once typing pauses for SEARCH_DEBOUNCE_MS."""
+    global search_after_id
+    if not (filter_entry and type_filter and root): return
+    if search_after_id is not None:
+        root.after_cancel(search_after_id)
+    def run_search():
+        global search_after_id
+        search_after_id = None
+        refresh_table(filter_entry.get(), type_filter.get())
+    search_after_id = root.after(SEARCH_DEBOUNCE_MS, run_search)
 def on_filter_change(*_): 
     if filter_entry and type_filter: refresh_table(filter_entry.get(), type_filter.get())
 
@@ -1162,7 +3705,7 @@ def on_filter_change(*_):
 # ----------------------------------------------------------------------
 
 # --- UI: New Custom Dialog for Add/Edit Product ---
-class ProductEditDialog(tk.Toplevel):
+class ProductEditDialog(tk.Toplevel if tk else object): # object: headless, never instantiated
     def __init__(self, parent, product_data=None):
         super().__init__(parent)
         self.transient(parent); self.grab_set()
@@ -1219,21 +3762,44 @@ class ProductEditDialog(tk.Toplevel):
             data['sale_price'] = float(self.entries["Sale Price"].get() or 0)
             data['reorder_level'] = int(self.entries["Reorder Level"].get() or 5)
             
+            data['stock'] = self.product_data['stock'] if self.is_edit_mode else int(self.entries["Initial Stock"].get() or 0)
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid input for numeric field: {e}", parent=self); return
+        try:
             if self.is_edit_mode:
-                data['stock'] = self.product_data['stock']
-                success = edit_product_db(self.product_data['name_key'], data)
+                edit_product_db(self.product_data['name_key'], data)
             else:
-                data['stock'] = int(self.entries["Initial Stock"].get() or 0)
-                success = add_new_product_db(data)
-            if success: self.destroy()
-        except ValueError as e:
-            messagebox.showerror("Error", f"Invalid input for numeric field: {e}", parent=self)
+                add_new_product_db(data)
+        except ValueError as e: # The name is taken
+            messagebox.showwarning("Exists", str(e), parent=self); return
+        except sqlite3.Error as e:
+            messagebox.showerror("Database Error", f"Failed to {'update' if self.is_edit_mode else 'add'} product: {e}", parent=self); return
         except Exception as e:
-            messagebox.showerror("Error", f"An error occurred: {e}", parent=self)
+            messagebox.showerror("Error", f"An error occurred: {e}", parent=self); return
+        self.destroy()
+
+def inventory_row(idx, item):
+    """Returns (values, tags) for one inventory Treeview row."""
+    tag = "even" if idx % 2 == 0 else "odd"
+    stock = item.get("stock", 0); reorder_lvl = item.get("reorder_level", 0)
+    stock_color_tag = "low_stock" if stock <= reorder_lvl else "ok_stock"
+    return (idx, item["name"], item.get("category", "N/A"), stock, reorder_lvl,
+            format_currency(item.get("cost_price", 0)),
+            format_currency(item.get("sale_price", 0))), (tag, stock_color_tag)
+
+def refresh_inventory_table(low_stock_only=None, changed_keys=None):
+    """Updates the inventory Treeview UI, with optional low-stock filter.
 
-def refresh_inventory_table(low_stock_only=False):
-    """Updates the inventory Treeview UI, with optional low-stock filter."""
+    With changed_keys only those products' rows are updated, inserted, moved or removed;
+    otherwise the table is rebuilt. low_stock_only=None keeps the current filter.
+    """
     if not inventory_tree: return
+    if low_stock_only is None:
+        low_stock_only = inventory_view["low_stock_only"]
+    if changed_keys is not None and inventory_view["built"] and low_stock_only == inventory_view["low_stock_only"]:
+        update_inventory_rows(changed_keys)
+        return
+    
     for i in inventory_tree.get_children():
         inventory_tree.delete(i)
     
@@ -1242,17 +3808,47 @@ def refresh_inventory_table(low_stock_only=False):
         items_to_display = [item for item in inventory.values() if item['stock'] <= item['reorder_level']]
     else:
         items_to_display = list(inventory.values())
-    sorted_items = sorted(items_to_display, key=lambda x: x["name"])
+    sorted_items = sorted(items_to_display, key=lambda x: (x["name"], x["name_key"]))
     
+    inventory_view.update(built=True, low_stock_only=low_stock_only, order=[], rows={})
     for idx, item in enumerate(sorted_items, start=1):
-        tag = "even" if idx % 2 == 0 else "odd"
-        stock = item.get("stock", 0); reorder_lvl = item.get("reorder_level", 0)
-        stock_color_tag = "low_stock" if stock <= reorder_lvl else "ok_stock"
-        inventory_tree.insert("", tk.END, values=(
-            idx, item["name"], item.get("category", "N/A"), stock, reorder_lvl,
-            format_currency(item.get("cost_price", 0)),
-            format_currency(item.get("sale_price", 0))
-        ), tags=(tag, stock_color_tag), iid=item['name_key'])
+        values, tags = inventory_row(idx, item)
+        inventory_tree.insert("", tk.END, values=values, tags=tags, iid=item['name_key'])
+        inventory_view["order"].append((item["name"], item["name_key"]))
+        inventory_view["rows"][item["name_key"]] = (values, tags)
+
+def update_inventory_rows(changed_keys):
+    """Applies changed products to the inventory table, touching only rows whose content or position changed."""
+    order, rows = inventory_view["order"], inventory_view["rows"]
+    first_moved = None # Rows from here on may need a new S.No / stripe
+    for key in set(changed_keys):
+        item = inventory.get(key)
+        show = item is not None and (not inventory_view["low_stock_only"] or item['stock'] <= item['reorder_level'])
+        if key in rows:
+            old_pos = bisect_left(order, (rows[key][0][1], key))
+            if show and item["name"] == rows[key][0][1]:
+                values, tags = inventory_row(old_pos + 1, item)
+                if (values, tags) != rows[key]:
+                    inventory_tree.item(key, values=values, tags=tags)
+                    rows[key] = (values, tags)
+                continue
+            del order[old_pos]; del rows[key]
+            inventory_tree.delete(key)
+            first_moved = old_pos if first_moved is None else min(first_moved, old_pos)
+        if show:
+            pos = bisect_left(order, (item["name"], key))
+            order.insert(pos, (item["name"], key))
+            values, tags = inventory_row(pos + 1, item)
+            inventory_tree.insert("", pos, values=values, tags=tags, iid=key)
+            rows[key] = (values, tags)
+            first_moved = pos if first_moved is None else min(first_moved, pos)
+    if first_moved is None: return
+    for idx in range(first_moved, len(order)):
+        key = order[idx][1]
+        values, tags = inventory_row(idx + 1, inventory[key])
+        if (values, tags) != rows[key]:
+            inventory_tree.item(key, values=values, tags=tags)
+            rows[key] = (values, tags)
 
 def add_new_product():
     ProductEditDialog(root)
@@ -1285,6 +3881,8 @@ def quick_adjust_stock():
                                             initialvalue=current_stock, minvalue=0, parent=root)
         if new_stock is None: return
         adjust_product_stock_db(item_key, new_stock)
+    except sqlite3.Error as e:
+        messagebox.showerror("Database Error", f"Failed to adjust stock: {e}")
     except Exception as e:
         messagebox.showerror("Error", f"Invalid stock amount: {e}")
 
@@ -1295,10 +3893,17 @@ def delete_selected_product():
     if not sel:
         messagebox.showwarning("Select", "Select a product to delete."); return
     item_key = sel
-    if item_key in inventory:
+    if item_key not in inventory:
+        messagebox.showerror("Error", "Could not find product data."); return
+    item_name = inventory[item_key]['name']
+    if product_in_bills(item_key):
+        if not messagebox.askyesno("Confirm Delete", f"Product '{item_name}' is present in past bills.\n\nDeleting it may affect historical data if you regenerate reports (though profit reports should be fine).\n\nAre you sure you want to permanently delete this product?"):
+            return
+    try:
         delete_product_db(item_key)
-    else:
-        messagebox.showerror("Error", "Could not find product data.")
+    except sqlite3.Error as e:
+        messagebox.showerror("Database Error", f"Failed to delete product: {e}"); return
+    messagebox.showinfo("Deleted", f"Product '{item_name}' has been deleted.")
 
 # ----------------------------------------------------------------------
 # ------------------- PART 4: UI CONSTRUCTION --------------------------
@@ -1318,7 +3923,7 @@ def show_frame(frame_name):
         refresh_table(filter_entry.get() if filter_entry else "", type_filter.get() if type_filter else "All")
         update_billing_summary()
     elif frame_name == "inventory":
-        refresh_inventory_table()
+        if not inventory_view["built"]: refresh_inventory_table() # Kept current by targeted updates
     elif frame_name == "reports":
         run_sales_report() # Run with default dates
     elif frame_name == "customers":
@@ -1466,6 +4071,10 @@ def create_billing_ui(parent, style):
     tk.Label(left, text="", bg=CARD).pack(pady=4)
     # --- NEW: Renamed export function ---
     make_btn(left, "📤 Export All (Excel)", export_bills_excel, ACCENT, style)
+    make_btn(left, "🧾 Batch Invoices (PDF)", batch_invoices, PROFIT, style)
+    make_btn(left, "📥 Import Purchases (CSV/Excel)", lambda: import_file("purchases"), "#374151", style)
+    make_btn(left, "🗄️ Archive Old Years", archive_old_years, "#6B7280", style)
+    make_btn(left, "💾 Backup Now", backup_now, SUCCESS, style)
 
     # --- Right Panel (Table) ---
     right = ttk.Frame(content, style="Card.TFrame")
@@ -1491,12 +4100,19 @@ def create_billing_ui(parent, style):
         tree.heading(col, text=col); tree.column(col, width=w, anchor=a)
         
     tree.tag_configure("odd", background=ROW_ODD); tree.tag_configure("even", background=ROW_EVEN)
-    vsb = ttk.Scrollbar(table_container, orient="vertical", command=tree.yview)
+    # Virtual scrolling: the scrollbar drives bill_table["offset"], not the Treeview's own yview
+    vsb = ttk.Scrollbar(table_container, orient="vertical", command=on_bill_scrollbar)
     hsb = ttk.Scrollbar(table_container, orient="horizontal", command=tree.xview)
-    tree.configure(yscroll=vsb.set, xscroll=hsb.set)
+    tree.configure(xscroll=hsb.set)
+    bill_table["vsb"] = vsb
     vsb.pack(side="right", fill="y"); hsb.pack(side="bottom", fill="x")
     tree.pack(fill="both", expand=True)
     tree.bind("<<TreeviewSelect>>", on_row_select)
+    for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+        tree.bind(seq, on_bill_mousewheel)
+    for seq in ("<Up>", "<Down>", "<Prior>", "<Next>"):
+        tree.bind(seq, on_bill_key)
+    tree.bind("<Configure>", on_bill_table_resize)
     
     return billing_frame
 
@@ -1524,6 +4140,7 @@ def create_inventory_ui(parent, style):
     make_btn(btn_frame2, "📋 Show All Stock", lambda: refresh_inventory_table(low_stock_only=False), "#6B7280", style)
     # --- NEW: Export Button ---
     make_btn(btn_frame2, "📤 Export (Excel)", export_inventory_excel, SUCCESS, style)
+    make_btn(btn_frame2, "📥 Import Products", lambda: import_file("products"), PROFIT, style)
 
     table_container = ttk.Frame(content); table_container.pack(fill="both", expand=True, pady=(12,0))
     columns = ("S.No", "Product Name", "Category", "Stock", "Reorder Lvl", "Cost Price", "Sale Price")
@@ -1624,25 +4241,7 @@ def run_sales_report():
     for i in report_tree.get_children():
         report_tree.delete(i)
         
-    conn = db_connect()
-    cursor = conn.cursor()
-    cursor.execute("""
-    SELECT 
-        name, 
-        SUM(qty) as TotalUnits,
-        SUM(total) as TotalRevenue,
-        SUM(cost_price * qty) as TotalCost,
-        SUM(total) - SUM(cost_price * qty) as TotalProfit
-    FROM bill_items
-    WHERE bill_id IN (
-        SELECT id FROM bills WHERE type = 'Sale' AND date BETWEEN ? AND ?
-    )
-    GROUP BY name
-    ORDER BY TotalProfit DESC
-    """, (start_date, end_date))
-    
-    rows = cursor.fetchall()
-    conn.close()
+    rows = query_sales_report(start_date, end_date)
     
     total_profit_summary = 0
     total_revenue_summary = 0
@@ -1670,6 +4269,23 @@ def run_sales_report():
     
     set_status(f"Report generated for {start_date} to {end_date}")
 
+def query_sales_report(start_date, end_date):
+    """Per-item units, revenue, cost and profit for start_date..end_date, most profitable first."""
+    cursor = db_connect().cursor()
+    cursor.execute("""
+    SELECT 
+        name, 
+        SUM(units) as TotalUnits,
+        SUM(revenue) as TotalRevenue,
+        SUM(cost) as TotalCost,
+        SUM(revenue) - SUM(cost) as TotalProfit
+    FROM daily_item_sales
+    WHERE day BETWEEN ? AND ?
+    GROUP BY name
+    ORDER BY TotalProfit DESC
+    """, (start_date, end_date))
+    return cursor.fetchall()
+
 # --- NEW: Customers Tab ---
 def create_customers_ui(parent, style):
     """Creates the new Customers UI."""
@@ -1712,22 +4328,7 @@ def refresh_customer_list():
     for i in customer_tree.get_children():
         customer_tree.delete(i)
         
-    conn = db_connect()
-    cursor = conn.cursor()
-    # Query for customers from Sales only
-    cursor.execute("""
-    SELECT 
-        customer, 
-        COUNT(id) as TotalBills,
-        SUM(grand_total) as TotalSpent
-    FROM bills
-    WHERE type = 'Sale'
-    GROUP BY customer
-    ORDER BY TotalSpent DESC
-    """)
-    
-    rows = cursor.fetchall()
-    conn.close()
+    rows = query_customer_list()
     
     for idx, row in enumerate(rows):
         tag = "even" if idx % 2 == 0 else "odd"
@@ -1739,6 +4340,26 @@ def refresh_customer_list():
     
     set_status(f"Loaded {len(rows)} customers")
 
+def query_customer_list():
+    """Sale customers with their bill count and total spent, biggest spenders first (archived years included)."""
+    cursor = db_connect().cursor()
+    customers = {}
+    for schema in bill_sources():
+        # Query for customers from Sales only
+        cursor.execute(f"""
+        SELECT 
+            customer, 
+            COUNT(id) as TotalBills,
+            SUM(grand_total) as TotalSpent
+        FROM {schema}.bills
+        WHERE type = 'Sale'
+        GROUP BY customer
+        """)
+        for row in cursor:
+            entry = customers.setdefault(row['customer'], {"customer": row['customer'], "TotalBills": 0, "TotalSpent": 0})
+            entry["TotalBills"] += row['TotalBills']; entry["TotalSpent"] += row['TotalSpent'] or 0
+    return sorted(customers.values(), key=lambda entry: entry["TotalSpent"], reverse=True)
+
 # --- UI: Helper functions for creating widgets ---
 def labeled_entry(parent, label):
     tk.Label(parent, text=label, bg=CARD, fg="#374151").pack(anchor="w", pady=(8,2))
@@ -1770,7 +4391,7 @@ def make_btn(parent, text, cmd, bg, style, fg="white"):
 # ----------------------------------------------------------------------
 
 def main():
-    global root, status_lbl, frames
+    global root, status_lbl, cancel_jobs_btn, frames
     
     init_db()
     
@@ -1806,13 +4427,519 @@ def main():
     status_frame.pack(fill="x", padx=20, pady=(8,12))
     status_lbl = tk.Label(status_frame, text="Loading...", bg=BG, fg="#475569")
     status_lbl.pack(side="left")
+    cancel_jobs_btn = ttk.Button(status_frame, text="✖ Cancel", command=cancel_jobs) # Packed while jobs run
+    root.protocol("WM_DELETE_WINDOW", on_app_close)
 
-    load_data()
+    load_stats = load_data()
+    root.after(CHANGE_POLL_MS, poll_db_changes)
+    root.after(BACKUP_CHECK_MS, check_backup_schedule)
     
     show_frame("dashboard")
     
-    set_status("Welcome — Business Manager ready", timeout=2500)
+    set_status(f"Welcome — Business Manager ready ({load_stats['bills']} bills, "
+               f"{load_stats['items']} items loaded in {load_stats['seconds']:.2f}s)", timeout=2500)
     root.mainloop()
 
+# --- Local POS service (HTTP/JSON over the DB functions; stdlib only) ---
+# Requests are handled on one thread per connection. Reads use that thread's own connection (WAL lets
+# them run while a write is in progress); every write is handed to the single pos_writer thread, so
+# bills are posted one at a time against one in-memory inventory, exactly like the desktop app does.
+# Before each write the writer applies stock and profile changes other instances committed (see
+# sync_db_changes), so sales are checked against current stock.
+pos_writer = None        # ThreadPoolExecutor(max_workers=1) while the service runs
+pos_invoice_lock = threading.Lock() # reportlab layouts are not shared between threads
+
+def bill_json(bill):
+    """A bill (record or dict) as plain JSON-ready data."""
+    data = {k: bill[k] for k in ("id", "bill_no", "type", "customer", "mode", "grand_total", "date")}
+    data["items"] = [{k: it[k] for k in ("name", "qty", "price", "total", "cost_price")} for it in bill["items"]]
+    return data
+
+def fetch_bill_or_404(bill_id):
+    """Reads one bill straight from the database (the LRU cache belongs to the writer)."""
+    fetched = fetch_bills_db("WHERE id = ?", (bill_id,))
+    if not fetched: raise LookupError(f"Bill {bill_id} not found")
+    return fetched[0]
+
+def pos_add_bill(raw):
+    """Writer thread: posts one bill; returns it as saved."""
+    posted, rejected = post_bills([raw], check_stock=not raw.get("allow_negative_stock"))
+    if rejected: raise ValueError(rejected[0][1])
+    return bill_json(fetch_bill_or_404(posted[0]))
+
+def pos_edit_bill(bill_id, raw):
+    """Writer thread: replaces a bill's customer, mode, type and items; fields left out are kept."""
+    original = fetch_bill_or_404(bill_id)
+    merged = bill_json(original)
+    merged.update({k: v for k, v in raw.items() if k in ("type", "customer", "mode", "items", "bill_no")})
+    if "bill_no" not in raw and merged["type"] != original["type"]:
+        merged["bill_no"] = None # Numbered in the new type's sequence
+    new_bill = normalize_posted_bill(merged)
+    if new_bill["type"] == "Sale" and not raw.get("allow_negative_stock"):
+        deltas = stock_deltas_for_bill(original, action="remove")
+        stock_deltas_for_bill(new_bill, action="add", deltas=deltas)
+        for key, (name, delta) in deltas.items():
+            if delta < 0 and get_stock(name) + delta < 0:
+                raise ValueError(f"Not enough stock for '{name}': need {-delta}, available {get_stock(name)}")
+    conn = db_connect()
+    try:
+        deltas = update_bill_rows(conn.cursor(), original, new_bill)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    apply_stock_deltas(deltas)
+    return bill_json(fetch_bill_or_404(bill_id))
+
+def pos_delete_bill(bill_id):
+    """Writer thread: deletes a bill and puts its stock back."""
+    bill = fetch_bill_or_404(bill_id)
+    conn = db_connect()
+    try:
+        deltas = delete_bill_rows(conn.cursor(), bill)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    apply_stock_deltas(deltas)
+    return {"deleted": bill_id}
+
+def pos_write(func, *args):
+    """Runs a write on the writer thread and waits for its result (exceptions are re-raised here)."""
+    def write():
+        sync_db_changes(reload_bills=False) # The service keeps no bill window
+        return func(*args)
+    return pos_writer.submit(write).result()
+
+class PosRequestHandler(BaseHTTPRequestHandler):
+    """Routes:
+        GET    /health                      service and database status
+        GET    /stock                       all products;   GET /stock/<name>  one product
+        GET    /stock?q=text                products whose name or category contains text
+        GET    /bills?q=text[&type=Sale|Purchase][&limit=N]   newest bills matching text
+        POST   /bills                       new bill (same JSON as post-bills); 201 with the saved bill
+        GET    /bills/<id>                  one bill;       GET /bills/<id>/invoice  its invoice PDF
+        PUT    /bills/<id>                  edit a bill;    DELETE /bills/<id>
+        GET    /report?from=YYYY-MM-DD&to=YYYY-MM-DD   item-wise sales report
+        GET    /customers                   customer list
+    Errors come back as {"error": "..."} with 400 (bad input / not enough stock), 404, 409 (duplicate
+    bill number) or 500.
+    """
+    protocol_version = "HTTP/1.1" # Keep-alive: tills and the load test reuse their connection
+    server_version = "BillingPOS/1.0"
+    disable_nagle_algorithm = True # Headers and body are separate writes; don't wait on delayed ACKs
+
+    def do_GET(self): self.dispatch("GET")
+    def do_POST(self): self.dispatch("POST")
+    def do_PUT(self): self.dispatch("PUT")
+    def do_DELETE(self): self.dispatch("DELETE")
+
+    def log_request(self, code="-", size="-"):
+        if isinstance(code, int) and code >= 400: # Successful requests are not logged (too many)
+            super().log_request(code, size)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > POS_MAX_BODY: raise ValueError("Request body too large")
+        data = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(data, dict): raise ValueError("Expected a JSON object")
+        return data
+
+    def send(self, status, body, content_type="application/json"):
+        if content_type == "application/json":
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def dispatch(self, method):
+        url = urlparse(self.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            result = self.route(method, parts, query)
+        except LookupError as e:
+            result = 404, {"error": str(e)}
+        except sqlite3.IntegrityError as e:
+            result = 409, {"error": str(e)}
+        except (ValueError, TypeError, AttributeError) as e:
+            result = 400, {"error": str(e)}
+        except Exception as e:
+            self.log_error("%s %s failed: %r", method, self.path, e)
+            result = 500, {"error": str(e)}
+        self.send(*result)
+
+    def route(self, method, parts, query):
+        resource = parts[0] if parts else ""
+        if method == "GET" and parts == ["health"]:
+            count = db_connect().execute("SELECT COUNT(*) FROM bills").fetchone()[0]
+            return 200, {"status": "ok", "database": DATABASE_FILE, "bills": count}
+        if method == "GET" and resource == "stock" and len(parts) <= 2:
+            cursor = db_connect().cursor()
+            if len(parts) == 1 and query.get("q"):
+                return 200, search_products(query["q"], int(query.get("limit", 50)))
+            if len(parts) == 1:
+                cursor.execute("SELECT * FROM inventory ORDER BY name COLLATE NOCASE")
+                return 200, [dict(row) for row in cursor.fetchall()]
+            row = cursor.execute("SELECT * FROM inventory WHERE name_key = ?", (parts[1].lower(),)).fetchone()
+            if row is None: raise LookupError(f"Product '{parts[1]}' not found")
+            return 200, dict(row)
+        if method == "GET" and parts == ["report"]:
+            if "from" not in query or "to" not in query: raise ValueError("from and to are required")
+            start, end = import_date(query["from"]), import_date(query["to"])
+            rows = [dict(row) for row in query_sales_report(start, end)]
+            totals = {k: sum(r[k] for r in rows) for k in ("TotalUnits", "TotalRevenue", "TotalCost", "TotalProfit")}
+            return 200, {"from": start, "to": end, "items": rows, "totals": totals}
+        if method == "GET" and parts == ["customers"]:
+            return 200, [dict(row) for row in query_customer_list()]
+        if resource == "bills":
+            if len(parts) == 1 and method == "GET":
+                if not query.get("q"): raise ValueError("q (search text) is required")
+                found = search_bills_db(query["q"], query.get("type", "All"), int(query.get("limit", 50)))
+                return 200, [bill_json(bill) for bill in reversed(found)]
+            if len(parts) == 1 and method == "POST":
+                return 201, pos_write(pos_add_bill, self.read_json())
+            if len(parts) in (2, 3):
+                try: bill_id = int(parts[1])
+                except ValueError: raise LookupError(f"Bill {parts[1]!r} not found") from None
+                if len(parts) == 3 and parts[2] == "invoice" and method == "GET":
+                    bill = fetch_bill_or_404(bill_id)
+                    pdf = io.BytesIO()
+                    with pos_invoice_lock:
+                        InvoiceRenderer.shared(business_profile).render(bill, pdf)
+                    return 200, pdf.getvalue(), "application/pdf"
+                if len(parts) == 2 and method == "GET":
+                    return 200, bill_json(fetch_bill_or_404(bill_id))
+                if len(parts) == 2 and method == "PUT":
+                    return 200, pos_write(pos_edit_bill, bill_id, self.read_json())
+                if len(parts) == 2 and method == "DELETE":
+                    return 200, pos_write(pos_delete_bill, bill_id)
+        raise LookupError(f"No route for {method} {self.path}")
+
+def serve_pos(host=POS_HOST, port=POS_PORT):
+    """Runs the POS service until interrupted (Ctrl+C)."""
+    global pos_writer
+    init_db()
+    load_business_profile()
+    load_inventory()
+    pos_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pos-writer")
+    pos_writer.submit(mark_changes_seen).result() # data_version is per connection: the writer's own
+    server = ThreadingHTTPServer((host, port), PosRequestHandler)
+    server.daemon_threads = True
+    print(f"POS service on http://{host}:{server.server_port}/ using {DATABASE_FILE} (Ctrl+C to stop)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pos_writer.shutdown(wait=True) # Let a write in progress commit
+        pos_writer = None
+
+def latency_summary(samples):
+    """Request count and p50/p90/p99/max latency in milliseconds."""
+    ordered = sorted(samples)
+    if not ordered: return {"count": 0}
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+    return {"count": len(ordered), "p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99),
+            "max_ms": round(ordered[-1] * 1000, 2)}
+
+def run_pos_load_test(url, concurrency=8, total_requests=2000, write_ratio=0.2, seed=1):
+    """Drives a running POS service with a mixed till workload and reports throughput and latency.
+
+    Each worker keeps one keep-alive connection. Reads are stock lookups, bill fetches and a today's
+    report; writes post one-item sales (every fifth write deletes a sale the worker posted earlier).
+    A purchase first stocks a dedicated product, so the sales never run out. Returns the results dict.
+    """
+    target = urlparse(url)
+    host, port = target.hostname or POS_HOST, target.port or POS_PORT
+
+    def call(conn, method, path, body=None):
+        payload = json.dumps(body).encode("utf-8") if body is not None else None
+        conn.request(method, path, body=payload, headers={"Content-Type": "application/json"} if payload else {})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, data
+
+    product = f"Load Test Item {os.getpid()}-{int(time.time())}"
+    product_path = "/stock/" + quote(product)
+    today = datetime.date.today().isoformat()
+    setup = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        status, data = call(setup, "POST", "/bills", {"type": "Purchase", "customer": "Load Test Supplier",
+                                                      "items": [{"name": product, "qty": total_requests, "price": 10}]})
+    except OSError as e:
+        raise RuntimeError(f"POS service not reachable at {url}: {e}") from None
+    if status != 201: raise RuntimeError(f"Setup purchase failed ({status}): {data[:200]!r}")
+    seed_bill = json.loads(data)["id"]
+    setup.close()
+
+    tickets = iter(range(total_requests)) # Shared work queue: each worker takes the next request number
+    latencies = {} # {kind: [seconds]}
+    errors = []
+    lock = threading.Lock()
+
+    def worker(worker_no):
+        rng = random.Random(seed * 1000 + worker_no)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        my_sales, writes, local = [], 0, {}
+        while next(tickets, None) is not None:
+            if rng.random() < write_ratio:
+                writes += 1
+                if writes % 5 == 0 and my_sales:
+                    kind, method, path, body = "delete bill", "DELETE", f"/bills/{my_sales.pop()}", None
+                else:
+                    kind, method, path, body = "post sale", "POST", "/bills", {
+                        "type": "Sale", "customer": f"Walk-in {rng.randint(1, 50)}",
+                        "items": [{"name": product, "qty": 1, "price": 12}]}
+            else:
+                pick = rng.random()
+                if pick < 0.6: kind, path = "stock lookup", product_path
+                elif pick < 0.9: kind, path = "get bill", f"/bills/{my_sales[-1] if my_sales else seed_bill}"
+                else: kind, path = "report", f"/report?from={today}&to={today}"
+                method, body = "GET", None
+            started = time.perf_counter()
+            try:
+                status, data = call(conn, method, path, body)
+            except (OSError, http.client.HTTPException) as e:
+                status, data = None, str(e).encode()
+                conn.close(); conn = http.client.HTTPConnection(host, port, timeout=30)
+            local.setdefault(kind, []).append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                with lock: errors.append(f"{method} {path}: {status} {data[:120]!r}")
+            elif kind == "post sale":
+                my_sales.append(json.loads(data)["id"])
+        conn.close()
+        with lock:
+            for kind, samples in local.items(): latencies.setdefault(kind, []).extend(samples)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+
+    all_samples = [x for samples in latencies.values() for x in samples]
+    results = {"url": url, "concurrency": concurrency, "write_ratio": write_ratio, "requests": len(all_samples),
+               "errors": len(errors), "seconds": round(elapsed, 3),
+               "requests_per_second": round(len(all_samples) / elapsed, 1) if elapsed else None,
+               "latency": latency_summary(all_samples),
+               "by_kind": {kind: latency_summary(samples) for kind, samples in sorted(latencies.items())}}
+    print(f"{results['requests']} requests in {elapsed:.2f}s with {concurrency} connections: "
+          f"{results['requests_per_second']} req/s, {len(errors)} errors")
+    print(f"{'':<14} {'count':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, summary in [("all", results["latency"])] + list(results["by_kind"].items()):
+        print(f"{kind:<14} {summary['count']:>7} {summary['p50_ms']:>9} {summary['p90_ms']:>9} "
+              f"{summary['p99_ms']:>9} {summary['max_ms']:>9}")
+    for line in errors[:5]: print("  " + line)
+    return results
+
+# --- Command line (headless: no Tk window is created) ---
+def cli(argv=None):
+    """Back-office jobs from the command line; with no command the desktop app starts.
+
+    Returns the process exit code (1 if any bill was rejected).
+    """
+    global DATABASE_FILE
+    parser = argparse.ArgumentParser(description="Business Transaction Manager")
+    parser.add_argument("--db", default=DATABASE_FILE, help=f"SQLite database file (default: {DATABASE_FILE})")
+    commands = parser.add_subparsers(dest="command")
+    post = commands.add_parser("post-bills", help="post bills from a JSON file (a list, or {\"bills\": [...]})")
+    post.add_argument("file", help="JSON file, or - for stdin")
+    post.add_argument("--no-stock-check", action="store_true", help="allow sales beyond the available stock")
+    report = commands.add_parser("report", help="item-wise sales report for a date range")
+    report.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD")
+    report.add_argument("--to", dest="end", required=True, help="YYYY-MM-DD")
+    report.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    export = commands.add_parser("export", help="export bills or inventory to Excel")
+    export.add_argument("what", choices=["bills", "inventory"])
+    export.add_argument("out", help=".xlsx file to write")
+    invoices = commands.add_parser("invoices", help="render invoice PDFs for bills in a date range")
+    invoices.add_argument("--from", dest="start", required=True, help="YYYY-MM-DD")
+    invoices.add_argument("--to", dest="end", required=True, help="YYYY-MM-DD")
+    invoices.add_argument("--type", default="All", choices=["All", "Sale", "Purchase"])
+    invoices.add_argument("--search", default="", help="only bills matching this bill no / customer / item text")
+    target = invoices.add_mutually_exclusive_group(required=True)
+    target.add_argument("--out-dir", help="write one PDF per bill into this folder")
+    target.add_argument("--combined", help="write all invoices into this single PDF")
+    invoices.add_argument("--workers", type=int, default=INVOICE_BATCH_WORKERS, help="processes for --out-dir")
+    commands.add_parser("rebuild-rollup", help="rebuild the daily_item_sales rollup from the bills")
+    commands.add_parser("rebuild-search", help="rebuild the full-text search index (bills, archives, products)")
+    search = commands.add_parser("search", help="find bills (or products) by bill no, customer or any item name")
+    search.add_argument("text")
+    search.add_argument("--type", default="All", choices=["All", "Sale", "Purchase"])
+    search.add_argument("--products", action="store_true", help="search product names and categories instead")
+    search.add_argument("--limit", type=int, default=20)
+    search.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    stock_on = commands.add_parser("stock-on", help="stock at the end of a past day, from the stock ledger")
+    stock_on.add_argument("date", help="YYYY-MM-DD")
+    stock_on.add_argument("--product", help="one product instead of all")
+    stock_on.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    archive = commands.add_parser("archive", help="move closed financial years into per-year archive files")
+    archive.add_argument("--list", action="store_true", help="only list the existing archives")
+    backup = commands.add_parser("backup", help="take a verified online backup and rotate old ones")
+    backup.add_argument("--keep", type=int, default=BACKUP_KEEP, help="finished backups to keep")
+    backup.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP, help="pages copied per step (-1 = all at once)")
+    backup.add_argument("--pause", type=float, default=BACKUP_STEP_SLEEP, help="seconds between steps")
+    backup.add_argument("--list", action="store_true", help="only list the existing backups")
+    backup.add_argument("--verify", metavar="FOLDER", help="only run the integrity check on this backup folder")
+    bench_backup = commands.add_parser("bench-backup", help="measure backup throughput and the write latency it adds (on a copy of --db)")
+    bench_backup.add_argument("--seconds", type=float, default=3.0, help="length of each measured phase")
+    bench_backup.add_argument("--out", help="also write the results to this JSON file")
+    commands.add_parser("bench-memory", help="compare dict vs slotted record memory")
+    bench_invoices = commands.add_parser("bench-invoices", help="time invoice generation")
+    bench_invoices.add_argument("--count", type=int, default=200)
+    generate = commands.add_parser("generate-data", help="fill a new database (--db) with synthetic data")
+    generate.add_argument("--products", type=int, default=5000)
+    generate.add_argument("--customers", type=int, default=2000)
+    generate.add_argument("--bills", type=int, default=100_000)
+    generate.add_argument("--items-per-bill", type=float, default=4, help="average line items per bill")
+    generate.add_argument("--days", type=int, default=730, help="history length, ending today")
+    generate.add_argument("--seed", type=int, default=42)
+    stress = commands.add_parser("stress-bills", help="post bills from several processes at once and check the numbering")
+    stress.add_argument("--processes", type=int, default=4)
+    stress.add_argument("--bills", type=int, default=250, help="bills per process")
+    stress.add_argument("--use-db", action="store_true", help="run against --db instead of a scratch database")
+    self_check = commands.add_parser("self-check", help="add/edit/delete bills, adjust and import stock, and check the dashboard totals and the stock ledger")
+    self_check.add_argument("--rounds", type=int, default=300)
+    self_check.add_argument("--seed", type=int, default=1)
+    self_check.add_argument("--use-db", action="store_true", help="run against --db instead of a scratch database")
+    bench = commands.add_parser("bench", help="time the app's heavy operations on a copy of --db")
+    bench.add_argument("--out", default="benchmark_results.json", help="JSON file for the results")
+    bench.add_argument("--repeat", type=int, default=3)
+    serve = commands.add_parser("serve", help="run the local POS service (HTTP/JSON)")
+    serve.add_argument("--host", default=POS_HOST)
+    serve.add_argument("--port", type=int, default=POS_PORT)
+    load_test = commands.add_parser("load-test", help="drive a running POS service and report req/s and latency")
+    load_test.add_argument("--url", default=f"http://{POS_HOST}:{POS_PORT}/")
+    load_test.add_argument("--concurrency", type=int, default=8, help="parallel connections")
+    load_test.add_argument("--requests", type=int, default=2000)
+    load_test.add_argument("--write-ratio", type=float, default=0.2, help="share of requests that post/delete bills")
+    load_test.add_argument("--out", help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        main(); return 0
+    DATABASE_FILE = args.db
+    start = time.perf_counter()
+    exit_code = 0
+    if args.command in ("bench-memory", "bench-invoices"):
+        if args.command == "bench-memory": run_memory_benchmark()
+        else: run_invoice_benchmark(args.count)
+        return 0
+    if args.command == "generate-data":
+        counts = generate_synthetic_data(args.db, args.products, args.customers, args.bills, args.items_per_bill,
+                                         args.days, args.seed)
+        print("Generated " + ", ".join(f"{n:,} {what}" for what, n in counts.items()) + f" in {args.db}")
+        print(f"{args.command} finished in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+        return 0
+    if args.command == "bench":
+        run_benchmark_suite(args.db, args.out, args.repeat)
+        print(f"Results written to {args.out}")
+        return 0
+    if args.command == "serve":
+        serve_pos(args.host, args.port)
+        return 0
+    if args.command == "bench-backup":
+        run_backup_benchmark(args.db, args.seconds, args.out)
+        return 0
+    if args.command == "backup" and (args.list or args.verify):
+        for folder in [args.verify] if args.verify else list_backups():
+            problems = verify_backup(folder) if args.verify else []
+            size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+            print(f"{folder}  {size / 1e6:.1f} MB" + (f"  {'OK' if not problems else 'DAMAGED'}" if args.verify else ""))
+            for line in problems[:20]: print("  " + line)
+            if problems: exit_code = 1
+        return exit_code
+    if args.command == "load-test":
+        results = run_pos_load_test(args.url, args.concurrency, args.requests, args.write_ratio)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f: json.dump(results, f, indent=2)
+        return 1 if results["errors"] else 0
+    if args.command == "stress-bills":
+        result = run_bill_number_stress(args.processes, args.bills, args.db if args.use_db else None)
+        return 0 if result["ok"] else 1
+    if args.command == "self-check":
+        result = run_totals_self_check(args.rounds, args.seed, args.db if args.use_db else None)
+        return 0 if result["ok"] else 1
+    init_db()
+    if args.command == "post-bills":
+        load_data()
+        with (sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")) as f:
+            data = json.load(f)
+        bill_list = data["bills"] if isinstance(data, dict) else data
+        posted, rejected = post_bills(bill_list, check_stock=not args.no_stock_check)
+        for index, reason in rejected:
+            print(f"Rejected bill #{index + 1}: {reason}", file=sys.stderr)
+        print(f"Posted {len(posted)} bills, rejected {len(rejected)}")
+        exit_code = 1 if rejected else 0
+    elif args.command == "report":
+        rows = [dict(row) for row in query_sales_report(args.start, args.end)]
+        if args.json:
+            print(json.dumps(rows, indent=2))
+        else:
+            print(f"{'Item Name':<30} {'Units':>8} {'Revenue':>16} {'Cost':>16} {'Profit':>16}")
+            for row in rows:
+                print(f"{row['name'][:30]:<30} {row['TotalUnits']:>8} {format_currency(row['TotalRevenue']):>16} "
+                      f"{format_currency(row['TotalCost']):>16} {format_currency(row['TotalProfit']):>16}")
+            print(f"{'--- TOTAL ---':<30} {sum(r['TotalUnits'] for r in rows):>8} "
+                  f"{format_currency(sum(r['TotalRevenue'] for r in rows)):>16} "
+                  f"{format_currency(sum(r['TotalCost'] for r in rows)):>16} "
+                  f"{format_currency(sum(r['TotalProfit'] for r in rows)):>16}")
+    elif args.command == "export":
+        count = write_bills_excel(args.out) if args.what == "bills" else write_inventory_excel(args.out)
+        print(f"Exported {count} {'bills' if args.what == 'bills' else 'inventory items'} to {args.out}")
+    elif args.command == "invoices":
+        load_business_profile()
+        selected = query_invoice_bills(args.start, args.end, args.type, args.search)
+        combined = args.combined is not None
+        result = render_invoice_batch(selected, args.combined if combined else args.out_dir, business_profile,
+                                      combined=combined, workers=args.workers)
+        print(f"Created {result['invoices']} invoices ({result['per_second']:.1f}/s)")
+    elif args.command == "rebuild-rollup":
+        print(f"daily_item_sales rebuilt: {rebuild_daily_item_sales()} rows")
+    elif args.command == "rebuild-search":
+        print(f"Search index rebuilt: {rebuild_search_index()} bills")
+    elif args.command == "search":
+        found = (search_products(args.text, args.limit) if args.products
+                 else [bill_json(bill) for bill in reversed(search_bills_db(args.text, args.type, args.limit))])
+        if args.json:
+            print(json.dumps(found, indent=2))
+        elif args.products:
+            for row in found:
+                print(f"{row['name'][:40]:<40} {(row['category'] or ''):<16} {row['stock']:>8}")
+        else:
+            for bill in found:
+                print(f"{bill['id']:>8} {bill['type']:<9} #{bill['bill_no']:<7} {bill['date']} {(bill['customer'] or '')[:24]:<24} "
+                      f"{first_item_display(bill, args.text.lower())[:36]:<36} {format_currency(bill['grand_total']):>16}")
+    elif args.command == "archive":
+        if not args.list:
+            for row in archive_closed_years():
+                print(f"Archived FY {row['fy']}: {row['bills']:,} bills")
+        for row in db_connect().execute("SELECT * FROM bill_archives ORDER BY start_day"):
+            print(f"{row['fy']:<8} {row['start_day']}..{row['end_day']}  {row['bills']:>8,} bills {row['items']:>9,} items  "
+                  f"{row['file']}")
+    elif args.command == "backup":
+        result = backup_database(args.pages, args.pause, args.keep)
+        print(f"Backed up {result['bytes'] / 1e6:.1f} MB to {result['folder']} in {result['copy_seconds']:.2f}s "
+              f"({result['mb_per_second']:.1f} MB/s, {result['steps']} steps), integrity check {result['verify_seconds']:.2f}s")
+        for folder in result["removed"]: print(f"Removed old backup {folder}")
+    elif args.command == "stock-on":
+        day = import_date(args.date)
+        stock = {args.product.lower(): stock_on_date(day, args.product)} if args.product else stock_on_date(day)
+        if args.json:
+            print(json.dumps(stock, indent=2))
+        else:
+            for key, qty in sorted(stock.items()):
+                print(f"{key[:40]:<40} {qty:>8}")
+    print(f"{args.command} finished in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return exit_code
+
 if __name__ == "__main__":
-    main()
+    try:
+        sys.exit(cli())
+    except sqlite3.Error as e: # e.g. a locked or damaged database; the desktop app shows these itself
+        print(f"Database error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,60 @@
+import importlib.util
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+APP_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "BILLING AND INVENTORY MANAGEMENT SYSTEM.PY.py")
+
+def load_app():
+    spec = importlib.util.spec_from_file_location("billing_app", APP_FILE)
+    app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(app)
+    return app
+
+
+class FakeCursor:
+    """A cursor on a SQLite build with FTS5 but without the trigram tokenizer (before 3.34)."""
+    def execute(self, sql, params=()):
+        if "trigram" in sql:
+            raise sqlite3.OperationalError("no such tokenizer: trigram")
+
+
+class SearchFallbackTest(unittest.TestCase):
+    def setUp(self):
+        self.app = load_app()
+        self.work_dir = tempfile.mkdtemp(prefix="billing_test_")
+        self.app.DATABASE_FILE = os.path.join(self.work_dir, "test.db")
+
+    def tearDown(self):
+        self.app.db_close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_probe_needs_trigram_tokenizer(self):
+        self.assertFalse(self.app.fts5_available(FakeCursor()))
+
+    def test_search_uses_like_without_trigram_tokenizer(self):
+        with mock.patch.object(self.app, "fts5_available", return_value=False):
+            self.app.init_db()
+        self.assertFalse(self.app.has_search_index("bill_search"))
+        self.assertFalse(self.app.has_search_index("product_search"))
+        self.app.post_bills([{"type": "Purchase", "customer": "Northwind Traders", "date": "2020-01-15",
+                              "items": [{"name": "Green Tea", "qty": 2, "price": 10}]}], check_stock=False)
+
+        statements = []
+        self.app.db_connect().set_trace_callback(statements.append)
+        bills = self.app.search_bills_db("northwind", before_day="9999")
+        products = self.app.search_products("green")
+        self.app.db_connect().set_trace_callback(None)
+
+        self.assertEqual([bill["customer"] for bill in bills], ["Northwind Traders"])
+        self.assertEqual([product["name"] for product in products], ["Green Tea"])
+        self.assertTrue(any("LIKE" in sql for sql in statements))
+        self.assertFalse(any("MATCH" in sql for sql in statements))
+
+
+if __name__ == "__main__":
+    unittest.main()